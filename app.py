@@ -1,183 +1,251 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, g, request, jsonify
+from flask.cli import AppGroup
 from flask_cors import CORS
-import psycopg2
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+import base64
+import click
+import codecs
+import csv
+import hashlib
+import io
+import json
+import math
 import os
-app = Flask(__name__)
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from auth import check_owner, check_parties, issue_token, require_auth, role_key
+from database import (DATABASE_READ_URL, READ_AFTER_WRITE, DatabaseUnavailable, close_db, dict_rows,
+                      get_cursor, get_db, get_tuple_cursor, iter_batches, note_write, pooled_connection,
+                      recently_wrote)
+from events import (SSE_HEARTBEAT, SSE_QUEUE_SIZE, publish_order_events, sse_message, start_listener,
+                    subscribe, unsubscribe)
+from json_provider import FreshCartJSONProvider
+from metrics import finish_request, render_metrics, start_request
+from migrations import check_indexes, migrate
+from seed import SEED_DEFAULTS, seed_database
+
+# Routes live on a blueprint and the app is built by create_app(). Nothing
+# here touches Postgres: the pool connects on the first request that needs
+# it, and schema changes run via `flask --app app freshcart migrate`.
+bp = Blueprint("freshcart", __name__)
+
+# Render terminates TLS in front of the app; trust that many proxies'
+# X-Forwarded-Proto/-For so request.is_secure reflects the client's scheme
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "1"))
+
+
+def create_app():
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.json = FreshCartJSONProvider(app)
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+    CORS(app, origins=[
+        "http://127.0.0.1:5500",
+        "http://localhost:5500",
+        "https://monikak2004.github.io"
+    ], supports_credentials=True)
+
+    # Each request checks a connection out of the pool on first use and
+    # hands it back in close_db(), so handlers never share a transaction.
+    app.teardown_appcontext(close_db)
+    app.register_blueprint(bp)
+    app.cli.add_command(freshcart_cli)
+
+    app.config["STARTUP_MS"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"✅ FreshCart app ready in {app.config['STARTUP_MS']} ms")
+    return app
+
+
+@bp.app_errorhandler(DatabaseUnavailable)
+def db_unavailable(e):
+    print("❌ DB connection failed:", e)
+    return jsonify({"error": "DB not connected on server", "details": str(e)}), 500
 
-CORS(app, origins=[
-    "http://127.0.0.1:5500",
-    "http://localhost:5500",
-    "https://monikak2004.github.io"
-], supports_credentials=True)
 
 # ==============================
-# Database Connection (Render Postgres)
+# CORS HEADERS
 # ==============================
-
-db = None
-cursor = None
-
-try:
-    DATABASE_URL = os.environ.get("DATABASE_URL")
-
-    db = psycopg2.connect(DATABASE_URL)
-    import psycopg2.extras
-    cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    print("✅ Connected to Render PostgreSQL")
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "https://monikak2004.github.io",
+    "Access-Control-Allow-Credentials": "true",
+    "Access-Control-Allow-Methods": "GET,POST,PUT,DELETE,OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type,Authorization,Idempotency-Key",
+}
 
 
+@bp.after_app_request
+def add_cors_headers(response):
+    response.headers.update(CORS_HEADERS)
+    return response
 
-except Exception as e:
-    print("❌ DB connection failed:", e)
-    cursor = None
-    
 
 # ==============================
-# Initialize DB schema
+# DEBUG DB
 # ==============================
-def init_db():
-    if cursor is None:
-        print("⚠️ Skipping DB init (no DB connection).")
-        return
-
+@bp.route('/debug/db')
+def debug_db():
+    cursor = get_cursor()
     try:
-        print("🔧 Initializing PostgreSQL database schema...")
-
-        # USERS
         cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Users (
-            user_id SERIAL PRIMARY KEY,
-            name VARCHAR(100) NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            role VARCHAR(20) NOT NULL,
-            contact_no VARCHAR(20),
-            address TEXT
-        )
-        """)
-
-        # CATEGORIES
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Categories (
-            category_id SERIAL PRIMARY KEY,
-            name VARCHAR(100) UNIQUE NOT NULL
-        )
-        """)
-
-        # PRODUCTS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Products (
-            product_id SERIAL PRIMARY KEY,
-            category_id INT REFERENCES Categories(category_id),
-            name VARCHAR(100) NOT NULL,
-            image_url TEXT
-        )
+        SELECT table_name 
+        FROM information_schema.tables 
+        WHERE table_schema='public'
         """)
 
-        # SUBPRODUCTS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS SubProducts (
-            subproduct_id SERIAL PRIMARY KEY,
-            product_id INT REFERENCES Products(product_id),
-            name VARCHAR(100) NOT NULL
-        )
-        """)
+        tables = cursor.fetchall()
+        return jsonify({"ok": True, "tables": tables}), 200
 
-        # PRODUCT VARIANTS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Product_Variants (
-            variant_id SERIAL PRIMARY KEY,
-            subproduct_id INT REFERENCES SubProducts(subproduct_id),
-            distributor_id INT REFERENCES Users(user_id),
-            brand VARCHAR(100),
-            unit VARCHAR(20),
-            price DECIMAL,
-            stock INT
-        )
-        """)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
 
-        # ORDERS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Orders (
-            order_id SERIAL PRIMARY KEY,
-            user_id INT REFERENCES Users(user_id),
-            status VARCHAR(50) DEFAULT 'Pending',
-            payment_status VARCHAR(50) DEFAULT 'Unpaid',
-            order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            total_amount DECIMAL
-        )
-        """)
 
-        # PAYMENTS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Payments (
-            payment_id SERIAL PRIMARY KEY,
-            order_id INT REFERENCES Orders(order_id),
-            amount DECIMAL,
-            status VARCHAR(50),
-            payment_method VARCHAR(50),
-            payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
+# ==============================
+# METRICS (/metrics, Prometheus text)
+# ==============================
+@bp.before_app_request
+def start_request_metrics():
+    start_request()
 
-        # ORDER ITEMS
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Order_Items (
-            order_item_id SERIAL PRIMARY KEY,
-            order_id INT REFERENCES Orders(order_id),
-            variant_id INT REFERENCES Product_Variants(variant_id),
-            quantity INT,
-            price DECIMAL
-        )
-        """)
 
-        db.commit()
-        print("✅ PostgreSQL schema initialized.")
+@bp.after_app_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    size = None if response.is_streamed else response.content_length
+    finish_request(route, request.method, response.status_code, size)
+    return response
 
-    except Exception as e:
-        db.rollback()
-        print("❌ DB schema error:", e)
 
+@bp.route('/metrics')
+def prometheus_metrics():
+    return current_app.response_class(render_metrics(), mimetype="text/plain; version=0.0.4")
 
-if cursor:
-   init_db()
 
 # ==============================
-# CORS HEADERS
+# READ REPLICA ROUTING
 # ==============================
-@app.after_request
-def add_cors_headers(response):
-    response.headers["Access-Control-Allow-Origin"] = "https://monikak2004.github.io"
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization"
+# With DATABASE_READ_URL set, routes marked @read_replica run their queries
+# on the replica (see database.py). A user reads from the primary for
+# READ_AFTER_WRITE seconds after a write that concerns them:
+# - writes are noted in this worker and set a short-lived cookie, which
+#   covers the next read landing on another worker;
+# - order events (events.py) note the other parties, e.g. the distributors
+#   of a freshly placed order, in every worker.
+# @read_replica goes under @require_auth, which sets g.user.
+WROTE_COOKIE = "fc_wrote"
+
+
+def read_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if DATABASE_READ_URL:
+            start_listener()
+            users = {kwargs.get("user_id"), kwargs.get("distributor_id")}
+            if g.get("user"):
+                users.add(g.user["id"])
+            g.use_replica = WROTE_COOKIE not in request.cookies and not recently_wrote(users - {None})
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.after_app_request
+def remember_writes(response):
+    if DATABASE_READ_URL and request.method in ("POST", "PUT", "DELETE") and response.status_code < 400:
+        if g.get("user"):
+            note_write([g.user["id"]])
+        # the cross-site frontend only sends the cookie back with SameSite=None,
+        # which browsers accept on Secure cookies only (HTTPS, see TRUSTED_PROXIES)
+        response.set_cookie(WROTE_COOKIE, "1", max_age=max(1, math.ceil(READ_AFTER_WRITE)), httponly=True,
+                            secure=request.is_secure, samesite="None" if request.is_secure else "Lax")
     return response
 
 
 # ==============================
-# DEBUG DB
+# PREPARED STATEMENTS
 # ==============================
-@app.route('/debug/db')
-def debug_db():
-    try:
-        if cursor is None:
-            return jsonify({"ok": False, "error": "DB not connected"}), 500
-        cursor.execute("""
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema='public'
-        """)
+# The hot read queries are listed by name in QUERIES (end of this file) and
+# run through run_query(), which PREPAREs each one once per pooled
+# connection and then EXECUTEs it by name, so Postgres skips parse/analyze
+# on every request. Filtered/paged variants of a template are prepared as
+# their own statements. DB_PREPARE=0 sends plain SQL instead (e.g. behind a
+# transaction-pooling pgbouncer, which does not keep prepared statements).
+DB_PREPARE = os.environ.get("DB_PREPARE", "1") != "0"
+_query_stats = {}
+_query_stats_lock = threading.Lock()
+
+
+def dollar_params(sql):
+    # psycopg2 %s placeholders -> $1, $2, ... for PREPARE (and asyncpg); an
+    # escaped %% (e.g. the pg_trgm <% operator) goes back to a single %
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%%|%s", lambda m: "%" if m.group() == "%%" else f"${next(counter)}", sql)
+
+
+def _record_query(statement, query, kind, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _query_stats_lock:
+        stats = _query_stats.get(statement)
+        if stats is None:
+            stats = _query_stats[statement] = {"statement": statement, "query": query,
+                                               "prepares": 0, "prepare_ms": 0.0,
+                                               "executes": 0, "execute_ms": 0.0}
+        stats[kind + "s"] += 1
+        stats[kind + "_ms"] += elapsed_ms
+
+
+def run_query(cursor, sql, params=(), template=None):
+    query = QUERY_NAMES[template or sql]
+    statement = query
+    if template is not None and sql != template:
+        statement = f"{query}_{hashlib.sha1(sql.encode()).hexdigest()[:10]}"
+
+    if not DB_PREPARE:
+        # parse + plan + execute, for comparison with the prepared numbers
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        _record_query(statement, query, "execute", started)
+        return
 
-        tables = cursor.fetchall()
-        return jsonify({"ok": True, "tables": tables}), 200
-
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+    conn = cursor.connection
+    if statement not in conn.prepared:
+        started = time.perf_counter()
+        cursor.execute(f"PREPARE {statement} AS {dollar_params(sql)}")
+        conn.prepared.add(statement)
+        _record_query(statement, query, "prepare", started)
+    started = time.perf_counter()
+    if params:
+        cursor.execute(f"EXECUTE {statement} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {statement}")
+    _record_query(statement, query, "execute", started)
+
+
+@bp.route('/debug/queries')
+def debug_queries():
+    # per-process numbers: each gunicorn worker keeps its own
+    with _query_stats_lock:
+        stats = [dict(s) for s in _query_stats.values()]
+    for s in stats:
+        s["prepare_ms"] = round(s["prepare_ms"], 3)
+        s["execute_ms"] = round(s["execute_ms"], 3)
+        s["avg_prepare_ms"] = round(s["prepare_ms"] / s["prepares"], 3) if s["prepares"] else None
+        s["avg_execute_ms"] = round(s["execute_ms"] / s["executes"], 3) if s["executes"] else None
+    stats.sort(key=lambda s: s["execute_ms"] + s["prepare_ms"], reverse=True)
+    return jsonify({"prepared": DB_PREPARE, "statements": stats}), 200
 
 # ==============================
 # 1️⃣ ROOT
 # ==============================
-@app.route('/')
+@bp.route('/')
 def home():
     return jsonify({"message": "FreshCart Flask Backend is running!"})
 
@@ -185,12 +253,11 @@ def home():
 # ==============================
 # 2️⃣ REGISTER
 # ==============================
-@app.route('/register', methods=['POST'])
+@bp.route('/register', methods=['POST'])
 def register():
+    db = get_db()
+    cursor = get_cursor()
     try:
-        if cursor is None:
-            return jsonify({"error": "DB not connected on server"}), 500
-
         data = request.json or {}
         name = data.get("name")
         email = data.get("email")
@@ -219,13 +286,10 @@ def register():
 # ==============================
 # 3️⃣ LOGIN
 # ==============================
-@app.route('/login', methods=['POST'])
+@bp.route('/login', methods=['POST'])
 def login():
+    cursor = get_cursor()
     try:
-        db.rollback()
-        if cursor is None:
-            return jsonify({"error": "DB not connected on server"}), 500
-
         data = request.json or {}
         email = data.get("email")
         password = data.get("password")
@@ -242,104 +306,833 @@ def login():
             "user_id": user["user_id"],
             "name": user["name"],
             "role": user["role"],
-            "token": f"fake-jwt-token-{user['user_id']}",
+            "token": issue_token(user["user_id"], user["role"]),
         }), 200
 
     except Exception as e:
         print("❌ /login error:", e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
+# ==============================
+# STREAMING RESPONSES
+# ==============================
+# ?stream=1 (JSON array) or ?stream=ndjson / Accept: application/x-ndjson
+# sends a list as it is read from a server-side cursor instead of building
+# the whole result and its JSON string in memory first. Memory per request
+# stays at about one batch of STREAM_ITERSIZE rows however long the list is.
+STREAM_ITERSIZE = int(os.environ.get("STREAM_ITERSIZE", "500"))
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def stream_format():
+    mode = (request.args.get("stream") or "").strip().lower()
+    if mode == "ndjson" or any(m == NDJSON_MIMETYPE for m, _ in request.accept_mimetypes):
+        return "ndjson"
+    if mode in ("1", "true", "yes", "json"):
+        return "json"
+    return None
+
+
+def stream_rows(sql, params, fmt):
+    batches = iter_batches(sql, params, STREAM_ITERSIZE, replica=g.get("use_replica", False))
+    # pull the first batch now, so a bad query still fails with a normal 500
+    first = next(batches, None)
+    dumps = current_app.json.dumps
+
+    def encode(rows):
+        if fmt == "ndjson":
+            return "".join(dumps(row, separators=(",", ":")) + "\n" for row in rows)
+        return ",".join(dumps(row, separators=(",", ":")) for row in rows)
+
+    def generate():
+        try:
+            if fmt == "json":
+                yield "["
+            if first:
+                yield encode(first)
+                for rows in batches:
+                    yield encode(rows) if fmt == "ndjson" else "," + encode(rows)
+            if fmt == "json":
+                yield "]"
+        except Exception as e:
+            # headers are already out; dropping the connection is the only
+            # way left to tell the client the body is incomplete
+            print("❌ stream error:", e)
+            raise
+        finally:
+            batches.close()
+
+    mimetype = NDJSON_MIMETYPE if fmt == "ndjson" else "application/json"
+    return current_app.response_class(generate(), mimetype=mimetype)
+
+
 # ==============================
 # 4️⃣ CATALOG
 # ==============================
-@app.route('/catalog', methods=['GET'])
+CATALOG_SQL = """
+    SELECT 
+        c.name AS category,
+        p.name AS product,
+        sp.subproduct_id,
+        sp.name AS subproduct,
+        v.variant_id,
+        v.brand,
+        v.price,
+        v.stock,
+        v.unit,
+        u.name AS distributor_name
+    FROM Product_Variants v
+    JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
+    JOIN Products p ON sp.product_id = p.product_id
+    JOIN Categories c ON p.category_id = c.category_id
+    JOIN Users u ON v.distributor_id = u.user_id
+    ORDER BY c.name, p.name, sp.name, v.brand
+"""
+
+# The serialized catalog is kept in memory and rebuilt only after a write
+# bumps the version. Other gunicorn workers don't see this process's bumps,
+# so entries also expire after CATALOG_CACHE_TTL seconds.
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "30"))
+_catalog_lock = threading.Lock()
+_catalog_build_lock = threading.Lock()
+_catalog_version = 0
+_catalog_cache = {"version": -1, "built_at": 0.0, "body": None, "etag": None}
+
+
+def bump_catalog_version():
+    global _catalog_version
+    with _catalog_lock:
+        _catalog_version += 1
+
+
+def _fresh_catalog():
+    with _catalog_lock:
+        entry = dict(_catalog_cache)
+        version = _catalog_version
+    if entry["version"] == version and time.monotonic() - entry["built_at"] < CATALOG_CACHE_TTL:
+        return entry, version
+    return None, version
+
+
+def cached_catalog():
+    entry, _ = _fresh_catalog()
+    if entry:
+        return entry["body"], entry["etag"]
+
+    # one thread rebuilds, the rest wait and reuse its result
+    with _catalog_build_lock:
+        entry, version = _fresh_catalog()
+        if entry:
+            return entry["body"], entry["etag"]
+
+        cursor = get_tuple_cursor()
+        run_query(cursor, CATALOG_SQL)
+        body = current_app.json.dumps(dict_rows(cursor, cursor.fetchall()), separators=(",", ":"))
+        return store_catalog(version, body)
+
+
+def store_catalog(version, body):
+    etag = hashlib.sha1(body.encode()).hexdigest()
+    with _catalog_lock:
+        # a write that landed mid-query leaves this entry stale on purpose
+        _catalog_cache.update(version=version, built_at=time.monotonic(), body=body, etag=etag)
+    return body, etag
+
+
+# Paged/filtered reads keep the storefront sort order and page by keyset on
+# it (variant_id breaks ties), so deep pages cost the same as the first one.
+CATALOG_PAGE_SQL = """
+    SELECT 
+        c.name AS category,
+        p.name AS product,
+        sp.subproduct_id,
+        sp.name AS subproduct,
+        v.variant_id,
+        v.distributor_id,
+        v.brand,
+        v.price,
+        v.stock,
+        v.unit,
+        u.name AS distributor_name
+    FROM Product_Variants v
+    JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
+    JOIN Products p ON sp.product_id = p.product_id
+    JOIN Categories c ON p.category_id = c.category_id
+    JOIN Users u ON v.distributor_id = u.user_id
+    WHERE {where}
+    ORDER BY c.name, p.name, sp.name, COALESCE(v.brand, ''), v.variant_id
+    LIMIT %s
+"""
+CATALOG_PAGE_ARGS = ("category", "product", "distributor_id", "in_stock",
+                     "min_price", "max_price", "limit", "cursor")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, types):
+    # types: the Python type of each value, as encode_cursor was given them
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, kind in zip(values, types):
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def page_limit(args):
+    raw = args.get("limit")
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _catalog_page_query(args):
+    where, params = ["TRUE"], []
+    if args.get("category"):
+        where.append("LOWER(c.name) = LOWER(%s)")
+        params.append(args["category"])
+    if args.get("product"):
+        where.append("LOWER(p.name) = LOWER(%s)")
+        params.append(args["product"])
+    if args.get("distributor_id"):
+        try:
+            params.append(int(args["distributor_id"]))
+        except ValueError:
+            raise ValueError("distributor_id must be an integer")
+        where.append("v.distributor_id = %s")
+    if args.get("in_stock"):
+        in_stock = args["in_stock"].strip().lower() in ("1", "true", "yes")
+        where.append("v.stock > 0" if in_stock else "COALESCE(v.stock, 0) <= 0")
+    for arg, op in (("min_price", ">="), ("max_price", "<=")):
+        if args.get(arg):
+            try:
+                params.append(Decimal(args[arg]))
+            except InvalidOperation:
+                raise ValueError(f"{arg} must be a number")
+            where.append(f"v.price {op} %s")
+    if args.get("cursor"):
+        where.append("(c.name, p.name, sp.name, COALESCE(v.brand, ''), v.variant_id) > (%s, %s, %s, %s, %s)")
+        params.extend(decode_cursor(args["cursor"], (str, str, str, str, int)))
+    return CATALOG_PAGE_SQL.format(where=" AND ".join(where)), params
+
+
+def catalog_page(args):
+    limit = page_limit(args)
+    sql, params = _catalog_page_query(args)
+    cursor = get_tuple_cursor()
+    # one extra row tells us whether there is a next page
+    run_query(cursor, sql, params + [limit + 1], template=CATALOG_PAGE_SQL)
+    return catalog_page_body(dict_rows(cursor, cursor.fetchall()), limit)
+
+
+def catalog_page_body(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last["category"], last["product"], last["subproduct"],
+                                     last["brand"] or "", last["variant_id"]])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+@bp.route('/catalog', methods=['GET'])
+@read_replica
 def get_catalog():
     try:
-        db.rollback()  # reset failed transaction
-        db.rollback() 
-
-        cursor.execute("""
-            SELECT 
-                c.name AS category,
-                p.name AS product,
-                sp.subproduct_id,
-                sp.name AS subproduct,
-                v.variant_id,
-                v.brand,
-                v.price,
-                v.stock,
-                v.unit,
-                u.name AS distributor_name
-            FROM Product_Variants v
-            JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
-            JOIN Products p ON sp.product_id = p.product_id
-            JOIN Categories c ON p.category_id = c.category_id
-            JOIN Users u ON v.distributor_id = u.user_id
-            ORDER BY c.name, p.name, sp.name, v.brand
-        """)
-        return jsonify(cursor.fetchall()), 200
+        # any filter or paging argument opts into the paged response; plain
+        # GET /catalog keeps returning the whole array for old clients
+        if any(arg in request.args for arg in CATALOG_PAGE_ARGS):
+            try:
+                return jsonify(catalog_page(request.args)), 200
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+        # streaming skips the cache: it is meant for clients that would
+        # rather not hold the whole catalog, and neither should we
+        fmt = stream_format()
+        if fmt:
+            return stream_rows(CATALOG_SQL, (), fmt)
+
+        # the cached copy serves every reader until the next write, so it is
+        # never built from a replica that may not have that write yet
+        g.use_replica = False
+        body, etag = cached_catalog()
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, mimetype="application/json")
+        # ETag is a content hash, so every worker agrees on it
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     except Exception as e:
         print("❌ /catalog error:", e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
 
+# ==============================
+# CATALOG SEARCH
+# ==============================
+# /catalog/search?q=&limit= matches the words of q as prefixes against each
+# variant's search_text (category, product, subproduct and brand names; see
+# migrations.CATALOG_SEARCH) through its GIN index and returns the best
+# ranked catalog rows. Where pg_trgm is installed, words that are only close
+# (typos) match too, through the trigram index, and similarity adds to the
+# rank.
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_MAX_WORDS = 8
+
+_SEARCH_ROWS = """
+    SELECT
+        c.name AS category,
+        p.name AS product,
+        sp.subproduct_id,
+        sp.name AS subproduct,
+        v.variant_id,
+        v.brand,
+        v.price,
+        v.stock,
+        v.unit,
+        u.name AS distributor_name
+    FROM ({matches}) m
+    JOIN Product_Variants v ON v.variant_id = m.variant_id
+    JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
+    JOIN Products p ON sp.product_id = p.product_id
+    JOIN Categories c ON p.category_id = c.category_id
+    JOIN Users u ON v.distributor_id = u.user_id
+    ORDER BY m.rank DESC, m.variant_id
+"""
+
+# params: tsquery, limit
+CATALOG_SEARCH_SQL = _SEARCH_ROWS.format(matches="""
+        SELECT variant_id, ts_rank(search_vector, q) AS rank
+        FROM Product_Variants, to_tsquery('simple', %s) q
+        WHERE search_vector @@ q
+        ORDER BY rank DESC, variant_id
+        LIMIT %s
+""")
+
+# params: text, tsquery, text, limit
+CATALOG_SEARCH_TRGM_SQL = _SEARCH_ROWS.format(matches="""
+        SELECT variant_id, ts_rank(search_vector, q) + word_similarity(%s, search_text) AS rank
+        FROM Product_Variants, to_tsquery('simple', %s) q
+        WHERE search_vector @@ q OR %s <%% search_text
+        ORDER BY rank DESC, variant_id
+        LIMIT %s
+""")
+
+_trigram_search = None
+
+
+def refresh_variant_search(cursor, variant_ids):
+    # call after inserting variants or changing their brand
+    if variant_ids:
+        cursor.execute("SELECT refresh_variant_search(%s::int[])", (list(variant_ids),))
+
+
+def trigram_search(cursor):
+    # checked once per process; restart workers after installing pg_trgm
+    global _trigram_search
+    if _trigram_search is None:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        _trigram_search = cursor.fetchone()[0]
+    return _trigram_search
+
+
+@bp.route('/catalog/search', methods=['GET'])
+@read_replica
+def search_catalog():
+    # one-letter words ("nature's" -> "s") would prefix-match nearly everything
+    words = [w for w in re.findall(r"\w+", (request.args.get("q") or "").lower()) if len(w) > 1]
+    if not words:
+        return jsonify({"error": "q must contain a word of at least 2 letters or digits"}), 400
+    text = " ".join(words[:SEARCH_MAX_WORDS])
+    try:
+        limit = min(int(request.args.get("limit", SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    tsquery = " & ".join(f"{word}:*" for word in text.split())
+    try:
+        cursor = get_tuple_cursor()
+        if trigram_search(cursor):
+            run_query(cursor, CATALOG_SEARCH_TRGM_SQL, (text, tsquery, text, limit))
+        else:
+            run_query(cursor, CATALOG_SEARCH_SQL, (tsquery, limit))
+        return jsonify({
+            "query": text,
+            "typo_tolerant": _trigram_search,
+            "items": dict_rows(cursor, cursor.fetchall()),
+        }), 200
+    except Exception as e:
+        print("❌ /catalog/search error:", e)
+        return jsonify({"error": "Server error", "details": str(e)}), 500
+
+
+# ==============================
+# ORDER SUMMARIES
+# ==============================
+# Order_Summaries / Distributor_Orders back the order list endpoints. They
+# are rebuilt per order (see migrations.ORDER_SUMMARIES) inside the same
+# transaction as every write that changes what those lists show.
+def refresh_order_summaries(cursor, order_ids):
+    if order_ids:
+        cursor.execute("SELECT refresh_order_summaries(%s::int[])", (list(order_ids),))
+
+
+# Distributor_Daily_Sales (see migrations.DISTRIBUTOR_DAILY_SALES) is kept the
+# same way: call this after changing an order's status.
+def record_order_sales(cursor, order_ids):
+    if order_ids:
+        cursor.execute("SELECT record_order_sales(%s::int[])", (list(order_ids),))
+
+
+# Who may act on an order: the distributors whose variants it holds and,
+# for shop_owner=True, the shop that placed it. Orders that don't exist are
+# left out, so the handlers still report them their own way.
+ORDER_PARTIES_SQL = """
+    SELECT order_id, user_id, distributor_ids
+    FROM Order_Summaries
+    WHERE order_id = ANY(%s)
+"""
+
+
+def order_parties(rows, shop_owner=False):
+    return {row["order_id"]: set(row["distributor_ids"]) | ({row["user_id"]} if shop_owner else set())
+            for row in rows}
+
+
+def fetch_order_parties(cursor, order_ids, shop_owner=False):
+    cursor.execute(ORDER_PARTIES_SQL, (list(order_ids),))
+    return order_parties(cursor.fetchall(), shop_owner)
+
+
+def check_order_access(cursor, order_id, shop_owner=False):
+    # None when g.user may act on the order; a 403 response otherwise
+    parties = fetch_order_parties(cursor, [order_id], shop_owner)
+    return check_parties(parties[order_id]) if order_id in parties else None
+
+
+def check_variant_owner(cursor, variant_id):
+    cursor.execute("SELECT distributor_id FROM Product_Variants WHERE variant_id=%s", (variant_id,))
+    row = cursor.fetchone()
+    return check_owner(row["distributor_id"]) if row else None
+
+
+# ==============================
+# HISTORY PAGING
+# ==============================
+# The order/payment lists take ?limit=&before=&from=&to=&status=. Pages are
+# keyed on (date, id) newest first, matching the (owner, date DESC, id DESC)
+# indexes on Order_Summaries, Distributor_Orders and Payment_History, so any
+# page costs one short index range scan. `before` is the opaque next_before
+# token from the previous page; from/to are ISO dates or timestamps (a bare
+# `to` date includes that whole day); status takes a comma-separated list.
+# With ?stream= the filters apply and the whole matching history is streamed.
+HISTORY_PAGE_ARGS = ("limit", "before", "from", "to", "status")
+
+
+def _parse_when(value, arg, end_of_day=False):
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{arg} must be an ISO date or timestamp")
+    if end_of_day and len(value) == 10:
+        when += timedelta(days=1)
+    return when
+
+
+def _history_filters(columns, args):
+    date_col, _, status_col = columns
+    filters, params = [], []
+    if args.get("from"):
+        filters.append(f"{date_col} >= %s")
+        params.append(_parse_when(args["from"], "from"))
+    if args.get("to"):
+        to = args["to"]
+        filters.append(f"{date_col} {'<' if len(to) == 10 else '<='} %s")
+        params.append(_parse_when(to, "to", end_of_day=True))
+    if args.get("status"):
+        # stored names ("Out for Delivery"); payment states are one word
+        statuses = [ORDER_STATUSES.get(s.strip().lower(), s.strip().capitalize())
+                    for s in args["status"].split(",") if s.strip()]
+        filters.append(f"{status_col} = ANY(%s)")
+        params.append(statuses)
+    return filters, params
+
+
+def history_page(template, columns, owner_params, args):
+    sql, params, limit = history_page_query(template, columns, owner_params, args)
+    cursor = get_tuple_cursor()
+    run_query(cursor, sql, params, template=template)
+    return history_page_body(dict_rows(cursor, cursor.fetchall()), columns, limit)
+
+
+def history_page_query(template, columns, owner_params, args):
+    date_col, id_col, _ = columns
+    limit = page_limit(args)
+    filters, params = _history_filters(columns, args)
+    params = list(owner_params) + params
+    if args.get("before"):
+        last_date, last_id = decode_cursor(args["before"], (str, int))
+        try:
+            params.extend([datetime.fromisoformat(last_date), last_id])
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        filters.append(f"({date_col}, {id_col}) < (%s, %s)")
+    sql = template.format(filters="".join(" AND " + f for f in filters)) + " LIMIT %s"
+    # one extra row tells us whether there is an older page
+    return sql, params + [limit + 1], limit
+
+
+def history_page_body(rows, columns, limit):
+    date_col, id_col, _ = columns
+    next_before = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        date_key, id_key = date_col.split(".")[-1], id_col.split(".")[-1]
+        next_before = encode_cursor([rows[-1][date_key].isoformat(), rows[-1][id_key]])
+    return {"items": rows, "next_before": next_before}
+
+
+def history_response(template, columns, owner_params):
+    fmt = stream_format()
+    if fmt:
+        try:
+            filters, params = _history_filters(columns, request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        sql = template.format(filters="".join(" AND " + f for f in filters))
+        return stream_rows(sql, list(owner_params) + params, fmt)
+    # plain GETs keep returning the whole list for old clients
+    if any(arg in request.args for arg in HISTORY_PAGE_ARGS):
+        try:
+            return jsonify(history_page(template, columns, owner_params, request.args)), 200
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    cursor = get_tuple_cursor()
+    run_query(cursor, template.format(filters=""), owner_params, template=template)
+    return jsonify(dict_rows(cursor, cursor.fetchall())), 200
+
+
+# ==============================
+# IDEMPOTENCY KEYS
+# ==============================
+# Clients retrying a write send the same Idempotency-Key header. The first
+# request reserves (user, path, key) in Idempotency_Keys (see
+# migrations.IDEMPOTENCY_KEYS) and stores its response; a retry gets that
+# response back from one primary key lookup and writes nothing. Reusing a key
+# with a different body is a 422, and a retry that arrives while the first
+# request is still running is a 409. 5xx responses are not stored, since the
+# handler rolled back and the write can safely be tried again.
+#
+# The handler's commit is held until its response is stored, so the write
+# and the response commit together. The request also holds a session
+# advisory lock on its key until then. A reservation nobody holds the lock
+# for was left by a request that died before committing anything, and the
+# next retry takes it over.
+# @idempotent goes under @require_auth, which sets g.user.
+IDEMPOTENCY_TTL = timedelta(hours=float(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24")))
+IDEMPOTENCY_KEY_MAX = 255
+
+IDEMPOTENCY_LOOKUP_SQL = """
+    SELECT request_hash, status, body
+    FROM Idempotency_Keys
+    WHERE user_id = %s AND path = %s AND idempotency_key = %s AND created_at > now() - %s::interval
+"""
+
+# an expired row for the same key is taken over, not a conflict
+IDEMPOTENCY_RESERVE_SQL = """
+    INSERT INTO Idempotency_Keys AS k (user_id, path, idempotency_key, request_hash)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, path, idempotency_key) DO UPDATE
+    SET request_hash = EXCLUDED.request_hash, status = NULL, body = NULL, created_at = now()
+    WHERE k.created_at <= now() - %s::interval
+"""
+
+IDEMPOTENCY_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtextextended(%s, 0))"
+IDEMPOTENCY_UNLOCK_SQL = "SELECT pg_advisory_unlock(hashtextextended(%s, 0))"
+
+
+def _stored_response(row, request_hash):
+    # what to answer for a row from IDEMPOTENCY_LOOKUP_SQL; None while it is
+    # only a reservation
+    stored_hash, status, body = row
+    if stored_hash != request_hash:
+        return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+    if status is None:
+        return None
+    response = current_app.response_class(body, status, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(*args, **kwargs)
+        if not key.strip() or len(key) > IDEMPOTENCY_KEY_MAX:
+            return jsonify({"error": f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX} characters"}), 400
+
+        db = get_db()
+        cursor = get_tuple_cursor()
+        # with AUTH_ENFORCE=0 and no token, keys share one anonymous scope
+        scope = (g.user["id"] if g.get("user") else 0, request.path, key)
+        lock_key = json.dumps(scope)
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        def lookup():
+            run_query(cursor, IDEMPOTENCY_LOOKUP_SQL, scope + (IDEMPOTENCY_TTL,))
+            row = cursor.fetchone()
+            return None if row is None else _stored_response(row, request_hash)
+
+        stored = lookup()
+        if stored is not None:
+            return stored
+        cursor.execute(IDEMPOTENCY_LOCK_SQL, (lock_key,))
+        if not cursor.fetchone()[0]:
+            # another request with this key is running; it may have stored
+            # its reservation (and so its body hash) by now
+            stored = lookup()
+            if stored is not None:
+                return stored
+            return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+
+        try:
+            # the key may have been finished, or reserved by a request that
+            # died, between the first lookup and the lock
+            stored = lookup()
+            if stored is not None:
+                return stored
+            cursor.execute(IDEMPOTENCY_RESERVE_SQL, scope + (request_hash, IDEMPOTENCY_TTL))
+            db.commit()
+
+            catalog_version = _catalog_version
+            response = None
+            db.hold_commit, db.commit_held = True, False
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            finally:
+                db.hold_commit = False
+                if response is not None and response.status_code < 500:
+                    if not db.commit_held:
+                        db.rollback()
+                    # commits together with whatever the handler committed
+                    cursor.execute("UPDATE Idempotency_Keys SET status = %s, body = %s "
+                                   "WHERE user_id = %s AND path = %s AND idempotency_key = %s",
+                                   (response.status_code, response.get_data(as_text=True)) + scope)
+                else:
+                    db.rollback()
+                    cursor.execute("DELETE FROM Idempotency_Keys "
+                                   "WHERE user_id = %s AND path = %s AND idempotency_key = %s", scope)
+                db.commit()
+            if _catalog_version != catalog_version:
+                # the handler bumped the catalog before its held commit
+                # landed; bump again so a cache built in between isn't kept
+                bump_catalog_version()
+            return response
+        finally:
+            cursor.execute(IDEMPOTENCY_UNLOCK_SQL, (lock_key,))
+            db.commit()
+    return wrapper
+
+
+def purge_idempotency_keys(batch=10000):
+    # batched so the purge never holds many row locks at once
+    deleted = 0
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("""
+            DELETE FROM Idempotency_Keys
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid FROM Idempotency_Keys WHERE created_at <= now() - %s::interval LIMIT %s
+            ))
+            """, (IDEMPOTENCY_TTL, batch))
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch:
+                return deleted
+
+
 # ==============================
 # 5️⃣ PLACE ORDER
 # ==============================
-@app.route('/place_order', methods=['POST'])
+# Cart lines travel as parallel arrays and are unnested server-side, so the
+# statement text (and its round-trip count) doesn't depend on cart size.
+# Prices come from Product_Variants, and stock for every line is reserved by
+# one conditional UPDATE; the order rows are only written when no line came
+# up short; otherwise the caller rolls the partial reservation back.
+PLACE_ORDER_SQL = """
+    WITH cart AS (
+        SELECT variant_id, SUM(quantity)::int AS quantity
+        FROM unnest(%(variant_ids)s::int[], %(quantities)s::int[]) AS c(variant_id, quantity)
+        GROUP BY variant_id
+    ), locked AS (
+        -- lock in variant_id order so concurrent orders sharing hot
+        -- variants queue up instead of deadlocking
+        SELECT v.variant_id
+        FROM Product_Variants v
+        JOIN cart ON cart.variant_id = v.variant_id
+        ORDER BY v.variant_id
+        FOR UPDATE OF v
+    ), reserved AS (
+        UPDATE Product_Variants v
+        SET stock = v.stock - cart.quantity
+        FROM cart
+        JOIN locked ON locked.variant_id = cart.variant_id
+        WHERE v.variant_id = cart.variant_id AND v.stock >= cart.quantity
+        RETURNING v.variant_id, v.price, cart.quantity
+    ), unknown AS (
+        SELECT cart.variant_id
+        FROM cart
+        LEFT JOIN locked ON locked.variant_id = cart.variant_id
+        WHERE locked.variant_id IS NULL
+    ), short AS (
+        SELECT cart.variant_id, cart.quantity AS requested, v.stock AS available
+        FROM cart
+        JOIN Product_Variants v ON v.variant_id = cart.variant_id
+        LEFT JOIN reserved r ON r.variant_id = cart.variant_id
+        WHERE r.variant_id IS NULL
+    ), new_order AS (
+        INSERT INTO Orders (user_id, status, payment_status, total_amount, stock_reserved)
+        SELECT %(user_id)s, 'Pending', 'Unpaid', SUM(price * quantity) + %(delivery_fee)s, TRUE
+        FROM reserved
+        HAVING NOT EXISTS (SELECT 1 FROM short) AND NOT EXISTS (SELECT 1 FROM unknown)
+        RETURNING order_id, total_amount
+    ), items AS (
+        INSERT INTO Order_Items (order_id, variant_id, quantity, price)
+        SELECT new_order.order_id, r.variant_id, r.quantity, r.price
+        FROM new_order, reserved r
+    ), payment AS (
+        INSERT INTO Payments (order_id, amount, status)
+        SELECT order_id, total_amount, 'Pending' FROM new_order
+    )
+    SELECT
+        (SELECT order_id FROM new_order) AS order_id,
+        (SELECT COALESCE(SUM(price * quantity), 0) FROM reserved) AS items_total,
+        (SELECT json_agg(short ORDER BY variant_id) FROM short) AS short_items,
+        (SELECT array_agg(variant_id ORDER BY variant_id) FROM unknown) AS unknown_variants
+"""
+
+
+def _int_field(value):
+    # JSON numbers or numeric strings that fit an INT column; bools, floats
+    # like 1.5 and junk raise ValueError
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(value)
+    if not -MAX_STOCK - 1 <= number <= MAX_STOCK:
+        raise ValueError(value)
+    return number
+
+
+@bp.route('/place_order', methods=['POST'])
+@require_auth()
+@idempotent
 def place_order():
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
-        data = request.json or {}
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Body must be a JSON object"}), 400
         user_id = data.get("user_id")
         cart = data.get("cart", [])
-        # we IGNORE data["total"] from the client now
-        delivery_fee = float(data.get("delivery_fee", 0) or 0)
 
         if not user_id or not cart:
             return jsonify({"error": "Missing order details"}), 400
-
-        # ✅ Recompute total on the backend from cart
-        items_total = 0.0
-        for item in cart:
-            price = float(item.get("price", 0) or 0)
-            qty = int(item.get("quantity", 1) or 1)
-            items_total += price * qty
-
-        order_total = items_total + delivery_fee
-
-        # ✅ Store order_total in Orders
-        cursor.execute("""
-        INSERT INTO Orders (user_id, status, payment_status, total_amount)
-        VALUES (%s, %s, %s, %s)
-        RETURNING order_id
-        """, (user_id, "Pending", "Unpaid", order_total))
-
-        order_id = cursor.fetchone()["order_id"]
-        
-
-        # ✅ Store EACH item (keep price as unit price)
+        if not isinstance(cart, list):
+            return jsonify({"error": "cart must be a list"}), 400
+        try:
+            user_id = _int_field(user_id)
+        except ValueError:
+            return jsonify({"error": "user_id must be an integer"}), 400
+        try:
+            # we IGNORE data["total"] and item prices from the client now
+            delivery_fee = Decimal(str(data.get("delivery_fee", 0) or 0))
+            if not delivery_fee.is_finite() or delivery_fee < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            return jsonify({"error": "delivery_fee must be a non-negative number"}), 400
+        denied = check_owner(user_id)
+        if denied:
+            return denied
+
+        variant_ids, quantities = [], []
         for item in cart:
-            price = float(item.get("price", 0) or 0)
-            qty = int(item.get("quantity", 1) or 1)
-            cursor.execute(
-                "INSERT INTO Order_Items (order_id, variant_id, quantity, price) "
-                "VALUES (%s, %s, %s, %s)",
-                (order_id, item["variant_id"], qty, price)
-            )
-
-        # ✅ Store total payment amount (same as order_total)
-        cursor.execute(
-            "INSERT INTO Payments (order_id, amount, status) VALUES (%s, %s, %s)",
-            (order_id, order_total, "Pending")
-        )
+            if not isinstance(item, dict) or item.get("variant_id") is None:
+                return jsonify({"error": "Every cart item needs a variant_id"}), 400
+            try:
+                variant_id = _int_field(item["variant_id"])
+            except ValueError:
+                return jsonify({"error": f"Invalid variant_id: {item['variant_id']}"}), 400
+            try:
+                qty = _int_field(item.get("quantity", 1) or 1)
+                if not 1 <= qty <= MAX_STOCK:
+                    raise ValueError
+            except ValueError:
+                return jsonify({"error": f"Invalid quantity for variant {variant_id}"}), 400
+            variant_ids.append(variant_id)
+            quantities.append(qty)
+
+        # ✅ Price lookup, stock reservation, order, items and payment in one round trip
+        cursor.execute(PLACE_ORDER_SQL, {
+            "user_id": user_id,
+            "delivery_fee": delivery_fee,
+            "variant_ids": variant_ids,
+            "quantities": quantities,
+        })
+        result = cursor.fetchone()
+        if result["unknown_variants"]:
+            db.rollback()
+            return jsonify({
+                "error": "Unknown variant",
+                "variant_ids": result["unknown_variants"],
+            }), 404
+        if result["short_items"]:
+            db.rollback()
+            return jsonify({
+                "error": "Insufficient stock",
+                "short_items": result["short_items"],
+            }), 409
+
+        refresh_order_summaries(cursor, [result["order_id"]])
+        publish_order_events(cursor, [result["order_id"]], "order_placed")
         db.commit()
+        bump_catalog_version()
 
+        order_id = result["order_id"]
+        items_total = float(result["items_total"])
+        order_total = items_total + float(delivery_fee)
         return jsonify({
             "message": "Order placed successfully",
             "order_id": order_id,
             "items_total": round(items_total, 2),
-            "delivery_fee": round(delivery_fee, 2),
+            "delivery_fee": round(float(delivery_fee), 2),
             "order_total": round(order_total, 2),
         }), 201
 
@@ -351,29 +1144,28 @@ def place_order():
 # ==============================
 # 6️⃣ SHOPOWNER ORDERS
 # ==============================
-@app.route('/orders/<int:user_id>', methods=['GET'])
+ORDERS_SQL = """
+    SELECT 
+        order_id,
+        status,
+        payment_status,
+        order_date,
+        total_amount,  -- ✅ use Orders.total_amount
+        payment_state,
+        distributor_names AS distributor_name
+    FROM Order_Summaries
+    WHERE user_id = %s AND item_count > 0{filters}
+    ORDER BY order_date DESC, order_id DESC
+"""
+ORDERS_PAGE_COLUMNS = ("order_date", "order_id", "status")
+
+
+@bp.route('/orders/<int:user_id>', methods=['GET'])
+@require_auth(owner="user_id")
+@read_replica
 def get_orders(user_id):
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT 
-                o.order_id,
-                o.status,
-                o.payment_status,
-                o.order_date,
-                o.total_amount,  -- ✅ use Orders.total_amount
-                MAX(p.status) AS payment_state,
-                STRING_AGG(DISTINCT d.name, ', ') AS distributor_name
-            FROM Orders o
-            JOIN Payments p ON o.order_id = p.order_id
-            JOIN Order_Items oi ON o.order_id = oi.order_id
-            JOIN Product_Variants v ON oi.variant_id = v.variant_id
-            JOIN Users d ON v.distributor_id = d.user_id
-            WHERE o.user_id = %s
-            GROUP BY o.order_id, o.status, o.payment_status, o.order_date, o.total_amount
-            ORDER BY o.order_date DESC
-        """, (user_id,))
-        return jsonify(cursor.fetchall()), 200
+        return history_response(ORDERS_SQL, ORDERS_PAGE_COLUMNS, (user_id,))
     except Exception as e:
         print("❌ /orders error:", e)
         return jsonify({"error": "Server error", "details": str(e)}), 500
@@ -381,33 +1173,31 @@ def get_orders(user_id):
 # ==============================
 # 7️⃣ SHOPOWNER PAYMENTS
 # ==============================
-@app.route('/payments/<int:user_id>', methods=['GET'])
+PAYMENTS_SQL = """
+    SELECT 
+        p.payment_id,
+        p.order_id,
+        p.amount,
+        p.status AS payment_status,
+        p.payment_method,
+        p.payment_date,
+        s.status AS order_status,
+        s.distributor_names AS distributor_name
+    FROM Payment_History h
+    JOIN Payments p ON p.payment_id = h.payment_id
+    JOIN Order_Summaries s ON s.order_id = h.order_id
+    WHERE h.user_id = %s AND s.user_id = h.user_id{filters}
+    ORDER BY h.payment_date DESC, h.payment_id DESC
+"""
+PAYMENTS_PAGE_COLUMNS = ("h.payment_date", "h.payment_id", "h.status")
+
+
+@bp.route('/payments/<int:user_id>', methods=['GET'])
+@require_auth(owner="user_id")
+@read_replica
 def get_payments(user_id):
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT 
-                p.payment_id,
-                p.order_id,
-                p.amount,
-                p.status AS payment_status,
-                p.payment_method,
-                p.payment_date,
-                o.status AS order_status,
-                u2.name AS distributor_name
-            FROM Payments p
-            JOIN Orders o ON p.order_id = o.order_id
-            JOIN Order_Items oi ON o.order_id = oi.order_id
-            JOIN Product_Variants v ON oi.variant_id = v.variant_id
-            JOIN Users u2 ON v.distributor_id = u2.user_id
-            WHERE o.user_id = %s
-            GROUP BY p.payment_id, p.order_id, u2.name, o.status
-            ORDER BY p.payment_date DESC
-        """, (user_id,))
-        payments = cursor.fetchall()
-        if not payments:
-            return jsonify([]), 200
-        return jsonify(payments), 200
+        return history_response(PAYMENTS_SQL, PAYMENTS_PAGE_COLUMNS, (user_id,))
     except Exception as e:
         print("❌ /payments error:", e)
         return jsonify({"error": "Failed to fetch payments", "details": str(e)}), 500
@@ -416,28 +1206,29 @@ def get_payments(user_id):
 # ==============================
 # 8️⃣ DISTRIBUTOR PAYMENTS (LIST)
 # ==============================
-@app.route('/distributor/payments/<int:distributor_id>', methods=['GET'])
+DISTRIBUTOR_PAYMENTS_SQL = """
+    SELECT
+        p.payment_id,
+        p.order_id,
+        s.shop_owner AS shop_name,
+        p.amount,
+        p.status AS payment_status,
+        p.payment_method,
+        p.payment_date
+    FROM Payment_History h
+    JOIN Payments p ON p.payment_id = h.payment_id
+    JOIN Order_Summaries s ON s.order_id = h.order_id
+    WHERE h.user_id = %s AND h.user_id = ANY(s.distributor_ids){filters}
+    ORDER BY h.payment_date DESC, h.payment_id DESC
+"""
+
+
+@bp.route('/distributor/payments/<int:distributor_id>', methods=['GET'])
+@require_auth(role="distributor", owner="distributor_id")
+@read_replica
 def get_distributor_payments(distributor_id):
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT DISTINCT
-                p.payment_id,
-                p.order_id,
-                u.name AS shop_name,
-                p.amount,
-                p.status AS payment_status,
-                p.payment_method,
-                p.payment_date
-           FROM Payments p
-           JOIN Orders o ON p.order_id = o.order_id
-           JOIN Users u ON o.user_id = u.user_id
-           JOIN Order_Items oi ON o.order_id = oi.order_id
-           JOIN Product_Variants v ON oi.variant_id = v.variant_id
-           WHERE v.distributor_id = %s
-           ORDER BY p.payment_date DESC
-           """, (distributor_id,))
-        return jsonify(cursor.fetchall()), 200
+        return history_response(DISTRIBUTOR_PAYMENTS_SQL, PAYMENTS_PAGE_COLUMNS, (distributor_id,))
     except Exception as e:
         print("❌ /distributor/payments error:", e)
         return jsonify({"error": str(e)}), 500
@@ -446,10 +1237,13 @@ def get_distributor_payments(distributor_id):
 # ==============================
 # 9️⃣ DISTRIBUTOR UPDATE PAYMENT
 # ==============================
-@app.route('/distributor/update_payment/<int:payment_id>', methods=['PUT'])
+@bp.route('/distributor/update_payment/<int:payment_id>', methods=['PUT'])
+@require_auth(role="distributor")
+@idempotent
 def update_distributor_payment(payment_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
         data = request.get_json(force=True)
 
         new_status = (data.get("status") or "").strip().capitalize()
@@ -459,6 +1253,12 @@ def update_distributor_payment(payment_id):
         if new_status not in allowed:
             return jsonify({"error":"Invalid status"}),400
 
+        cursor.execute("SELECT order_id FROM Payments WHERE payment_id=%s", (payment_id,))
+        payment = cursor.fetchone()
+        denied = check_order_access(cursor, payment["order_id"]) if payment else None
+        if denied:
+            return denied
+
         cursor.execute("""
         UPDATE Payments
         SET status=%s
@@ -471,7 +1271,11 @@ def update_distributor_payment(payment_id):
         FROM Payments p
         WHERE o.order_id=p.order_id
         AND p.payment_id=%s
+        RETURNING o.order_id
         """,(payment_id,))
+        order_ids = [row["order_id"] for row in cursor.fetchall()]
+        refresh_order_summaries(cursor, order_ids)
+        publish_order_events(cursor, order_ids, "payment")
 
         db.commit()
 
@@ -483,140 +1287,340 @@ def update_distributor_payment(payment_id):
  
 
 # 🔟 DISTRIBUTOR ORDERS (LIST)
-@app.route('/distributor/orders/<int:distributor_id>', methods=['GET'])
+DISTRIBUTOR_ORDERS_SQL = """
+    SELECT 
+        s.order_id,
+        s.order_date,
+        s.status,
+        s.payment_status,
+        s.shop_owner,
+        s.amount
+    FROM Distributor_Orders d
+    JOIN Order_Summaries s ON s.order_id = d.order_id
+    WHERE d.distributor_id = %s{filters}
+    ORDER BY d.order_date DESC, d.order_id DESC
+"""
+DISTRIBUTOR_ORDERS_PAGE_COLUMNS = ("d.order_date", "d.order_id", "d.status")
+
+
+@bp.route('/distributor/orders/<int:distributor_id>', methods=['GET'])
+@require_auth(role="distributor", owner="distributor_id")
+@read_replica
 def get_distributor_orders(distributor_id):
     try:
-        db.rollback()
-        cursor.execute("""
-        SELECT 
-             o.order_id,
-             o.order_date,
-             o.status,
-             o.payment_status,
-             u.name AS shop_owner,
-             MAX(p.amount) AS amount
-        FROM Orders o
-        JOIN Order_Items oi ON o.order_id = oi.order_id
-        JOIN Product_Variants v ON oi.variant_id = v.variant_id
-        JOIN Users u ON o.user_id = u.user_id
-        LEFT JOIN Payments p ON o.order_id = p.order_id
-        WHERE v.distributor_id = %s
-        GROUP BY 
-            o.order_id,
-            o.order_date,
-            o.status,
-            o.payment_status,
-            u.name
-        ORDER BY o.order_date DESC
-        """, (distributor_id,))
-        return jsonify(cursor.fetchall()), 200
+        return history_response(DISTRIBUTOR_ORDERS_SQL, DISTRIBUTOR_ORDERS_PAGE_COLUMNS, (distributor_id,))
     except Exception as e:
         print("❌ /distributor/orders error:", e)
         return jsonify({"error": str(e)}), 500
 
 
 # 1️⃣1️⃣ DISTRIBUTOR ORDER STATUS UPDATE
-@app.route('/distributor/update_status/<int:order_id>', methods=['PUT'])
+# Moving an order's quantities out of (or back into) stock first flips its
+# stock_reserved flag, so repeating a transition never double-counts, and
+# then locks the variants in variant_id order: concurrent accepts of orders
+# sharing variants queue up instead of deadlocking.
+RELEASE_STOCK_SQL = """
+    WITH flipped AS (
+        UPDATE Orders SET stock_reserved = FALSE
+        WHERE order_id = ANY(%s) AND stock_reserved = TRUE
+        RETURNING order_id
+    ), lines AS (
+        SELECT oi.variant_id, SUM(oi.quantity) AS quantity
+        FROM Order_Items oi
+        JOIN flipped f ON f.order_id = oi.order_id
+        GROUP BY oi.variant_id
+    ), locked AS (
+        SELECT v.variant_id
+        FROM Product_Variants v
+        JOIN lines ON lines.variant_id = v.variant_id
+        ORDER BY v.variant_id
+        FOR UPDATE OF v
+    )
+    UPDATE Product_Variants v
+    SET stock = v.stock + lines.quantity
+    FROM lines
+    JOIN locked ON locked.variant_id = lines.variant_id
+    WHERE v.variant_id = lines.variant_id
+"""
+
+# Taking stock again (re-accepting a declined order) is conditional like
+# placing one: lines that can't be covered come back in short_items and
+# the caller rolls the whole change back.
+TAKE_STOCK_SQL = """
+    WITH flipped AS (
+        UPDATE Orders SET stock_reserved = TRUE
+        WHERE order_id = ANY(%s) AND stock_reserved = FALSE
+        RETURNING order_id
+    ), lines AS (
+        SELECT oi.variant_id, SUM(oi.quantity) AS quantity
+        FROM Order_Items oi
+        JOIN flipped f ON f.order_id = oi.order_id
+        GROUP BY oi.variant_id
+    ), locked AS (
+        SELECT v.variant_id, v.stock
+        FROM Product_Variants v
+        JOIN lines ON lines.variant_id = v.variant_id
+        ORDER BY v.variant_id
+        FOR UPDATE OF v
+    ), taken AS (
+        UPDATE Product_Variants v
+        SET stock = v.stock - lines.quantity
+        FROM lines
+        JOIN locked ON locked.variant_id = lines.variant_id
+        WHERE v.variant_id = lines.variant_id AND v.stock >= lines.quantity
+        RETURNING v.variant_id
+    ), short AS (
+        SELECT lines.variant_id, lines.quantity AS requested, COALESCE(locked.stock, 0) AS available
+        FROM lines
+        LEFT JOIN locked ON locked.variant_id = lines.variant_id
+        LEFT JOIN taken ON taken.variant_id = lines.variant_id
+        WHERE taken.variant_id IS NULL
+    )
+    SELECT
+        (SELECT COUNT(*) FROM taken) AS taken,
+        (SELECT json_agg(short ORDER BY variant_id) FROM short) AS short_items
+"""
+
+
+class InsufficientStock(Exception):
+    def __init__(self, short_items):
+        super().__init__("Insufficient stock")
+        self.short_items = short_items
+
+
+def insufficient_stock(e):
+    return jsonify({"error": "Insufficient stock", "short_items": e.short_items}), 409
+
+
+# Declined and deleted orders give their quantities back; every other status
+# holds them. Moving stock is a no-op for orders already on that side, so
+# only re-activating a declined/deleted order takes it again.
+RELEASED_STATUSES = ("declined", "deleted")
+
+
+def move_order_stock(cursor, order_ids, reserve):
+    if not reserve:
+        cursor.execute(RELEASE_STOCK_SQL, (list(order_ids),))
+        return cursor.rowcount > 0
+    cursor.execute(TAKE_STOCK_SQL, (list(order_ids),))
+    result = cursor.fetchone()
+    if result["short_items"]:
+        raise InsufficientStock(result["short_items"])
+    return result["taken"] > 0
+
+
+ORDER_STATUSES = {
+    "pending": "Pending",
+    "accepted": "Accepted",
+    "shipped": "Shipped",
+    "out for delivery": "Out for Delivery",
+    "delivered": "Delivered",
+    "declined": "Declined",
+    "deleted": "Deleted",
+}
+MAX_BULK_ORDERS = 500
+
+
+# Moves order_ids to ORDER_STATUSES[incoming] together with the stock and
+# payment side effects, inside the caller's transaction. Returns the ids
+# that exist and whether any stock moved; raises InsufficientStock when an
+# order can't take its stock back.
+def apply_order_status(cursor, order_ids, incoming):
+    new_status = ORDER_STATUSES[incoming]
+    # orders are locked in id order, like variants below, so overlapping
+    # bulk updates can't deadlock each other
+    cursor.execute("""
+        WITH locked AS (
+            SELECT order_id FROM Orders
+            WHERE order_id = ANY(%s)
+            ORDER BY order_id
+            FOR UPDATE
+        )
+        UPDATE Orders o SET status=%s
+        FROM locked
+        WHERE o.order_id = locked.order_id
+        RETURNING o.order_id
+    """, (order_ids, new_status))
+    updated = [row["order_id"] for row in cursor.fetchall()]
+    if not updated:
+        return updated, False
+
+    if incoming == "delivered":
+        cursor.execute("UPDATE Payments SET status='Completed' WHERE order_id = ANY(%s)", (updated,))
+    elif incoming == "declined":
+        cursor.execute("UPDATE Payments SET status='Cancelled' WHERE order_id = ANY(%s)", (updated,))
+    stock_changed = move_order_stock(cursor, updated, incoming not in RELEASED_STATUSES)
+    record_order_sales(cursor, updated)
+    refresh_order_summaries(cursor, updated)
+    publish_order_events(cursor, updated, "order_status")
+    return updated, stock_changed
+
+
+@bp.route('/distributor/update_status/<int:order_id>', methods=['PUT'])
+@require_auth(role="distributor")
+@idempotent
 def update_order_status(order_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
         data = request.get_json(force=True) or {}
         incoming = (data.get("status") or "").strip().lower()
         if not incoming:
             return jsonify({"error": "Missing status"}), 400
-
-        allowed = {
-            "pending": "Pending",
-            "accepted": "Accepted",
-            "shipped": "Shipped",
-            "out for delivery": "Out for Delivery",
-            "delivered": "Delivered",
-            "declined": "Declined",
-            "deleted": "Deleted",
-        }
-        if incoming not in allowed:
+        if incoming not in ORDER_STATUSES:
             return jsonify({"error": f"Invalid status: {incoming}"}), 400
+        denied = check_order_access(cursor, order_id)
+        if denied:
+            return denied
 
-        new_status = allowed[incoming]
-        cursor.execute("UPDATE Orders SET status=%s WHERE order_id=%s", (new_status, order_id))
+        # status and its side effects commit together
+        _, stock_changed = apply_order_status(cursor, [order_id], incoming)
         db.commit()
+        if stock_changed:
+            bump_catalog_version()
 
-        if incoming == "accepted":
-            cursor.execute("SELECT variant_id, quantity FROM Order_Items WHERE order_id=%s", (order_id,))
-            items = cursor.fetchall()
-            for it in items:
-                cursor.execute("""
-                    UPDATE Product_Variants
-                    SET stock = GREATEST(stock - %s, 0)
-                    WHERE variant_id = %s
-                """, (it["quantity"], it["variant_id"]))
-            db.commit()
-        elif incoming == "delivered":
-            cursor.execute("UPDATE Payments SET status='Completed' WHERE order_id=%s", (order_id,))
-            db.commit()
-        elif incoming == "declined":
-            cursor.execute("UPDATE Payments SET status='Cancelled' WHERE order_id=%s", (order_id,))
-            db.commit()
-
-        return jsonify({"message": f"Order #{order_id} updated to {new_status}."}), 200
+        return jsonify({"message": f"Order #{order_id} updated to {ORDER_STATUSES[incoming]}."}), 200
+    except InsufficientStock as e:
+        db.rollback()
+        return insufficient_stock(e)
     except Exception as e:
         db.rollback()
         print("❌ Error updating order:", e)
         return jsonify({"error": str(e)}), 500
 
 
+# Morning dispatch: one request and one transaction for a whole batch
+@bp.route('/distributor/update_status', methods=['PUT'])
+@require_auth(role="distributor")
+@idempotent
+def bulk_update_order_status():
+    db = get_db()
+    cursor = get_cursor()
+    try:
+        data = request.get_json(force=True) or {}
+        incoming = (data.get("status") or "").strip().lower()
+        order_ids = data.get("order_ids") or []
+        if not incoming:
+            return jsonify({"error": "Missing status"}), 400
+        if incoming not in ORDER_STATUSES:
+            return jsonify({"error": f"Invalid status: {incoming}"}), 400
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({"error": "order_ids must be a non-empty list"}), 400
+        if len(order_ids) > MAX_BULK_ORDERS:
+            return jsonify({"error": f"At most {MAX_BULK_ORDERS} orders per request"}), 400
+        try:
+            order_ids = list(dict.fromkeys(_int_field(i) for i in order_ids))
+        except ValueError:
+            return jsonify({"error": "order_ids must be integers"}), 400
+
+        # orders of other distributors are reported per row, not applied
+        parties = fetch_order_parties(cursor, order_ids)
+        forbidden = {oid for oid in order_ids if oid in parties and check_parties(parties[oid])}
+        updated, stock_changed = apply_order_status(cursor, [oid for oid in order_ids if oid not in forbidden],
+                                                    incoming)
+        db.commit()
+        if stock_changed:
+            bump_catalog_version()
+
+        new_status = ORDER_STATUSES[incoming]
+        updated = set(updated)
+        results = [
+            {"order_id": oid, "ok": True, "status": new_status} if oid in updated
+            else {"order_id": oid, "ok": False, "error": "Not allowed for this user"} if oid in forbidden
+            else {"order_id": oid, "ok": False, "error": "Order not found"}
+            for oid in order_ids
+        ]
+        return jsonify({"status": new_status, "updated": len(updated), "results": results}), 200
+    except InsufficientStock as e:
+        # one transaction: nothing in the batch changes
+        db.rollback()
+        return insufficient_stock(e)
+    except Exception as e:
+        db.rollback()
+        print("❌ Error bulk updating orders:", e)
+        return jsonify({"error": str(e)}), 500
+
+
 # 1️⃣2️⃣ DISTRIBUTOR DELETE / RESTORE
-@app.route('/distributor/delete_order/<int:order_id>', methods=['PUT'])
+@bp.route('/distributor/delete_order/<int:order_id>', methods=['PUT'])
+@require_auth(role="distributor")
 def distributor_soft_delete(order_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
+        denied = check_order_access(cursor, order_id)
+        if denied:
+            return denied
         cursor.execute("UPDATE Orders SET status='Deleted' WHERE order_id=%s", (order_id,))
+        stock_changed = move_order_stock(cursor, [order_id], reserve=False)
+        record_order_sales(cursor, [order_id])
+        refresh_order_summaries(cursor, [order_id])
+        publish_order_events(cursor, [order_id], "order_deleted")
         db.commit()
+        if stock_changed:
+            bump_catalog_version()
         return jsonify({"message": f"Order {order_id} marked as deleted."}), 200
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/distributor/deleted_orders/<int:distributor_id>', methods=['GET'])
+DELETED_ORDERS_SQL = """
+    SELECT 
+        s.order_id, s.order_date, s.status, s.payment_status,
+        s.shop_owner, s.amount
+    FROM Distributor_Orders d
+    JOIN Order_Summaries s ON s.order_id = d.order_id
+    WHERE d.distributor_id = %s AND d.status='Deleted'
+    ORDER BY d.order_date DESC
+"""
+
+
+@bp.route('/distributor/deleted_orders/<int:distributor_id>', methods=['GET'])
+@require_auth(role="distributor", owner="distributor_id")
+@read_replica
 def get_deleted_orders(distributor_id):
+    cursor = get_cursor()
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT DISTINCT 
-                o.order_id, o.order_date, o.status, o.payment_status,
-                u.name AS shop_owner, p.amount
-            FROM Orders o
-            JOIN Order_Items oi ON o.order_id = oi.order_id
-            JOIN Product_Variants v ON oi.variant_id = v.variant_id
-            JOIN Users u ON o.user_id = u.user_id
-            JOIN Payments p ON o.order_id = p.order_id
-            WHERE v.distributor_id = %s AND o.status='Deleted'
-            ORDER BY o.order_date DESC
-        """, (distributor_id,))
+        run_query(cursor, DELETED_ORDERS_SQL, (distributor_id,))
         return jsonify(cursor.fetchall()), 200
     except Exception as e:
         print("❌ Error fetching deleted orders:", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/distributor/restore_order/<int:order_id>', methods=['PUT'])
+@bp.route('/distributor/restore_order/<int:order_id>', methods=['PUT'])
+@require_auth(role="distributor")
 def distributor_restore_order(order_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
+        denied = check_order_access(cursor, order_id)
+        if denied:
+            return denied
         cursor.execute("UPDATE Orders SET status='Pending' WHERE order_id=%s", (order_id,))
+        stock_changed = move_order_stock(cursor, [order_id], reserve=True)
+        record_order_sales(cursor, [order_id])
+        refresh_order_summaries(cursor, [order_id])
+        publish_order_events(cursor, [order_id], "order_restored")
         db.commit()
+        if stock_changed:
+            bump_catalog_version()
         return jsonify({"message": f"Order {order_id} restored successfully."}), 200
+    except InsufficientStock as e:
+        db.rollback()
+        return insufficient_stock(e)
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
 
 
 # 1️⃣3️⃣ USER PROFILE (GET/PUT)
-@app.route('/user/<int:user_id>', methods=['GET'])
+@bp.route('/user/<int:user_id>', methods=['GET'])
+@require_auth(owner="user_id")
 def get_user_profile(user_id):
+    cursor = get_cursor()
     try:
-        db.rollback()
         cursor.execute("""
             SELECT user_id, name, email, contact_no, address, role
             FROM Users
@@ -630,9 +1634,11 @@ def get_user_profile(user_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/user/<int:user_id>', methods=['PUT'])
+@bp.route('/user/<int:user_id>', methods=['PUT'])
+@require_auth(owner="user_id")
 def update_user_profile(user_id):
-    db.rollback()
+    db = get_db()
+    cursor = get_cursor()
     data = request.get_json() or {}
     name = data.get("name")
     contact_no = data.get("contact_no")
@@ -647,7 +1653,16 @@ def update_user_profile(user_id):
             SET name=%s, contact_no=%s, address=%s
             WHERE user_id=%s
         """, (name, contact_no, address, user_id))
+        # names are denormalized into the order summaries of both sides
+        cursor.execute("""
+            SELECT order_id FROM Order_Summaries WHERE user_id=%s
+            UNION
+            SELECT order_id FROM Distributor_Orders WHERE distributor_id=%s
+        """, (user_id, user_id))
+        refresh_order_summaries(cursor, [row["order_id"] for row in cursor.fetchall()])
         db.commit()
+        # distributor names are part of the catalog payload
+        bump_catalog_version()
         return jsonify({"message": "Profile updated successfully"}), 200
     except Exception as e:
         db.rollback()
@@ -655,56 +1670,67 @@ def update_user_profile(user_id):
 
 
 # 1️⃣4️⃣ DISTRIBUTORS LIST
-@app.route('/distributors', methods=['GET'])
+DISTRIBUTORS_SQL = """
+    SELECT 
+        user_id,
+        name,
+        COALESCE(contact_no, '') AS contact_no,
+        COALESCE(address, '') AS address
+    FROM Users
+    WHERE LOWER(role)='distributor'
+"""
+
+
+@bp.route('/distributors', methods=['GET'])
+@read_replica
 def get_distributors():
+    cursor = get_cursor()
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT 
-                user_id,
-                name,
-                COALESCE(contact_no, '') AS contact_no,
-                COALESCE(address, '') AS address
-            FROM Users
-            WHERE LOWER(role)='distributor'
-        """)
+        run_query(cursor, DISTRIBUTORS_SQL)
         return jsonify(cursor.fetchall()), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # 1️⃣5️⃣ DISTRIBUTOR PRODUCTS (LIST/ADD/UPDATE/DELETE-soft)
-@app.route('/distributor/products/<int:distributor_id>', methods=['GET'])
+DISTRIBUTOR_PRODUCTS_SQL = """
+    SELECT 
+        v.variant_id,
+        v.brand,
+        v.price,
+        v.stock,
+        v.unit,
+        sp.name AS subproduct_name,
+        p.name AS product_name,
+        c.name AS category_name
+    FROM Product_Variants v
+    JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
+    JOIN Products p ON sp.product_id = p.product_id
+    JOIN Categories c ON p.category_id = c.category_id
+    WHERE v.distributor_id = %s
+    ORDER BY c.name, p.name, sp.name, v.brand
+"""
+
+
+@bp.route('/distributor/products/<int:distributor_id>', methods=['GET'])
+@require_auth(role="distributor", owner="distributor_id")
+@read_replica
 def get_distributor_products(distributor_id):
+    cursor = get_cursor()
     try:
-        db.rollback()
-        cursor.execute("""
-            SELECT 
-                v.variant_id,
-                v.brand,
-                v.price,
-                v.stock,
-                v.unit,
-                sp.name AS subproduct_name,
-                p.name AS product_name,
-                c.name AS category_name
-            FROM Product_Variants v
-            JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
-            JOIN Products p ON sp.product_id = p.product_id
-            JOIN Categories c ON p.category_id = c.category_id
-            WHERE v.distributor_id = %s
-            ORDER BY c.name, p.name, sp.name, v.brand
-        """, (distributor_id,))
+        run_query(cursor, DISTRIBUTOR_PRODUCTS_SQL, (distributor_id,))
         return jsonify(cursor.fetchall()), 200
     except Exception as e:
         print("❌ Failed to fetch distributor products:", e)
         return jsonify({"error": "Failed to fetch products"}), 500
 
 
-@app.route('/distributor/add_product', methods=['POST'])
+@bp.route('/distributor/add_product', methods=['POST'])
+@require_auth(role="distributor")
 def add_product():
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
         data = request.get_json(force=True)
         distributor_id = data.get("distributor_id")
         category_id = data.get("category_id")
@@ -719,6 +1745,13 @@ def add_product():
 
         if not distributor_id or not product_name or not subproduct_name or not brand or not unit:
             return jsonify({"error": "Missing product data"}), 400
+        try:
+            distributor_id = _int_field(distributor_id)
+        except ValueError:
+            return jsonify({"error": "distributor_id must be an integer"}), 400
+        denied = check_owner(distributor_id)
+        if denied:
+            return denied
         if price is None or stock is None:
             return jsonify({"error": "Missing price/stock"}), 400
 
@@ -738,47 +1771,34 @@ def add_product():
                 """, (category_name.capitalize(),))
 
                 category_id = cursor.fetchone()["category_id"]
-                db.commit()
-        # Product
-        cursor.execute("SELECT product_id FROM Products WHERE name=%s AND category_id=%s",
-                       (product_name, category_id))
-        p = cursor.fetchone()
-        if p:
-            product_id = p["product_id"]
-            if image_url:
-                cursor.execute("UPDATE Products SET image_url=%s WHERE product_id=%s", (image_url, product_id))
-                db.commit()
-        else:
-           cursor.execute("""
-           INSERT INTO Products (category_id, name, image_url)
-           VALUES (%s, %s, %s)
-           RETURNING product_id
-           """, (category_id, product_name, image_url))
-
-           product_id = cursor.fetchone()["product_id"]
-           db.commit()
-
-        # Subproduct
-        cursor.execute("SELECT subproduct_id FROM SubProducts WHERE name=%s AND product_id=%s",
-                       (subproduct_name, product_id))
-        sp = cursor.fetchone()
-        if sp:
-            subproduct_id = sp["subproduct_id"]
-        else:
-            cursor.execute("""
-            INSERT INTO SubProducts (product_id, name)
-            VALUES (%s, %s)
-            RETURNING subproduct_id
-            """, (product_id, subproduct_name))
-
-            subproduct_id = cursor.fetchone()["subproduct_id"]
-            db.commit()
- # Variant
+        # Product (upsert; keeps the old image unless a new one is sent)
+        cursor.execute("""
+        INSERT INTO Products (category_id, name, image_url)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (category_id, name)
+        DO UPDATE SET image_url = COALESCE(EXCLUDED.image_url, Products.image_url)
+        RETURNING product_id
+        """, (category_id, product_name, image_url or None))
+        product_id = cursor.fetchone()["product_id"]
+
+        # Subproduct (upsert)
+        cursor.execute("""
+        INSERT INTO SubProducts (product_id, name)
+        VALUES (%s, %s)
+        ON CONFLICT (product_id, name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING subproduct_id
+        """, (product_id, subproduct_name))
+        subproduct_id = cursor.fetchone()["subproduct_id"]
+
+        # Variant
         cursor.execute("""
             INSERT INTO Product_Variants (subproduct_id, distributor_id, brand, unit, price, stock)
             VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING variant_id
         """, (subproduct_id, distributor_id, brand, unit, price, stock))
+        refresh_variant_search(cursor, [cursor.fetchone()["variant_id"]])
         db.commit()
+        bump_catalog_version()
         return jsonify({"message": "Product added successfully"}), 201
     except Exception as e:
         db.rollback()
@@ -786,22 +1806,29 @@ def add_product():
         return jsonify({"error": "Failed to add product", "details": str(e)}), 500
 
 
-@app.route('/distributor/update_product/<int:variant_id>', methods=['PUT'])
+@bp.route('/distributor/update_product/<int:variant_id>', methods=['PUT'])
+@require_auth(role="distributor")
 def update_distributor_product(variant_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
         data = request.get_json(force=True)
         price = data.get("price")
         stock = data.get("stock")
         unit = data.get("unit")
         brand = data.get("brand")
+        denied = check_variant_owner(cursor, variant_id)
+        if denied:
+            return denied
 
         cursor.execute("""
             UPDATE Product_Variants
             SET price=%s, stock=%s, unit=%s, brand=%s
             WHERE variant_id=%s
         """, (price, stock, unit, brand, variant_id))
+        refresh_variant_search(cursor, [variant_id])
         db.commit()
+        bump_catalog_version()
         return jsonify({"message": f"Variant {variant_id} updated"}), 200
     except Exception as e:
         db.rollback()
@@ -809,35 +1836,282 @@ def update_distributor_product(variant_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/distributor/delete_product/<int:variant_id>', methods=['DELETE'])
+@bp.route('/distributor/delete_product/<int:variant_id>', methods=['DELETE'])
+@require_auth(role="distributor")
 def delete_distributor_product(variant_id):
+    db = get_db()
+    cursor = get_cursor()
     try:
-        db.rollback()
+        denied = check_variant_owner(cursor, variant_id)
+        if denied:
+            return denied
         cursor.execute("UPDATE Product_Variants SET stock=0 WHERE variant_id=%s", (variant_id,))
         db.commit()
+        bump_catalog_version()
         return jsonify({"message": f"Variant {variant_id} marked as deleted (stock=0)."}), 200
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route("/order_items/<int:order_id>", methods=["GET"])
-def get_order_items(order_id):
+# ==============================
+# DISTRIBUTOR BULK PRODUCT IMPORT (CSV / NDJSON)
+# ==============================
+# Rows are read straight off the request stream and written in batches, so
+# an upload of any size only ever holds IMPORT_BATCH_SIZE rows in memory.
+# Each batch resolves its categories, products and subproducts with a few
+# set-based statements, inserts its variants in one multi-row INSERT and
+# commits on its own.
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_ERRORS = 1000
+# column limits from the schema, checked per row so one long value doesn't
+# fail the batch it is in
+IMPORT_MAX_LENGTHS = {"category": 100, "product": 100, "subproduct": 100, "brand": 100, "unit": 20}
+MAX_STOCK = 2 ** 31 - 1
+
+# Upserts on the UNIQUE (category_id, name) / (product_id, name) indexes;
+# DO UPDATE (rather than DO NOTHING) makes existing rows come back too.
+IMPORT_PRODUCTS_SQL = """
+    INSERT INTO Products (category_id, name, image_url)
+    SELECT DISTINCT ON (category_id, name) category_id, name, image_url
+    FROM unnest(%s::int[], %s::text[], %s::text[]) AS i(category_id, name, image_url)
+    ORDER BY category_id, name, image_url NULLS LAST
+    ON CONFLICT (category_id, name)
+    DO UPDATE SET image_url = COALESCE(EXCLUDED.image_url, Products.image_url)
+    RETURNING product_id, category_id, name
+"""
+
+IMPORT_SUBPRODUCTS_SQL = """
+    INSERT INTO SubProducts (product_id, name)
+    SELECT DISTINCT product_id, name
+    FROM unnest(%s::int[], %s::text[]) AS i(product_id, name)
+    ON CONFLICT (product_id, name)
+    DO UPDATE SET name = EXCLUDED.name
+    RETURNING subproduct_id, product_id, name
+"""
+
+IMPORT_VARIANTS_SQL = """
+    INSERT INTO Product_Variants (subproduct_id, distributor_id, brand, unit, price, stock)
+    SELECT v.subproduct_id, %s, v.brand, v.unit, v.price, v.stock
+    FROM unnest(%s::int[], %s::text[], %s::text[], %s::numeric[], %s::int[])
+         AS v(subproduct_id, brand, unit, price, stock)
+    RETURNING variant_id
+"""
+
+
+def _import_rows(stream, fmt):
+    # yields (row number, dict or None, parse error)
+    text = codecs.iterdecode(io.BufferedReader(stream), "utf-8-sig")
+    if fmt == "csv":
+        for n, row in enumerate(csv.DictReader(text), start=1):
+            yield n, row, None
+        return
+    n = 0
+    for line in text:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield n, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield n, None, "Each line must be a JSON object"
+            continue
+        yield n, row, None
+
+
+def _clean_import_row(row):
+    def text(*keys):
+        for key in keys:
+            value = row.get(key)
+            if value is not None and str(value).strip():
+                return str(value).strip()
+        return ""
+
+    item = {
+        "category": text("category_name", "category"),
+        "product": text("product_name"),
+        "subproduct": text("subproduct_name"),
+        "brand": text("brand"),
+        "unit": text("unit"),
+        "image_url": text("image_url") or None,
+    }
+    missing = [key for key in ("category", "product", "subproduct", "brand", "unit") if not item[key]]
+    if missing:
+        raise ValueError("Missing " + ", ".join(missing))
+    too_long = [f"{key} (max {limit})" for key, limit in IMPORT_MAX_LENGTHS.items() if len(item[key]) > limit]
+    if too_long:
+        raise ValueError("Too long: " + ", ".join(too_long))
     try:
-        db.rollback()
+        item["price"] = Decimal(text("price"))
+        if not item["price"].is_finite() or item["price"] < 0:
+            raise InvalidOperation
+    except InvalidOperation:
+        raise ValueError("price must be a non-negative number")
+    try:
+        item["stock"] = int(text("stock"))
+        if not 0 <= item["stock"] <= MAX_STOCK:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"stock must be an integer from 0 to {MAX_STOCK}")
+    return item
+
+
+def _import_batch(cursor, distributor_id, batch):
+    # Categories: matched case-insensitively, created capitalized (as in add_product)
+    names = {item["category"].lower(): item["category"] for _, item in batch}
+    cursor.execute("SELECT category_id, LOWER(name) AS key FROM Categories WHERE LOWER(name) = ANY(%s)",
+                   (list(names),))
+    categories = {row["key"]: row["category_id"] for row in cursor.fetchall()}
+    missing = [names[key].capitalize() for key in names if key not in categories]
+    if missing:
         cursor.execute("""
-            SELECT 
-                oi.quantity,
-                oi.price,
-                v.unit,
-                v.brand,
-                sp.name AS subproduct_name,
-                p.name AS product_name
-            FROM Order_Items oi
-            JOIN Product_Variants v ON oi.variant_id = v.variant_id
-            JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
-            JOIN Products p ON sp.product_id = p.product_id
-            WHERE oi.order_id = %s
-        """, (order_id,))
+            INSERT INTO Categories (name)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING category_id, LOWER(name) AS key
+        """, (missing,))
+        categories.update({row["key"]: row["category_id"] for row in cursor.fetchall()})
+
+    # Products
+    for _, item in batch:
+        item["category_id"] = categories[item["category"].lower()]
+    cursor.execute(IMPORT_PRODUCTS_SQL, (
+        [item["category_id"] for _, item in batch],
+        [item["product"] for _, item in batch],
+        [item["image_url"] for _, item in batch],
+    ))
+    products = {(row["category_id"], row["name"]): row["product_id"] for row in cursor.fetchall()}
+
+    # Subproducts
+    for _, item in batch:
+        item["product_id"] = products[(item["category_id"], item["product"])]
+    cursor.execute(IMPORT_SUBPRODUCTS_SQL, (
+        [item["product_id"] for _, item in batch],
+        [item["subproduct"] for _, item in batch],
+    ))
+    subproducts = {(row["product_id"], row["name"]): row["subproduct_id"] for row in cursor.fetchall()}
+
+    # Variants
+    cursor.execute(IMPORT_VARIANTS_SQL, (
+        distributor_id,
+        [subproducts[(item["product_id"], item["subproduct"])] for _, item in batch],
+        [item["brand"] for _, item in batch],
+        [item["unit"] for _, item in batch],
+        [item["price"] for _, item in batch],
+        [item["stock"] for _, item in batch],
+    ))
+    refresh_variant_search(cursor, [row["variant_id"] for row in cursor.fetchall()])
+
+
+@bp.route('/distributor/import_products/<int:distributor_id>', methods=['POST'])
+@require_auth(role="distributor", owner="distributor_id")
+def import_distributor_products(distributor_id):
+    db = get_db()
+    cursor = get_cursor()
+    fmt = (request.args.get("format") or "").lower()
+    if not fmt:
+        fmt = "csv" if request.mimetype in ("text/csv", "application/csv") else "ndjson"
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    imported, failed, errors = 0, 0, []
+
+    def fail(n, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({"row": n, "error": message})
+
+    def flush(batch):
+        nonlocal imported
+        try:
+            _import_batch(cursor, distributor_id, batch)
+            db.commit()
+            imported += len(batch)
+            return
+        except Exception as e:
+            db.rollback()
+            print("❌ Import batch error, retrying row by row:", e)
+        # a row the checks above let through still failed in Postgres: keep
+        # the batch's other rows and report just that one
+        for n, item in batch:
+            cursor.execute("SAVEPOINT import_row")
+            try:
+                _import_batch(cursor, distributor_id, [(n, item)])
+                cursor.execute("RELEASE SAVEPOINT import_row")
+                imported += 1
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT import_row")
+                fail(n, str(e).strip())
+        db.commit()
+
+    try:
+        cursor.execute("SELECT role FROM Users WHERE user_id=%s", (distributor_id,))
+        user = cursor.fetchone()
+        if not user or role_key(user["role"]) != "distributor":
+            return jsonify({"error": "Distributor not found"}), 404
+
+        batch = []
+        for n, row, error in _import_rows(request.stream, fmt):
+            if error:
+                fail(n, error)
+                continue
+            try:
+                batch.append((n, _clean_import_row(row)))
+            except ValueError as e:
+                fail(n, str(e))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except (UnicodeDecodeError, csv.Error) as e:
+        # rows committed so far stay imported
+        fail(None, f"Could not read upload: {e}")
+    except Exception as e:
+        print("❌ Error importing products:", e)
+        return jsonify({"error": "Failed to import products", "details": str(e), "imported": imported}), 500
+
+    if imported:
+        bump_catalog_version()
+    return jsonify({
+        "message": f"Imported {imported} product(s)",
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+    }), 200
+
+
+ORDER_ITEMS_SQL = """
+    SELECT 
+        oi.quantity,
+        oi.price,
+        v.unit,
+        v.brand,
+        sp.name AS subproduct_name,
+        p.name AS product_name
+    FROM Order_Items oi
+    JOIN Product_Variants v ON oi.variant_id = v.variant_id
+    JOIN SubProducts sp ON v.subproduct_id = sp.subproduct_id
+    JOIN Products p ON sp.product_id = p.product_id
+    WHERE oi.order_id = %s
+"""
+
+
+@bp.route("/order_items/<int:order_id>", methods=["GET"])
+@require_auth()
+@read_replica
+def get_order_items(order_id):
+    cursor = get_cursor()
+    try:
+        # the shop that placed the order and its distributors
+        denied = check_order_access(cursor, order_id, shop_owner=True)
+        if denied:
+            return denied
+        run_query(cursor, ORDER_ITEMS_SQL, (order_id,))
         rows = cursor.fetchall()
 
         return jsonify(rows), 200
@@ -846,3 +2120,315 @@ def get_order_items(order_id):
         print("❌ /order_items error:", e)
         return jsonify({"error": "Failed to fetch order items"}), 500
 
+
+# ==============================
+# 1️⃣6️⃣ DISTRIBUTOR SALES ANALYTICS
+# ==============================
+# ?from=&to= (ISO dates, both inclusive; default the last 30 days),
+# granularity=day|week and top=N best-selling variants. Both queries read
+# Distributor_Daily_Sales through its (distributor_id, day, variant_id) key,
+# so the cost grows with the days in range, not with the order history.
+# Sales are counted on the day the order was placed.
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_TOP = 100
+
+DISTRIBUTOR_SALES_SQL = """
+    SELECT to_char(date_trunc(%s, day), 'YYYY-MM-DD') AS period,
+           SUM(revenue) AS revenue,
+           SUM(units)::bigint AS units,
+           SUM(order_lines) AS order_lines
+    FROM Distributor_Daily_Sales
+    WHERE distributor_id = %s AND day BETWEEN %s AND %s
+    GROUP BY 1
+    HAVING SUM(order_lines) > 0
+    ORDER BY 1
+"""
+
+DISTRIBUTOR_TOP_PRODUCTS_SQL = """
+    WITH top AS (
+        SELECT variant_id, SUM(revenue) AS revenue, SUM(units)::bigint AS units
+        FROM Distributor_Daily_Sales
+        WHERE distributor_id = %s AND day BETWEEN %s AND %s
+        GROUP BY variant_id
+        HAVING SUM(order_lines) > 0
+        ORDER BY revenue DESC, variant_id
+        LIMIT %s
+    )
+    SELECT top.variant_id, p.name AS product_name, sp.name AS subproduct_name,
+           v.brand, v.unit, top.revenue, top.units
+    FROM top
+    JOIN Product_Variants v ON v.variant_id = top.variant_id
+    JOIN SubProducts sp ON sp.subproduct_id = v.subproduct_id
+    JOIN Products p ON p.product_id = sp.product_id
+    ORDER BY top.revenue DESC, top.variant_id
+"""
+
+
+def _analytics_args(args):
+    try:
+        to = datetime.fromisoformat(args["to"]).date() if args.get("to") else datetime.now().date()
+        start = (datetime.fromisoformat(args["from"]).date() if args.get("from")
+                 else to - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+    except ValueError:
+        raise ValueError("from/to must be ISO dates")
+    if start > to:
+        raise ValueError("from must not be after to")
+    granularity = (args.get("granularity") or "day").lower()
+    if granularity not in ("day", "week"):
+        raise ValueError("granularity must be day or week")
+    try:
+        top = min(int(args.get("top", 10)), ANALYTICS_MAX_TOP)
+    except ValueError:
+        raise ValueError("top must be an integer")
+    if top < 0:
+        raise ValueError("top must not be negative")
+    return start, to, granularity, top
+
+
+@bp.route('/distributor/analytics/<int:distributor_id>', methods=['GET'])
+@require_auth(role="distributor", owner="distributor_id")
+@read_replica
+def get_distributor_analytics(distributor_id):
+    try:
+        start, to, granularity, top = _analytics_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cursor = get_tuple_cursor()
+        run_query(cursor, DISTRIBUTOR_SALES_SQL, (granularity, distributor_id, start, to))
+        series = dict_rows(cursor, cursor.fetchall())
+        top_products = []
+        if top:
+            run_query(cursor, DISTRIBUTOR_TOP_PRODUCTS_SQL, (distributor_id, start, to, top))
+            top_products = dict_rows(cursor, cursor.fetchall())
+        totals = {
+            "revenue": sum((row["revenue"] for row in series), Decimal(0)),
+            "units": sum(row["units"] for row in series),
+            "order_lines": sum(row["order_lines"] for row in series),
+        }
+        return jsonify({
+            "distributor_id": distributor_id,
+            "from": start.isoformat(),
+            "to": to.isoformat(),
+            "granularity": granularity,
+            "totals": totals,
+            "series": series,
+            "top_products": top_products,
+        }), 200
+    except Exception as e:
+        print("❌ /distributor/analytics error:", e)
+        return jsonify({"error": "Server error", "details": str(e)}), 500
+
+
+# ==============================
+# 🔔 ORDER EVENTS (SSE)
+# ==============================
+# One long-lived text/event-stream per dashboard instead of polling the
+# order/payment lists. Events carry the order's new status/payment fields;
+# clients refetch their lists on (re)connect. Each open stream holds a
+# worker thread here, so serve /events from `uvicorn asgi:app` (or gunicorn
+# with --threads) rather than plain sync workers.
+@bp.route('/events/<int:user_id>', methods=['GET'])
+@require_auth(owner="user_id", query_token=True)
+def order_events(user_id):
+    events = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def deliver(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass
+
+    subscribe(user_id, deliver)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield sse_message(events.get(timeout=SSE_HEARTBEAT))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe(user_id, deliver)
+
+    return current_app.response_class(generate(), mimetype="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ==============================
+# QUERY REGISTRY (run_query / PREPARE names)
+# ==============================
+QUERIES = {
+    "catalog": CATALOG_SQL,
+    "catalog_page": CATALOG_PAGE_SQL,
+    "orders": ORDERS_SQL,
+    "payments": PAYMENTS_SQL,
+    "distributor_orders": DISTRIBUTOR_ORDERS_SQL,
+    "distributor_payments": DISTRIBUTOR_PAYMENTS_SQL,
+    "deleted_orders": DELETED_ORDERS_SQL,
+    "distributors": DISTRIBUTORS_SQL,
+    "distributor_products": DISTRIBUTOR_PRODUCTS_SQL,
+    "order_items": ORDER_ITEMS_SQL,
+    "distributor_sales": DISTRIBUTOR_SALES_SQL,
+    "distributor_top_products": DISTRIBUTOR_TOP_PRODUCTS_SQL,
+    "catalog_search": CATALOG_SEARCH_SQL,
+    "catalog_search_trgm": CATALOG_SEARCH_TRGM_SQL,
+    "idempotency_lookup": IDEMPOTENCY_LOOKUP_SQL,
+}
+QUERY_NAMES = {sql: name for name, sql in QUERIES.items()}
+
+
+# ==============================
+# INDEX CHECKS (flask freshcart check-indexes)
+# ==============================
+# The shop-owner and distributor list queries with the indexes each one is
+# expected to use.
+_PAGED = " AND ({0}, {1}) < (%s, %s)"
+# Ids are filled in with the busiest shop and distributor (see
+# sample_owner_ids). The unpaged lists read a user's whole history, so
+# whether they use an index depends on the data; only their LIMIT pages
+# are asserted and the rest are shown for reference. A user with few
+# payments may get the (user_id, payment_id) primary key plus a top-N sort
+# instead of the date index; either keeps the scan to that user.
+SAMPLE_SHOP, SAMPLE_DISTRIBUTOR = object(), object()
+INDEX_CHECKS = [
+    ("orders", ORDERS_SQL.format(filters=""), (SAMPLE_SHOP,), []),
+    ("orders page", ORDERS_SQL.format(filters=_PAGED.format("order_date", "order_id")) + " LIMIT 51",
+     (SAMPLE_SHOP, "2030-01-01", 1), ["idx_order_summaries_user"]),
+    ("payments", PAYMENTS_SQL.format(filters=""), (SAMPLE_SHOP,), []),
+    ("payments page", PAYMENTS_SQL.format(filters=_PAGED.format("h.payment_date", "h.payment_id")) + " LIMIT 51",
+     (SAMPLE_SHOP, "2030-01-01", 1), [("idx_payment_history_date", "payment_history_pkey")]),
+    ("distributor orders", DISTRIBUTOR_ORDERS_SQL.format(filters=""), (SAMPLE_DISTRIBUTOR,), []),
+    ("distributor orders page",
+     DISTRIBUTOR_ORDERS_SQL.format(filters=_PAGED.format("d.order_date", "d.order_id")) + " LIMIT 51",
+     (SAMPLE_DISTRIBUTOR, "2030-01-01", 1), ["idx_distributor_orders_date"]),
+    ("distributor payments", DISTRIBUTOR_PAYMENTS_SQL.format(filters=""), (SAMPLE_DISTRIBUTOR,), []),
+    ("distributor payments page",
+     DISTRIBUTOR_PAYMENTS_SQL.format(filters=_PAGED.format("h.payment_date", "h.payment_id")) + " LIMIT 51",
+     (SAMPLE_DISTRIBUTOR, "2030-01-01", 1), [("idx_payment_history_date", "payment_history_pkey")]),
+    ("deleted orders", DELETED_ORDERS_SQL, (SAMPLE_DISTRIBUTOR,), []),
+    ("distributor products", DISTRIBUTOR_PRODUCTS_SQL, (SAMPLE_DISTRIBUTOR,), ["idx_variants_distributor"]),
+    ("distributors", DISTRIBUTORS_SQL, (), ["idx_users_lower_role"]),
+    ("order items", ORDER_ITEMS_SQL, (1,), ["idx_order_items_order"]),
+    ("distributor sales", DISTRIBUTOR_SALES_SQL, ("day", SAMPLE_DISTRIBUTOR, "2026-01-01", "2026-12-31"),
+     ["distributor_daily_sales_pkey"]),
+    ("distributor top products", DISTRIBUTOR_TOP_PRODUCTS_SQL,
+     (SAMPLE_DISTRIBUTOR, "2026-01-01", "2026-12-31", 10),
+     ["distributor_daily_sales_pkey"]),
+    ("catalog search", CATALOG_SEARCH_SQL, ("tomato:*", 20), ["idx_variants_search"]),
+    ("idempotency key lookup", IDEMPOTENCY_LOOKUP_SQL, (1, "/place_order", "key", timedelta(hours=24)),
+     ["idempotency_keys_pkey"]),
+]
+
+
+def sample_owner_ids(conn):
+    # the shop and distributor with the most orders (1 on an empty database)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT
+                (SELECT user_id FROM Order_Summaries GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1),
+                (SELECT distributor_id FROM Distributor_Orders GROUP BY distributor_id
+                 ORDER BY COUNT(*) DESC LIMIT 1)
+        """)
+        shop_id, distributor_id = cursor.fetchone()
+    finally:
+        conn.rollback()
+        cursor.close()
+    return {SAMPLE_SHOP: shop_id or 1, SAMPLE_DISTRIBUTOR: distributor_id or 1}
+
+
+# ==============================
+# CLI: flask --app app freshcart <command>
+# ==============================
+freshcart_cli = AppGroup("freshcart", help="FreshCart maintenance commands.")
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", "1500"))
+
+
+@freshcart_cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations."""
+    with pooled_connection() as conn:
+        applied = migrate(conn)
+    click.echo(f"✅ Applied migrations: {applied}" if applied else "✅ Schema is up to date.")
+
+
+@freshcart_cli.command("seed")
+@click.option("--seed", "seed_value", default=42, show_default=True, help="Random seed; same seed, same data.")
+@click.option("--distributors", type=int, default=SEED_DEFAULTS["distributors"], show_default=True)
+@click.option("--shops", type=int, default=SEED_DEFAULTS["shops"], show_default=True)
+@click.option("--categories", type=int, default=SEED_DEFAULTS["categories"], show_default=True)
+@click.option("--products", type=int, default=SEED_DEFAULTS["products"], show_default=True)
+@click.option("--variants", type=int, default=SEED_DEFAULTS["variants"], show_default=True)
+@click.option("--orders", type=int, default=SEED_DEFAULTS["orders"], show_default=True)
+@click.option("--max-lines", type=int, default=SEED_DEFAULTS["max_lines"], show_default=True,
+              help="Most lines in one order (1..N, drawn uniformly).")
+@click.option("--days", type=int, default=SEED_DEFAULTS["days"], show_default=True,
+              help="Orders are spread over this many days before --until.")
+@click.option("--until", type=click.DateTime(), default=None, help="Newest order date (default: today).")
+@click.option("--product-skew", type=float, default=SEED_DEFAULTS["product_skew"], show_default=True,
+              help="Zipf exponent for variant popularity.")
+@click.option("--distributor-skew", type=float, default=SEED_DEFAULTS["distributor_skew"], show_default=True,
+              help="Zipf exponent for distributor catalog size.")
+@click.option("--shop-skew", type=float, default=SEED_DEFAULTS["shop_skew"], show_default=True,
+              help="Zipf exponent for orders per shop.")
+def seed_command(seed_value, until, **options):
+    """Bulk-load synthetic users, catalog, orders and payments."""
+    with pooled_connection() as conn:
+        try:
+            counts = seed_database(conn, seed=seed_value, until=until, log=click.echo, **options)
+        except Exception:
+            conn.rollback()
+            raise
+    click.echo(f"✅ Seeded in {counts.pop('seconds')}s: "
+               + ", ".join(f"{n} {table}" for table, n in counts.items()))
+
+
+@freshcart_cli.command("purge-idempotency-keys")
+def purge_idempotency_keys_command():
+    """Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL_HOURS."""
+    click.echo(f"✅ Purged {purge_idempotency_keys()} idempotency keys.")
+
+
+@freshcart_cli.command("check-indexes")
+def check_indexes_command():
+    """EXPLAIN the list queries and verify they use their indexes."""
+    failed = False
+    with pooled_connection() as conn:
+        samples = sample_owner_ids(conn)
+        checks = [(label, sql, tuple(samples[p] if p in samples else p for p in params), expected)
+                  for label, sql, params, expected in INDEX_CHECKS]
+        results = check_indexes(conn, checks)
+    for result, (_, _, _, expected) in zip(results, INDEX_CHECKS):
+        ok = not result["missing"]
+        failed = failed or not ok
+        used = ", ".join(result["indexes"]) or "no index"
+        mark = "✅" if ok and expected else "ℹ️ " if ok else "❌"
+        click.echo(f"{mark} {result['query']} uses {used}"
+                   + ("" if ok else f" (missing {', '.join(result['missing'])})"))
+    if failed:
+        raise SystemExit(1)
+
+
+@freshcart_cli.command("startup-time")
+@click.option("--runs", default=5, show_default=True, help="Cold starts to measure.")
+@click.option("--budget-ms", default=STARTUP_BUDGET_MS, show_default=True,
+              help="Fail if the slowest start exceeds this.")
+def startup_time_command(runs, budget_ms):
+    """Measure cold worker start (import + create_app) in fresh interpreters."""
+    probe = ("import time; t = time.perf_counter(); import app; "
+             "print((time.perf_counter() - t) * 1000)")
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    timings.sort()
+    click.echo(f"startup ms: min {timings[0]:.1f}  median {timings[len(timings) // 2]:.1f}  "
+               f"max {timings[-1]:.1f}  (budget {budget_ms:.0f})")
+    if timings[-1] > budget_ms:
+        raise SystemExit(1)
+
+
+app = create_app()
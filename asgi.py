@@ -0,0 +1,295 @@
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+import asyncpg
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+import app as flask_module
+import auth
+import database
+import events
+import metrics
+from database import CONNECT_TIMEOUT, DATABASE_READ_URL, DATABASE_URL, POOL_MIN, POOL_TIMEOUT
+
+# ==============================
+# ASGI entry point: uvicorn asgi:app
+# ==============================
+# The polled read endpoints run on asyncpg here, so one worker can have many
+# Postgres round trips in flight at once. They reuse the SQL, paging and
+# JSON code from app.py and return the same bodies. Everything else (writes,
+# login, streaming, CLI-only bits) is the Flask app mounted underneath and
+# runs on a2wsgi's thread pool.
+flask_app = flask_module.app
+dumps = flask_app.json.dumps
+ASYNC_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", "20"))
+
+_pools = {}
+_pool_lock = asyncio.Lock()
+# set per request by read_route, like g.use_replica in app.py
+_use_replica = ContextVar("freshcart_use_replica", default=False)
+_catalog_build_lock = asyncio.Lock()
+
+
+# asyncpg already prepares and caches statements per connection, so the
+# registry in app.py is only needed for its $n placeholder conversion
+pg_sql = lru_cache(maxsize=None)(flask_module.dollar_params)
+
+
+async def get_pool(label="primary"):
+    async with _pool_lock:
+        if label not in _pools:
+            url = DATABASE_READ_URL if label == "replica" else DATABASE_URL
+            _pools[label] = await asyncpg.create_pool(url, min_size=POOL_MIN, max_size=ASYNC_POOL_MAX,
+                                                      timeout=CONNECT_TIMEOUT)
+            print(f"✅ Connected to Render PostgreSQL {label} (async pool {POOL_MIN}-{ASYNC_POOL_MAX})")
+    return _pools[label]
+
+
+async def read_pool():
+    # the same fallbacks as database._checkout_read
+    if database._replica_lag["lagging"] and not database.replica_lag_due():
+        return await get_pool()
+    try:
+        pool = await get_pool("replica")
+        if database.replica_lag_due():
+            async with pool.acquire(timeout=POOL_TIMEOUT) as conn:
+                database.record_replica_lag(await conn.fetchval(database.REPLICA_LAG_SQL))
+    except (OSError, asyncio.TimeoutError, asyncpg.exceptions.PostgresError) as e:
+        database.skip_replica(e)
+    if database._replica_lag["lagging"]:
+        return await get_pool()
+    return pool
+
+
+async def fetch(sql, *params, primary=False):
+    try:
+        pool = await read_pool() if _use_replica.get() and not primary else await get_pool()
+        async with pool.acquire(timeout=POOL_TIMEOUT) as conn:
+            started = time.perf_counter()
+            try:
+                return [dict(row) for row in await conn.fetch(pg_sql(sql), *params)]
+            finally:
+                metrics.observe_query(sql, params, time.perf_counter() - started)
+    except (OSError, asyncio.TimeoutError, asyncpg.exceptions.PostgresConnectionError,
+            asyncpg.exceptions.ConnectionDoesNotExistError) as e:
+        raise flask_module.DatabaseUnavailable(str(e)) from e
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj) + "\n", status, headers=flask_module.CORS_HEADERS,
+                    media_type="application/json")
+
+
+def auth_failed(request, e):
+    if auth.AUTH_ENFORCE:
+        return json_response({"error": e.message}, e.status)
+    print(f"⚠️ Auth not enforced: {request.method} {request.url.path}: {e.message}")
+    return None
+
+
+def check_auth(request, role=None, owner=None, query_token=False):
+    # the same checks as auth.require_auth on the Flask routes; None if allowed
+    request.state.user = None
+    try:
+        request.state.user = auth.authorize(request.headers.get("authorization"),
+                                            request.query_params.get("token") if query_token else None,
+                                            role, request.path_params.get(owner) if owner else None)
+    except auth.AuthError as e:
+        return auth_failed(request, e)
+    return None
+
+
+def check_parties(request, user_ids):
+    # auth.check_parties for the token check_auth accepted
+    try:
+        auth.check_party(request.state.user, user_ids)
+    except auth.AuthError as e:
+        return auth_failed(request, e)
+    return None
+
+
+def wants_replica(request):
+    # the staleness guard of app.read_replica; ownership is checked, so the
+    # path's user is the token's user
+    if not DATABASE_READ_URL or flask_module.WROTE_COOKIE in request.cookies:
+        return False
+    events.start_listener()
+    users = {request.path_params.get("user_id"), request.path_params.get("distributor_id")} - {None}
+    return not database.recently_wrote(users)
+
+
+def read_route(path, label, auth_required=False, role=None, owner=None):
+    # Streaming requests are left to Flask (see stream_rows in app.py): any
+    # ASGI app can stand in for a response. For everything else the
+    # handler's errors are reported like the sync app's.
+    flask_path = re.sub(r"\{(\w+):int\}", r"<int:\1>", path)
+
+    def decorator(handler):
+        async def endpoint(request):
+            if request.query_params.get("stream") or "application/x-ndjson" in request.headers.get("accept", ""):
+                return flask_wsgi
+            metrics.start_request()
+            _use_replica.set(wants_replica(request))
+            try:
+                denied = check_auth(request, role, owner) if auth_required else None
+                response = denied or await handler(request, **request.path_params)
+            except ValueError as e:
+                response = json_response({"error": str(e)}, 400)
+            except flask_module.DatabaseUnavailable as e:
+                print("❌ DB connection failed:", e)
+                response = json_response({"error": "DB not connected on server", "details": str(e)}, 500)
+            except Exception as e:
+                print(f"❌ {label} error:", e)
+                response = json_response({"error": "Server error", "details": str(e)}, 500)
+            # same route labels as Flask's url rules
+            metrics.finish_request(flask_path, "GET", response.status_code, len(response.body))
+            return response
+
+        return Route(path, endpoint, methods=["GET"])
+    return decorator
+
+
+# ==============================
+# Read endpoints
+# ==============================
+@read_route("/catalog", "/catalog")
+async def get_catalog(request):
+    args = request.query_params
+    if any(arg in args for arg in flask_module.CATALOG_PAGE_ARGS):
+        limit = flask_module.page_limit(args)
+        sql, params = flask_module._catalog_page_query(args)
+        rows = await fetch(sql, *params, limit + 1)
+        return json_response(flask_module.catalog_page_body(rows, limit))
+
+    # same cache as the Flask app, so both see its writes' version bumps
+    entry, _ = flask_module._fresh_catalog()
+    if not entry:
+        async with _catalog_build_lock:
+            entry, version = flask_module._fresh_catalog()
+            if not entry:
+                # never cached from a replica (see get_catalog in app.py)
+                rows = await fetch(flask_module.CATALOG_SQL, primary=True)
+                body, etag = flask_module.store_catalog(version, dumps(rows, separators=(",", ":")))
+                entry = {"body": body, "etag": etag}
+    headers = dict(flask_module.CORS_HEADERS, ETag=f'"{entry["etag"]}"', **{"Cache-Control": "no-cache"})
+    if parse_etags(request.headers.get("if-none-match")).contains(entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(entry["body"], headers=headers, media_type="application/json")
+
+
+async def history(template, columns, owner_id, args):
+    if any(arg in args for arg in flask_module.HISTORY_PAGE_ARGS):
+        sql, params, limit = flask_module.history_page_query(template, columns, (owner_id,), args)
+        return json_response(flask_module.history_page_body(await fetch(sql, *params), columns, limit))
+    return json_response(await fetch(template.format(filters=""), owner_id))
+
+
+@read_route("/orders/{user_id:int}", "/orders", auth_required=True, owner="user_id")
+async def get_orders(request, user_id):
+    return await history(flask_module.ORDERS_SQL, flask_module.ORDERS_PAGE_COLUMNS, user_id,
+                         request.query_params)
+
+
+@read_route("/payments/{user_id:int}", "/payments", auth_required=True, owner="user_id")
+async def get_payments(request, user_id):
+    return await history(flask_module.PAYMENTS_SQL, flask_module.PAYMENTS_PAGE_COLUMNS, user_id,
+                         request.query_params)
+
+
+@read_route("/distributor/orders/{distributor_id:int}", "/distributor/orders", auth_required=True,
+            role="distributor", owner="distributor_id")
+async def get_distributor_orders(request, distributor_id):
+    return await history(flask_module.DISTRIBUTOR_ORDERS_SQL, flask_module.DISTRIBUTOR_ORDERS_PAGE_COLUMNS,
+                         distributor_id, request.query_params)
+
+
+@read_route("/distributor/payments/{distributor_id:int}", "/distributor/payments", auth_required=True,
+            role="distributor", owner="distributor_id")
+async def get_distributor_payments(request, distributor_id):
+    return await history(flask_module.DISTRIBUTOR_PAYMENTS_SQL, flask_module.PAYMENTS_PAGE_COLUMNS,
+                         distributor_id, request.query_params)
+
+
+@read_route("/distributor/products/{distributor_id:int}", "/distributor/products", auth_required=True,
+            role="distributor", owner="distributor_id")
+async def get_distributor_products(request, distributor_id):
+    return json_response(await fetch(flask_module.DISTRIBUTOR_PRODUCTS_SQL, distributor_id))
+
+
+@read_route("/distributors", "/distributors")
+async def get_distributors(request):
+    return json_response(await fetch(flask_module.DISTRIBUTORS_SQL))
+
+
+@read_route("/order_items/{order_id:int}", "/order_items", auth_required=True)
+async def get_order_items(request, order_id):
+    parties = flask_module.order_parties(await fetch(flask_module.ORDER_PARTIES_SQL, [order_id]), shop_owner=True)
+    denied = check_parties(request, parties[order_id]) if order_id in parties else None
+    return denied or json_response(await fetch(flask_module.ORDER_ITEMS_SQL, order_id))
+
+
+# ==============================
+# Order events (SSE)
+# ==============================
+# Same stream as /events in app.py, but an open connection here costs a
+# queue on the event loop instead of a worker thread.
+async def order_events(request):
+    denied = check_auth(request, owner="user_id", query_token=True)
+    if denied:
+        return denied
+    user_id = request.path_params["user_id"]
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=events.SSE_QUEUE_SIZE)
+
+    def put(event):
+        if not queue.full():
+            queue.put_nowait(event)
+
+    def deliver(event):
+        # called on the listener thread
+        loop.call_soon_threadsafe(put, event)
+
+    events.subscribe(user_id, deliver)
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), events.SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                else:
+                    yield events.sse_message(event)
+        finally:
+            events.unsubscribe(user_id, deliver)
+
+    headers = dict(flask_module.CORS_HEADERS, **{"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(generate(), headers=headers, media_type="text/event-stream")
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    # like the Flask app, nothing connects until the first request
+    yield
+    for label in list(_pools):
+        await _pools.pop(label).close()
+
+
+flask_wsgi = WSGIMiddleware(flask_app)
+app = Starlette(
+    routes=[get_catalog, get_orders, get_payments, get_distributor_orders, get_distributor_payments,
+            get_distributor_products, get_distributors, get_order_items,
+            Route("/events/{user_id:int}", order_events, methods=["GET"]),
+            Mount("/", flask_wsgi)],
+    lifespan=lifespan,
+)
@@ -0,0 +1,152 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+from functools import lru_cache, wraps
+
+from flask import g, jsonify, request
+
+# ==============================
+# Signed login tokens (HS256 JWT)
+# ==============================
+# /login issues a JWT signed with JWT_SECRET and carrying the user's id and
+# role. Requests are checked in-process, without touching the database:
+# - the HMAC check and claim parsing are cached per token string;
+# - each request still checks the expiry time.
+# Payloads look like the Node backend's ({"id", "role"}), so the two
+# backends accept each other's tokens when they share JWT_SECRET.
+JWT_SECRET = os.environ.get("JWT_SECRET", "")
+# seconds a token stays valid (the Node backend uses 2h)
+JWT_TTL = int(os.environ.get("JWT_TTL", "7200"))
+# AUTH_ENFORCE=0 lets unauthenticated/forbidden requests through and only
+# logs them, for rolling clients over to sending the token
+AUTH_ENFORCE = os.environ.get("AUTH_ENFORCE", "1") != "0"
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+
+if not JWT_SECRET:
+    # A random per-process secret means tokens issued by one worker are
+    # rejected by the others, and every restart logs everyone out. That is
+    # only tolerable while nothing is enforced.
+    if AUTH_ENFORCE:
+        raise RuntimeError("JWT_SECRET must be set when AUTH_ENFORCE is on")
+    JWT_SECRET = secrets.token_urlsafe(32)
+    print("⚠️ JWT_SECRET is not set; using a random per-process secret")
+
+_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
+
+class AuthError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _unb64(data):
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _sign(signing_input):
+    return _b64(hmac.new(JWT_SECRET.encode(), signing_input, hashlib.sha256).digest())
+
+
+def issue_token(user_id, role, ttl=None):
+    now = int(time.time())
+    claims = {"id": user_id, "role": role, "iat": now, "exp": now + (ttl or JWT_TTL)}
+    signing_input = _HEADER + b"." + _b64(json.dumps(claims, separators=(",", ":")).encode())
+    return (signing_input + b"." + _sign(signing_input)).decode()
+
+
+@lru_cache(maxsize=AUTH_CACHE_SIZE)
+def _decode(token):
+    # cached: a token is checked once per process, not once per request
+    try:
+        header, payload, signature = token.encode("ascii").split(b".")
+        if json.loads(_unb64(header)).get("alg") != "HS256":
+            raise ValueError
+        if not hmac.compare_digest(signature, _sign(header + b"." + payload)):
+            raise ValueError
+        claims = json.loads(_unb64(payload))
+        user_id, expires = claims["id"], claims.get("exp")
+        if not isinstance(user_id, int) or not (expires is None or isinstance(expires, (int, float))):
+            raise ValueError
+    except (ValueError, KeyError, TypeError, AttributeError, UnicodeError):
+        return None
+    return claims
+
+
+def role_key(role):
+    # "Shop Owner", "shop_owner" and "shopowner" are the same role
+    return re.sub(r"[^a-z]", "", (role or "").lower())
+
+
+def verify_token(token):
+    claims = _decode(token) if token else None
+    if claims is None:
+        raise AuthError(401, "Invalid or missing token")
+    if claims.get("exp") is not None and claims["exp"] < time.time():
+        raise AuthError(401, "Token expired")
+    return claims
+
+
+def authorize(authorization, token=None, role=None, owner_id=None):
+    # authorization: the Authorization header; token: fallback for clients
+    # that can't set headers (EventSource sends ?token=)
+    if authorization and authorization[:7].lower() == "bearer ":
+        token = authorization[7:].strip()
+    claims = verify_token(token)
+    if role and role_key(claims.get("role")) != role:
+        raise AuthError(403, "Insufficient privileges")
+    if owner_id is not None and claims["id"] != owner_id:
+        raise AuthError(403, "Not allowed for this user")
+    return claims
+
+
+def check_party(claims, user_ids):
+    # for records shared by several users (an order's shop and distributors)
+    if claims is not None and claims["id"] not in user_ids:
+        raise AuthError(403, "Not allowed for this user")
+
+
+def check_parties(user_ids):
+    # Flask side of check_party; None when allowed
+    try:
+        check_party(g.get("user"), user_ids)
+    except AuthError as e:
+        if not AUTH_ENFORCE:
+            print(f"⚠️ Auth not enforced: {request.method} {request.path}: {e.message}")
+            return None
+        return jsonify({"error": e.message}), e.status
+    return None
+
+
+def check_owner(user_id):
+    # for ids that arrive in the body rather than the URL; None when allowed
+    return check_parties((user_id,))
+
+
+def require_auth(role=None, owner=None, query_token=False):
+    # owner: name of the URL argument that must equal the token's user id
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                g.user = authorize(request.headers.get("Authorization"),
+                                   request.args.get("token") if query_token else None,
+                                   role, kwargs.get(owner) if owner else None)
+            except AuthError as e:
+                if AUTH_ENFORCE:
+                    return jsonify({"error": e.message}), e.status
+                print(f"⚠️ Auth not enforced: {request.method} {request.path}: {e.message}")
+                g.user = None
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
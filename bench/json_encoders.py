@@ -0,0 +1,78 @@
+"""Micro-benchmark: JSON encoding of a catalog-sized payload.
+
+    python bench/json_encoders.py [rows] [repeat]
+
+Compares Flask's stdlib provider with FreshCartJSONProvider on rows shaped
+like CATALOG_SQL / ORDERS_SQL output (str/int plus Decimal and datetime),
+and RealDictRow rows against the tuple + zip rows the list endpoints use.
+No database needed.
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from json_provider import FreshCartJSONProvider, orjson  # noqa: E402
+
+CATALOG_COLUMNS = ["category", "product", "subproduct_id", "subproduct", "variant_id",
+                   "brand", "price", "stock", "unit", "distributor_name"]
+ORDER_COLUMNS = ["order_id", "status", "payment_status", "order_date", "total_amount",
+                 "payment_state", "distributor_name"]
+
+
+def catalog_tuples(n, rng):
+    return [(f"Category {i % 12}", f"Product {i % 400}", i % 900, f"Sub {i % 900}", i,
+             rng.choice(["Amul", "Nestle", "Tata", None]), Decimal(rng.randint(100, 99999)) / 100,
+             rng.randint(0, 500), rng.choice(["kg", "pc", "l"]), f"Distributor {i % 40}")
+            for i in range(n)]
+
+
+def order_tuples(n, rng):
+    start = datetime(2024, 1, 1)
+    return [(i, rng.choice(["Pending", "Accepted", "Delivered"]), "Unpaid",
+             start + timedelta(minutes=37 * i), Decimal(rng.randint(100, 999999)) / 100,
+             "Pending", f"Distributor {i % 40}")
+            for i in range(n)]
+
+
+def bench(label, fn, repeat):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{label:<44} {best * 1000:9.2f} ms")
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(42)
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = FreshCartJSONProvider(app)
+    print(f"{rows} rows, best of {repeat}, orjson {'installed' if orjson else 'NOT installed'}")
+
+    for name, columns, tuples in (("catalog", CATALOG_COLUMNS, catalog_tuples(rows, rng)),
+                                  ("orders", ORDER_COLUMNS, order_tuples(rows, rng))):
+        real_dict = [RealDictRow(zip(columns, row)) for row in tuples]
+        dicts = [dict(zip(columns, row)) for row in tuples]
+        # both providers must produce the same document
+        assert stdlib.loads(stdlib.dumps(dicts)) == fast.loads(fast.dumps(dicts))
+
+        print(f"-- {name}")
+        bench("rows: RealDictRow", lambda: [RealDictRow(zip(columns, r)) for r in tuples], repeat)
+        bench("rows: tuple + dict(zip)", lambda: [dict(zip(columns, r)) for r in tuples], repeat)
+        base = bench("encode: stdlib provider", lambda: stdlib.dumps(real_dict, separators=(",", ":")),
+                     repeat)
+        best = bench("encode: FreshCartJSONProvider", lambda: fast.dumps(dicts, separators=(",", ":")),
+                     repeat)
+        print(f"{'speedup':<44} {base / best:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
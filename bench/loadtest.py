@@ -0,0 +1,378 @@
+"""Reproducible load test: seed a database, start the app, drive a mixed workload.
+
+    python bench/loadtest.py run [--database-url URL] [--scale small|medium|large]
+        [--server gunicorn|uvicorn] [--workers 4] [--clients 32] [--seconds 60]
+        [--seed 42] [--skip-seed] [--out FILE]
+    python bench/loadtest.py compare OLD.json NEW.json
+
+Without --database-url a throwaway cluster is created with initdb in a temp
+directory (initdb/pg_ctl from PATH or $PG_BIN; Postgres refuses to run as
+root) and removed afterwards. The schema is created with
+`flask --app app freshcart migrate` and the data with
+`flask --app app freshcart seed --seed N` (sizes from --scale), so two runs
+at the same scale and seed see the same data.
+
+Results (per-endpoint p50/p95/p99 and throughput of successful requests,
+4xx and error counts, plus git commit and settings) go to
+bench/results/<time>-<commit>.json unless --out is given; `compare` prints
+the per-endpoint change between two result files.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+import psycopg2
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+# options for `flask freshcart seed`; the rest use its defaults
+SCALES = {
+    "small": {"distributors": 20, "shops": 200, "products": 120, "variants": 2000, "orders": 20000},
+    "medium": {"distributors": 200, "shops": 2000, "products": 600, "variants": 10000, "orders": 200000},
+    "large": {"distributors": 500, "shops": 10000, "products": 3000, "variants": 50000, "orders": 1000000},
+}
+
+# endpoint name -> share of requests
+WORKLOAD = {
+    "catalog": 30,
+    "orders": 25,
+    "distributor_orders": 25,
+    "place_order": 10,
+    "update_status": 10,
+}
+
+
+# ==============================
+# Database
+# ==============================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def temp_cluster():
+    bin_dir = os.environ.get("PG_BIN") or os.path.dirname(shutil.which("initdb") or "")
+    if not bin_dir or not os.path.exists(os.path.join(bin_dir, "initdb")):
+        sys.exit("initdb not found: put it on PATH, set PG_BIN, or pass --database-url")
+    tmp = tempfile.mkdtemp(prefix="freshcart-bench-")
+    data, port = os.path.join(tmp, "data"), free_port()
+    try:
+        subprocess.run([os.path.join(bin_dir, "initdb"), "-D", data, "-U", "postgres", "-A", "trust",
+                        "-E", "UTF8", "--no-locale"], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-w", "-l", os.path.join(tmp, "log"),
+                        "-o", f"-p {port} -k {tmp} -c listen_addresses=127.0.0.1 -c fsync=off"
+                              " -c synchronous_commit=off -c max_connections=200",
+                        "start"], check=True, stdout=subprocess.DEVNULL)
+        conn = psycopg2.connect(f"postgresql://postgres@127.0.0.1:{port}/postgres")
+        conn.autocommit = True
+        conn.cursor().execute("CREATE DATABASE freshcart_bench")
+        conn.close()
+        yield f"postgresql://postgres@127.0.0.1:{port}/freshcart_bench"
+    finally:
+        subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-m", "fast", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def flask_cli(url, *args):
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "freshcart", *args],
+                   cwd=ROOT, env=dict(os.environ, DATABASE_URL=url), check=True)
+
+
+def seed(url, scale, seed_value):
+    conn = psycopg2.connect(url)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM Orders")
+        if cur.fetchone()[0]:
+            sys.exit("database already has orders; use an empty database or --skip-seed")
+    finally:
+        conn.close()
+    options = [f"--{key}={value}" for key, value in SCALES[scale].items()]
+    flask_cli(url, "seed", f"--seed={seed_value}", *options)
+
+
+def dataset(url):
+    # ids the workload draws from, and table sizes for the results file
+    conn = psycopg2.connect(url)
+    try:
+        cur = conn.cursor()
+        counts = {}
+        for table in ("Users", "Product_Variants", "Orders", "Order_Items", "Payments"):
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table.lower()] = cur.fetchone()[0]
+        cur.execute("SELECT user_id FROM Users WHERE role = 'shop_owner' ORDER BY user_id")
+        shops = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT DISTINCT distributor_id FROM Product_Variants ORDER BY 1")
+        distributors = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT variant_id FROM Product_Variants ORDER BY variant_id")
+        variants = [r[0] for r in cur.fetchall()]
+        # each pending order with a distributor allowed to update it
+        cur.execute("""
+            SELECT o.order_id, MIN(d.distributor_id)
+            FROM Orders o
+            JOIN Distributor_Orders d ON d.order_id = o.order_id
+            WHERE o.status = 'Pending'
+            GROUP BY o.order_id
+            ORDER BY o.order_id
+        """)
+        pending = [tuple(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+    return counts, {"shops": shops, "distributors": distributors, "variants": variants, "pending": pending}
+
+
+# ==============================
+# Workload
+# ==============================
+class Workload:
+    def __init__(self, ids, seed_value):
+        self.ids = ids
+        self.seed = seed_value
+        self.pending = list(ids["pending"])
+        random.Random(seed_value).shuffle(self.pending)
+        self.lock = threading.Lock()
+        # minted here with the server's JWT_SECRET instead of one /login each
+        sys.path.insert(0, ROOT)
+        import auth
+        self.tokens = {user_id: auth.issue_token(user_id, "shop_owner", ttl=86400) for user_id in ids["shops"]}
+        self.tokens.update({user_id: auth.issue_token(user_id, "distributor", ttl=86400)
+                            for user_id in ids["distributors"]})
+
+    def next_pending(self):
+        with self.lock:
+            return self.pending.pop() if self.pending else None
+
+    def request(self, rng, name):
+        # (method, path, JSON body, acting user), or None once there is
+        # nothing left to send for this endpoint
+        ids = self.ids
+        if name == "catalog":
+            return "GET", "/catalog", None, None
+        if name == "orders":
+            shop = rng.choice(ids["shops"])
+            return "GET", f"/orders/{shop}?limit=50", None, shop
+        if name == "distributor_orders":
+            # busy distributors are polled more, like the real dashboards
+            distributor = ids["distributors"][int(len(ids["distributors"]) * rng.random() ** 3)]
+            return "GET", f"/distributor/orders/{distributor}?limit=50", None, distributor
+        if name == "place_order":
+            cart = [{"variant_id": rng.choice(ids["variants"]), "quantity": rng.randint(1, 3)}
+                    for _ in range(rng.randint(1, 4))]
+            shop = rng.choice(ids["shops"])
+            return "POST", "/place_order", {"user_id": shop, "cart": cart}, shop
+        # accept each seeded pending order once, as a distributor it belongs to
+        pending = self.next_pending()
+        if pending is None:
+            return None
+        order_id, owner = pending
+        return "PUT", f"/distributor/update_status/{order_id}", {"status": "accepted"}, owner
+
+
+def client(port, workload, index, stop, results):
+    rng = random.Random(workload.seed * 1000 + index)
+    names, weights = zip(*WORKLOAD.items())
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while not stop.is_set():
+        name = rng.choices(names, weights)[0]
+        request = workload.request(rng, name)
+        if request is None:
+            continue
+        method, path, body, user_id = request
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        if user_id is not None:
+            headers["Authorization"] = f"Bearer {workload.tokens[user_id]}"
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = None
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        results.append((name, time.perf_counter() - started, status))
+
+
+def wait_ready(port, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit("server exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("server did not come up")
+
+
+def summarize(samples, seconds):
+    # only successful responses count towards throughput and latency: a 403
+    # or 409 is cheaper than the write it stands in for. 4xx are reported
+    # separately; connection failures and 5xx are errors.
+    latencies = sorted(s[1] for s in samples if s[2] is not None and s[2] < 400)
+    rejected = sum(1 for s in samples if s[2] is not None and 400 <= s[2] < 500)
+    errors = sum(1 for s in samples if s[2] is None or s[2] >= 500)
+    summary = {"requests": len(samples), "client_errors": rejected, "errors": errors,
+               "throughput_rps": round(len(latencies) / seconds, 1)}
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+        summary.update(p50_ms=round(q[49] * 1000, 2), p95_ms=round(q[94] * 1000, 2),
+                       p99_ms=round(q[98] * 1000, 2), max_ms=round(latencies[-1] * 1000, 2))
+    statuses = {}
+    for s in samples:
+        statuses[str(s[2])] = statuses.get(str(s[2]), 0) + 1
+    summary["statuses"] = statuses
+    return summary
+
+
+def drive(url, args, ids):
+    port = free_port()
+    if args.server == "uvicorn":
+        cmd = ["uvicorn", "asgi:app", "--workers", str(args.workers), "--port", str(port),
+               "--no-access-log", "--log-level", "warning"]
+    else:
+        cmd = ["gunicorn", "app:app", "--workers", str(args.workers), "--threads", str(args.threads),
+               "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+    env = dict(os.environ, DATABASE_URL=url)
+    server = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_ready(port, server)
+        workload = Workload(ids, args.seed)
+        results, stop = [], threading.Event()
+        threads = [threading.Thread(target=client, args=(port, workload, i, stop, results))
+                   for i in range(args.clients)]
+        # warm the pools and the catalog cache before measuring
+        for t in threads:
+            t.start()
+        time.sleep(args.warmup)
+        del results[:]
+        started = time.perf_counter()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        if not workload.pending:
+            print("⚠️ Ran out of pending orders; update_status stopped before the end of the run")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    endpoints = {name: summarize([s for s in results if s[0] == name], elapsed) for name in WORKLOAD}
+    return {"total": summarize(results, elapsed), "endpoints": endpoints, "elapsed_s": round(elapsed, 2)}
+
+
+def git_info():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def run(args):
+    # shared by the server processes and the tokens minted in Workload
+    os.environ.setdefault("JWT_SECRET", secrets.token_urlsafe(32))
+    with (nullcontext(args.database_url) if args.database_url else temp_cluster()) as url:
+        if not args.skip_seed:
+            print("🔧 Migrating")
+            flask_cli(url, "migrate")
+            print(f"🔧 Seeding ({args.scale}, seed {args.seed})")
+            seed(url, args.scale, args.seed)
+        counts, ids = dataset(url)
+        print(f"🔧 Dataset: {counts}")
+        print(f"🚀 {args.server} x{args.workers}, {args.clients} clients, {args.seconds:g}s")
+        measured = drive(url, args, ids)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_info(),
+        "config": {k: getattr(args, k) for k in ("scale", "seed", "server", "workers", "threads",
+                                                   "clients", "seconds", "warmup")},
+        "dataset": counts,
+        **measured,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{(result['git']['commit'] or 'nogit')[:8]}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\n{'endpoint':<20}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'4xx':>8}{'errors':>8}")
+    for name, s in list(result["endpoints"].items()) + [("TOTAL", result["total"])]:
+        print(f"{name:<20}{s['throughput_rps']:>9}{s.get('p50_ms', '-'):>10}{s.get('p95_ms', '-'):>10}"
+              f"{s.get('p99_ms', '-'):>10}{s['client_errors']:>8}{s['errors']:>8}")
+    if result["total"]["client_errors"]:
+        print("⚠️ Some requests got 4xx responses; they are left out of req/s and the latency percentiles")
+    print(f"\n✅ Results written to {out}")
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"old {old['git']['commit'] and old['git']['commit'][:8]}  new {new['git']['commit'] and new['git']['commit'][:8]}")
+    print(f"{'endpoint':<20}{'metric':<16}{'old':>10}{'new':>10}{'change':>9}")
+    rows = list(new["endpoints"].items()) + [("TOTAL", new["total"])]
+    for name, n in rows:
+        o = old["total"] if name == "TOTAL" else old["endpoints"].get(name, {})
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "client_errors", "errors"):
+            a, b = o.get(metric), n.get(metric)
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+            print(f"{name:<20}{metric:<16}{str(a):>10}{str(b):>10}{change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--database-url")
+    r.add_argument("--scale", choices=SCALES, default="small")
+    r.add_argument("--server", choices=("gunicorn", "uvicorn"), default="gunicorn")
+    r.add_argument("--workers", type=int, default=4)
+    r.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    r.add_argument("--clients", type=int, default=32)
+    r.add_argument("--seconds", type=float, default=60)
+    r.add_argument("--warmup", type=float, default=5)
+    r.add_argument("--seed", type=int, default=42)
+    r.add_argument("--skip-seed", action="store_true", help="reuse an already seeded --database-url")
+    r.add_argument("--out")
+    c = sub.add_parser("compare")
+    c.add_argument("old")
+    c.add_argument("new")
+    args = parser.parse_args()
+    (run if args.command == "run" else compare)(args)
+
+
+if __name__ == "__main__":
+    main()
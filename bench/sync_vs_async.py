@@ -0,0 +1,120 @@
+"""Load-test the polled read endpoints: gunicorn (sync) vs uvicorn (asgi.py).
+
+    DATABASE_URL=... python bench/sync_vs_async.py [--workers 2] [--clients 64]
+        [--seconds 15] [--user 1] [--distributor 2]
+
+Starts each server on a local port with the same worker count, hammers
+/orders/<user>, /distributor/orders/<distributor> and /catalog from
+--clients keep-alive connections, and prints throughput and latency
+percentiles. Seed the database first (any shop owner/distributor with a few
+hundred orders makes the difference visible). Both servers get the same
+JWT_SECRET and the requests carry tokens minted with it.
+"""
+import argparse
+import http.client
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SERVERS = {
+    "gunicorn (sync)": ["gunicorn", "app:app", "--workers", "{workers}", "--bind", "127.0.0.1:{port}"],
+    "uvicorn (asgi)": ["uvicorn", "asgi:app", "--workers", "{workers}", "--port", "{port}",
+                       "--no-access-log", "--log-level", "warning"],
+}
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not come up")
+
+
+def client(port, paths, stop, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    i = 0
+    while not stop.is_set():
+        path, headers = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def bearer(user_id, role):
+    import auth
+    return {"Authorization": f"Bearer {auth.issue_token(user_id, role)}"}
+
+
+def run(name, command, args, port):
+    cmd = [part.format(workers=args.workers, port=port) for part in command]
+    server = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        paths = [(f"/orders/{args.user}", bearer(args.user, "shop_owner")),
+                 (f"/distributor/orders/{args.distributor}", bearer(args.distributor, "distributor")),
+                 ("/catalog", {})]
+        latencies, errors, stop = [], [], threading.Event()
+        threads = [threading.Thread(target=client, args=(port, paths, stop, latencies, errors))
+                   for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    if not latencies:
+        print(f"{name:<18} no successful requests ({len(errors)} errors)")
+        return
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{name:<18} {len(latencies) / args.seconds:9.0f} req/s   p50 {q[49] * 1000:7.1f} ms"
+          f"   p95 {q[94] * 1000:7.1f} ms   p99 {q[98] * 1000:7.1f} ms   errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--user", type=int, default=1)
+    parser.add_argument("--distributor", type=int, default=2)
+    args = parser.parse_args()
+    if not os.environ.get("DATABASE_URL"):
+        sys.exit("DATABASE_URL is not set")
+    os.environ.setdefault("JWT_SECRET", secrets.token_urlsafe(32))
+    sys.path.insert(0, ROOT)
+
+    print(f"{args.workers} workers, {args.clients} clients, {args.seconds:g}s per server")
+    for port, (name, command) in enumerate(SERVERS.items(), start=8701):
+        run(name, command, args, port)
+
+
+if __name__ == "__main__":
+    main()
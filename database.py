@@ -1,22 +1,329 @@
-import mysql.connector
-
-def get_db_connection():
-    connection = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="yourpassword",   # 🔒 Replace with your MySQL Workbench password
-        database="fresh_cart"      # Replace with your DB name
-    )
-    return connection
-
-import mysql.connector
-
-def get_db_connection():
-    connection = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="yourpassword",   # 🔒 Replace with your MySQL Workbench password
-        database="fresh_cart"      # Replace with your DB name
-    )
-    return connection
+import os
+import threading
+import time
+from contextlib import contextmanager
 
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from flask import g
+
+from metrics import observe_query
+
+# ==============================
+# Connection pool (Render Postgres)
+# ==============================
+DATABASE_URL = os.environ.get("DATABASE_URL")
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+# seconds a request waits for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# connections idle longer than this are pinged before being handed out
+PING_AFTER = float(os.environ.get("DB_POOL_PING_AFTER", "30"))
+# bounds how long the first request blocks when Postgres is unreachable
+CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+
+# Optional streaming replica for the read-only routes (see read_replica in
+# app.py). Unset, every query goes to DATABASE_URL as before.
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL")
+# a user who wrote less than this many seconds ago reads from the primary
+READ_AFTER_WRITE = float(os.environ.get("DB_READ_AFTER_WRITE", "5"))
+# replica reads are skipped while its replay lags further behind than this
+REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+# seconds between replica lag checks (per worker)
+REPLICA_LAG_CHECK_EVERY = 1.0
+
+_last_used = {}
+_recent_writers = {}
+_recent_writers_lock = threading.Lock()
+_replica_lag = {"checked": 0.0, "lagging": False}
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class _TimedExecute:
+    # reports every statement to metrics (query count/DB time per request,
+    # slow-query log)
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_query(query, vars, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_query(query, None, time.perf_counter() - started)
+
+
+class InstrumentedCursor(_TimedExecute, psycopg2.extensions.cursor):
+    pass
+
+
+class InstrumentedDictCursor(_TimedExecute, psycopg2.extras.RealDictCursor):
+    pass
+
+
+class FreshCartConnection(psycopg2.extensions.connection):
+    # Remembers which statements were PREPAREd on this session (see
+    # run_query in app.py). They survive rollbacks and die with the
+    # connection, so a replaced connection starts with an empty set.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = InstrumentedCursor
+        # the _Pool (primary or replica) it was checked out from
+        self.pool = None
+        # while hold_commit is set, commit() only notes the request in
+        # commit_held: idempotent() in app.py holds the handler's commit
+        # until its response is stored in the same transaction
+        self.hold_commit = False
+        self.commit_held = False
+
+    def commit(self):
+        if self.hold_commit:
+            self.commit_held = True
+            return
+        super().commit()
+
+
+class _Pool:
+    def __init__(self, label, url):
+        self.label = label
+        self.url = url
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(POOL_MAX)
+
+    def init(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = psycopg2.pool.ThreadedConnectionPool(
+                    POOL_MIN, POOL_MAX, self.url,
+                    connection_factory=FreshCartConnection,
+                    connect_timeout=CONNECT_TIMEOUT,
+                    # let the OS notice when Render silently drops an idle socket
+                    keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+                )
+                print(f"✅ Connected to Render PostgreSQL {self.label} (pool {POOL_MIN}-{POOL_MAX})")
+        return self.pool
+
+
+_primary = _Pool("primary", DATABASE_URL)
+_replica = _Pool("replica", DATABASE_READ_URL) if DATABASE_READ_URL else None
+
+
+def init_pool():
+    return _primary.init()
+
+
+def _healthy(conn):
+    if conn.closed:
+        return False
+    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _checkout(target=_primary):
+    if not target.slots.acquire(timeout=POOL_TIMEOUT):
+        raise DatabaseUnavailable("Timed out waiting for a database connection")
+    try:
+        pool = target.init()
+        # a dead connection is discarded and replaced once; a second failure
+        # means the server itself is unreachable
+        for _ in range(2):
+            conn = pool.getconn()
+            if _healthy(conn):
+                conn.pool = target
+                return conn
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise DatabaseUnavailable("Could not get a healthy database connection")
+    except DatabaseUnavailable:
+        target.slots.release()
+        raise
+    except Exception as e:
+        target.slots.release()
+        raise DatabaseUnavailable(str(e)) from e
+
+
+def _release(conn):
+    target = conn.pool
+    try:
+        if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pass
+    try:
+        if conn.closed:
+            _last_used.pop(id(conn), None)
+            target.pool.putconn(conn, close=True)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            target.pool.putconn(conn)
+    finally:
+        target.slots.release()
+
+
+@contextmanager
+def pooled_connection(replica=False):
+    """Check a connection out for work outside a request (schema setup, scripts)."""
+    conn = _checkout_read() if replica else _checkout()
+    try:
+        yield conn
+    finally:
+        _release(conn)
+
+
+# ==============================
+# Read replica routing
+# ==============================
+# Read-only routes ask for the replica; they get the primary instead when
+# no replica is configured, when it is unreachable or lagging, or when the
+# request's user wrote within READ_AFTER_WRITE seconds (read-your-writes).
+# note_write() records those users per worker process; the app also sets a
+# short-lived cookie on writes so the guard holds when the next read lands
+# on another worker.
+def note_write(user_ids):
+    if _replica is None:
+        return
+    now = time.monotonic()
+    with _recent_writers_lock:
+        if len(_recent_writers) > 10000:
+            for user_id, at in list(_recent_writers.items()):
+                if now - at >= READ_AFTER_WRITE:
+                    del _recent_writers[user_id]
+        for user_id in user_ids:
+            if user_id is not None:
+                _recent_writers[user_id] = now
+
+
+def recently_wrote(user_ids):
+    now = time.monotonic()
+    with _recent_writers_lock:
+        return any(now - _recent_writers.get(user_id, -READ_AFTER_WRITE) < READ_AFTER_WRITE
+                   for user_id in user_ids)
+
+
+def replica_lag_due():
+    return time.monotonic() - _replica_lag["checked"] >= REPLICA_LAG_CHECK_EVERY
+
+
+def record_replica_lag(seconds):
+    # seconds is None when the server isn't a standby at all
+    lagging = seconds is not None and seconds > REPLICA_MAX_LAG
+    if lagging and not _replica_lag["lagging"]:
+        print(f"⚠️ Read replica is {seconds:.1f}s behind, reading from the primary")
+    _replica_lag.update(checked=time.monotonic(), lagging=lagging)
+
+
+def skip_replica(reason):
+    # treated like lag: reads go to the primary until the next check is due
+    print("⚠️ Read replica unavailable, reading from the primary:", reason)
+    _replica_lag.update(checked=time.monotonic(), lagging=True)
+
+
+# 0 when the standby has replayed everything it received (an idle primary
+# has no new transactions to show, so replay time alone would look stale)
+REPLICA_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float END
+"""
+
+
+def _checkout_read():
+    if _replica is None or (_replica_lag["lagging"] and not replica_lag_due()):
+        return _checkout()
+    try:
+        conn = _checkout(_replica)
+    except DatabaseUnavailable as e:
+        skip_replica(e)
+        return _checkout()
+    if replica_lag_due():
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_SQL)
+                record_replica_lag(cur.fetchone()[0])
+            conn.rollback()
+        except psycopg2.Error as e:
+            skip_replica(e)
+        if _replica_lag["lagging"]:
+            _release(conn)
+            return _checkout()
+    return conn
+
+
+# ==============================
+# Per-request checkout
+# ==============================
+def get_db():
+    # g.use_replica is set by read-only routes; they never write
+    if "db" not in g:
+        g.db = _checkout_read() if g.get("use_replica") else _checkout()
+    return g.db
+
+
+def get_cursor():
+    if "cursor" not in g:
+        g.cursor = get_db().cursor(cursor_factory=InstrumentedDictCursor)
+    return g.cursor
+
+
+def get_tuple_cursor():
+    # Plain tuple rows for the hot list queries: building a RealDictRow per
+    # row costs more than zipping the column names on afterwards.
+    if "tuple_cursor" not in g:
+        g.tuple_cursor = get_db().cursor()
+    return g.tuple_cursor
+
+
+def dict_rows(cursor, rows):
+    columns = [col.name for col in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def iter_batches(sql, params, size, replica=False):
+    # Server-side (named) cursor read `size` rows at a time, so a large result
+    # never sits in worker memory. It runs on its own pooled connection, not
+    # g.db: Flask tears the request down (close_db) before a streamed
+    # response body is iterated.
+    with pooled_connection(replica) as conn:
+        cursor = conn.cursor(name="freshcart_stream")
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    return
+                yield dict_rows(cursor, rows)
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                pass
+
+
+def close_db(exc=None):
+    # Anything a handler left open (error paths included) is rolled back here
+    # before the connection goes back to the pool.
+    cursors = [g.pop("cursor", None), g.pop("tuple_cursor", None)]
+    conn = g.pop("db", None)
+    for cursor in cursors:
+        if cursor is not None and not cursor.closed:
+            cursor.close()
+    if conn is not None:
+        _release(conn)
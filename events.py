@@ -0,0 +1,123 @@
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from database import CONNECT_TIMEOUT, DATABASE_URL, note_write
+
+# ==============================
+# Order change notifications (LISTEN/NOTIFY)
+# ==============================
+# Write paths call publish_order_events() inside their transaction, so
+# Postgres delivers the event only if (and when) the write commits. Each
+# worker process runs one listener thread on its own connection and fans
+# events out to the SSE subscribers of the shop owner and distributors
+# involved in the order.
+CHANNEL = "freshcart_events"
+# seconds between SSE keepalive comments (proxies drop idle streams)
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "15"))
+# events buffered per subscriber; a client that falls further behind loses
+# events and should refetch its lists when it reconnects
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+
+PUBLISH_SQL = """
+    SELECT pg_notify(%s, json_build_object(
+        'type', %s,
+        'order_id', order_id,
+        'user_id', user_id,
+        'distributor_ids', distributor_ids,
+        'status', status,
+        'payment_status', payment_status,
+        'payment_state', payment_state
+    )::text)
+    FROM Order_Summaries
+    WHERE order_id = ANY(%s)
+"""
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+_listener = None
+
+
+def publish_order_events(cursor, order_ids, kind):
+    # reads Order_Summaries, so call it after refresh_order_summaries()
+    if order_ids:
+        cursor.execute(PUBLISH_SQL, (CHANNEL, kind, list(order_ids)))
+
+
+def subscribe(user_id, deliver):
+    # deliver(event) is called from the listener thread and must not block
+    start_listener()
+    with _subscribers_lock:
+        _subscribers.setdefault(user_id, set()).add(deliver)
+
+
+def unsubscribe(user_id, deliver):
+    with _subscribers_lock:
+        targets = _subscribers.get(user_id)
+        if targets:
+            targets.discard(deliver)
+            if not targets:
+                del _subscribers[user_id]
+
+
+def _dispatch(payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    parties = {event.get("user_id"), *(event.get("distributor_ids") or [])}
+    # every worker hears every event, so all of them route these users'
+    # next reads to the primary (see read replica routing in database.py)
+    note_write(parties)
+    with _subscribers_lock:
+        targets = [d for party in parties for d in _subscribers.get(party, ())]
+    for deliver in targets:
+        deliver(event)
+
+
+def _listen_forever():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL, connect_timeout=CONNECT_TIMEOUT,
+                                    keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            print(f"✅ Listening for {CHANNEL}")
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    # nothing for a while; make sure the socket is still alive
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0).payload)
+        except Exception as e:
+            # events published while we reconnect are lost; clients refetch
+            # on reconnect, so this only delays their view
+            print("❌ Event listener error:", e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+        finally:
+            if conn is not None and not conn.closed:
+                conn.close()
+
+
+def start_listener():
+    global _listener
+    with _subscribers_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen_forever, name="freshcart-events", daemon=True)
+            _listener.start()
+
+
+def sse_message(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
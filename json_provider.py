@@ -0,0 +1,51 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # plain stdlib json still works, just slower
+    orjson = None
+
+# ==============================
+# JSON provider (orjson when installed)
+# ==============================
+# Rows coming out of psycopg2 are mostly str/int plus Decimal (price,
+# amount, total_amount) and datetime (order_date, payment_date). orjson
+# encodes the plain types in C; Decimal and datetime are handed back to
+# Flask's own default hook so the output matches the stdlib provider
+# exactly (Decimal -> "12.50", datetime -> "Sat, 17 Oct 2026 18:50:21 GMT").
+if orjson is not None:
+    ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+                      | orjson.OPT_NON_STR_KEYS)
+
+
+class FreshCartJSONProvider(DefaultJSONProvider):
+
+    def _fast(self, kwargs):
+        # orjson output is always compact, so only calls that ask for the
+        # defaults (or compact separators) take the fast path
+        return orjson is not None and set(kwargs) <= {"separators"} \
+            and kwargs.get("separators", (",", ":")) == (",", ":")
+
+    def dumps(self, obj, **kwargs):
+        if self._fast(kwargs):
+            try:
+                return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+            except orjson.JSONEncodeError:
+                pass  # e.g. ints beyond 64 bits; the stdlib handles those
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default,
+                                option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+
+# ==============================
+# Request / DB metrics (Prometheus text on /metrics)
+# ==============================
+# Every cursor handed out by database.py reports its queries here. Per
+# request we keep the query count, DB time and how often each normalized
+# statement ran; per route we keep latency, DB count/time and response size
+# histograms plus request and error counters. Numbers are per process: with
+# several gunicorn workers, scrape each one (or aggregate in Prometheus).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# the same statement this many times in one request is logged as a likely
+# N+1 loop
+REPEATED_QUERY_THRESHOLD = int(os.environ.get("REPEATED_QUERY_THRESHOLD", "10"))
+
+HELP = {
+    "freshcart_requests_total": ("counter", "Requests by route, method and status."),
+    "freshcart_request_errors_total": ("counter", "Requests that ended with a 5xx status."),
+    "freshcart_request_duration_seconds": ("histogram", "Request latency until the response is returned."),
+    "freshcart_request_db_queries": ("histogram", "Database queries issued per request."),
+    "freshcart_request_db_seconds": ("histogram", "Time spent in database calls per request."),
+    "freshcart_response_size_bytes": ("histogram", "Response body size (streamed responses excluded)."),
+    "freshcart_db_query_duration_seconds": ("histogram", "Duration of individual database queries."),
+    "freshcart_slow_queries_total": ("counter", "Queries slower than SLOW_QUERY_MS."),
+    "freshcart_repeated_query_requests_total": ("counter", "Requests that ran one statement REPEATED_QUERY_THRESHOLD+ times."),
+}
+
+_lock = threading.Lock()
+_counters = Counter()
+_histograms = {}
+_request = ContextVar("freshcart_request_metrics", default=None)
+
+_COMMENT = re.compile(r"--[^\n]*")
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    sql = _LITERAL.sub("?", _PARAM.sub("?", _COMMENT.sub("", sql)))
+    return _SPACE.sub(" ", sql).strip()
+
+
+def _inc(name, labels, amount=1):
+    with _lock:
+        _counters[(name, labels)] += amount
+
+
+def _observe(name, labels, value, buckets):
+    with _lock:
+        hist = _histograms.get((name, labels))
+        if hist is None:
+            hist = _histograms[(name, labels)] = {"le": buckets, "counts": [0] * len(buckets),
+                                                  "sum": 0.0, "count": 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist["counts"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+
+def observe_query(sql, params, seconds):
+    sql = sql if isinstance(sql, str) else sql.decode() if isinstance(sql, bytes) else str(sql)
+    normalized = normalize_sql(sql)
+    _observe("freshcart_db_query_duration_seconds", (), seconds, LATENCY_BUCKETS)
+    stats = _request.get()
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_seconds"] += seconds
+        stats["statements"][normalized] += 1
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _inc("freshcart_slow_queries_total", ())
+        print(f"🐢 Slow query {seconds * 1000:.1f} ms ({len(params or ())} params): {normalized[:500]}")
+
+
+def start_request():
+    _request.set({"started": time.perf_counter(), "queries": 0, "db_seconds": 0.0,
+                  "statements": Counter()})
+
+
+def finish_request(route, method, status, size):
+    stats = _request.get()
+    if stats is None:
+        return
+    _request.set(None)
+    labels = (("route", route), ("method", method))
+    _inc("freshcart_requests_total", labels + (("status", str(status)),))
+    if status >= 500:
+        _inc("freshcart_request_errors_total", labels)
+    _observe("freshcart_request_duration_seconds", labels, time.perf_counter() - stats["started"],
+             LATENCY_BUCKETS)
+    _observe("freshcart_request_db_queries", labels, stats["queries"], QUERY_COUNT_BUCKETS)
+    _observe("freshcart_request_db_seconds", labels, stats["db_seconds"], LATENCY_BUCKETS)
+    if size is not None:
+        _observe("freshcart_response_size_bytes", labels, size, SIZE_BUCKETS)
+    repeated = [(sql, n) for sql, n in stats["statements"].items() if n >= REPEATED_QUERY_THRESHOLD]
+    if repeated:
+        _inc("freshcart_repeated_query_requests_total", labels)
+        for sql, n in repeated:
+            print(f"🔁 {method} {route} ran the same query {n} times: {sql[:300]}")
+
+
+def _labels(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_metrics():
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(h, counts=list(h["counts"]))) for key, h in _histograms.items())
+    lines, seen = [], set()
+
+    def header(name):
+        if name not in seen:
+            seen.add(name)
+            kind, text = HELP[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name)
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), hist in histograms:
+        header(name)
+        for bound, count in zip(hist["le"], hist["counts"]):
+            lines.append(f"{name}_bucket{_labels(labels, (('le', f'{bound:g}'),))} {count}")
+        lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {hist['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {hist['sum']:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
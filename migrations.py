@@ -0,0 +1,565 @@
+import psycopg2
+
+# ==============================
+# Versioned schema migrations
+# ==============================
+# Each migration runs once, in its own transaction, and is recorded in
+# schema_migrations. A step is either SQL text or a callable(cursor).
+# Append new migrations; never edit one that has shipped.
+
+# pg_advisory_lock key so workers booting together don't migrate twice
+MIGRATION_LOCK_ID = 727001
+
+BASELINE = [
+    # USERS
+    """
+    CREATE TABLE IF NOT EXISTS Users (
+        user_id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        contact_no VARCHAR(20),
+        address TEXT
+    )
+    """,
+    # CATEGORIES
+    """
+    CREATE TABLE IF NOT EXISTS Categories (
+        category_id SERIAL PRIMARY KEY,
+        name VARCHAR(100) UNIQUE NOT NULL
+    )
+    """,
+    # PRODUCTS
+    """
+    CREATE TABLE IF NOT EXISTS Products (
+        product_id SERIAL PRIMARY KEY,
+        category_id INT REFERENCES Categories(category_id),
+        name VARCHAR(100) NOT NULL,
+        image_url TEXT
+    )
+    """,
+    # SUBPRODUCTS
+    """
+    CREATE TABLE IF NOT EXISTS SubProducts (
+        subproduct_id SERIAL PRIMARY KEY,
+        product_id INT REFERENCES Products(product_id),
+        name VARCHAR(100) NOT NULL
+    )
+    """,
+    # PRODUCT VARIANTS
+    """
+    CREATE TABLE IF NOT EXISTS Product_Variants (
+        variant_id SERIAL PRIMARY KEY,
+        subproduct_id INT REFERENCES SubProducts(subproduct_id),
+        distributor_id INT REFERENCES Users(user_id),
+        brand VARCHAR(100),
+        unit VARCHAR(20),
+        price DECIMAL,
+        stock INT
+    )
+    """,
+    # ORDERS
+    """
+    CREATE TABLE IF NOT EXISTS Orders (
+        order_id SERIAL PRIMARY KEY,
+        user_id INT REFERENCES Users(user_id),
+        status VARCHAR(50) DEFAULT 'Pending',
+        payment_status VARCHAR(50) DEFAULT 'Unpaid',
+        order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        total_amount DECIMAL
+    )
+    """,
+    # set once the order's quantities have been taken out of stock
+    """
+    ALTER TABLE Orders
+    ADD COLUMN IF NOT EXISTS stock_reserved BOOLEAN NOT NULL DEFAULT FALSE
+    """,
+    # PAYMENTS
+    """
+    CREATE TABLE IF NOT EXISTS Payments (
+        payment_id SERIAL PRIMARY KEY,
+        order_id INT REFERENCES Orders(order_id),
+        amount DECIMAL,
+        status VARCHAR(50),
+        payment_method VARCHAR(50),
+        payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # ORDER ITEMS
+    """
+    CREATE TABLE IF NOT EXISTS Order_Items (
+        order_item_id SERIAL PRIMARY KEY,
+        order_id INT REFERENCES Orders(order_id),
+        variant_id INT REFERENCES Product_Variants(variant_id),
+        quantity INT,
+        price DECIMAL
+    )
+    """,
+]
+
+# Every hot join/filter column, plus the expression lookups used by
+# get_distributors (LOWER(role)) and add_product (LOWER(Categories.name)).
+LOOKUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_user ON Orders (user_id, order_date DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON Order_Items (order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_variant ON Order_Items (variant_id)",
+    "CREATE INDEX IF NOT EXISTS idx_variants_distributor ON Product_Variants (distributor_id)",
+    "CREATE INDEX IF NOT EXISTS idx_variants_subproduct ON Product_Variants (subproduct_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_order ON Payments (order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_lower_role ON Users (LOWER(role))",
+    "CREATE INDEX IF NOT EXISTS idx_categories_lower_name ON Categories (LOWER(name))",
+]
+
+# Products and subproducts are unique by name within their parent so they
+# can be upserted. Duplicates created before the constraint existed are
+# folded into the lowest id first, re-pointing their children.
+UNIQUE_NAMES = [
+    """
+    CREATE TEMP TABLE product_dupes ON COMMIT DROP AS
+    SELECT product_id, keep_id FROM (
+        SELECT product_id, MIN(product_id) OVER (PARTITION BY category_id, name) AS keep_id
+        FROM Products
+    ) d
+    WHERE product_id <> keep_id
+    """,
+    """
+    UPDATE SubProducts sp SET product_id = d.keep_id
+    FROM product_dupes d WHERE sp.product_id = d.product_id
+    """,
+    "DELETE FROM Products p USING product_dupes d WHERE p.product_id = d.product_id",
+    """
+    CREATE TEMP TABLE subproduct_dupes ON COMMIT DROP AS
+    SELECT subproduct_id, keep_id FROM (
+        SELECT subproduct_id, MIN(subproduct_id) OVER (PARTITION BY product_id, name) AS keep_id
+        FROM SubProducts
+    ) d
+    WHERE subproduct_id <> keep_id
+    """,
+    """
+    UPDATE Product_Variants v SET subproduct_id = d.keep_id
+    FROM subproduct_dupes d WHERE v.subproduct_id = d.subproduct_id
+    """,
+    "DELETE FROM SubProducts sp USING subproduct_dupes d WHERE sp.subproduct_id = d.subproduct_id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_products_category_name ON Products (category_id, name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_subproducts_product_name ON SubProducts (product_id, name)",
+]
+
+# One precomputed row per order for the shop-owner and distributor order
+# lists, plus a (distributor, order) link table so distributor lists are an
+# index range scan too. refresh_order_summaries(ids) rebuilds the rows for
+# the given orders; the app calls it in the same transaction as every
+# write that changes what the lists show.
+ORDER_SUMMARIES = [
+    """
+    CREATE TABLE IF NOT EXISTS Order_Summaries (
+        order_id INT PRIMARY KEY REFERENCES Orders(order_id),
+        user_id INT,
+        shop_owner VARCHAR(100),
+        order_date TIMESTAMP,
+        status VARCHAR(50),
+        payment_status VARCHAR(50),
+        total_amount DECIMAL,
+        amount DECIMAL,
+        payment_state VARCHAR(50),
+        item_count INT NOT NULL DEFAULT 0,
+        distributor_ids INT[] NOT NULL DEFAULT '{}',
+        distributor_names TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Distributor_Orders (
+        distributor_id INT NOT NULL,
+        order_id INT NOT NULL REFERENCES Order_Summaries(order_id) ON DELETE CASCADE,
+        order_date TIMESTAMP,
+        status VARCHAR(50),
+        PRIMARY KEY (distributor_id, order_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_order_summaries_user ON Order_Summaries (user_id, order_date DESC, order_id DESC)",
+    """
+    CREATE INDEX IF NOT EXISTS idx_distributor_orders_date
+    ON Distributor_Orders (distributor_id, order_date DESC, order_id DESC)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_distributor_orders_order ON Distributor_Orders (order_id)",
+    """
+    CREATE OR REPLACE FUNCTION refresh_order_summaries(ids INT[]) RETURNS void AS $$
+        WITH items AS (
+            SELECT oi.order_id,
+                   COUNT(*) AS item_count,
+                   COALESCE(ARRAY_AGG(DISTINCT v.distributor_id)
+                            FILTER (WHERE v.distributor_id IS NOT NULL), '{}') AS distributor_ids,
+                   STRING_AGG(DISTINCT d.name, ', ') AS distributor_names
+            FROM Order_Items oi
+            JOIN Product_Variants v ON v.variant_id = oi.variant_id
+            LEFT JOIN Users d ON d.user_id = v.distributor_id
+            WHERE oi.order_id = ANY(ids)
+            GROUP BY oi.order_id
+        ), pays AS (
+            SELECT order_id, MAX(amount) AS amount, MAX(status) AS payment_state
+            FROM Payments
+            WHERE order_id = ANY(ids)
+            GROUP BY order_id
+        ), upserted AS (
+            INSERT INTO Order_Summaries (order_id, user_id, shop_owner, order_date, status, payment_status,
+                                         total_amount, amount, payment_state, item_count,
+                                         distributor_ids, distributor_names)
+            SELECT o.order_id, o.user_id, u.name, o.order_date, o.status, o.payment_status,
+                   o.total_amount, pays.amount, pays.payment_state, COALESCE(items.item_count, 0),
+                   COALESCE(items.distributor_ids, '{}'), items.distributor_names
+            FROM Orders o
+            LEFT JOIN Users u ON u.user_id = o.user_id
+            LEFT JOIN items ON items.order_id = o.order_id
+            LEFT JOIN pays ON pays.order_id = o.order_id
+            WHERE o.order_id = ANY(ids)
+            ON CONFLICT (order_id) DO UPDATE SET
+                user_id = EXCLUDED.user_id,
+                shop_owner = EXCLUDED.shop_owner,
+                order_date = EXCLUDED.order_date,
+                status = EXCLUDED.status,
+                payment_status = EXCLUDED.payment_status,
+                total_amount = EXCLUDED.total_amount,
+                amount = EXCLUDED.amount,
+                payment_state = EXCLUDED.payment_state,
+                item_count = EXCLUDED.item_count,
+                distributor_ids = EXCLUDED.distributor_ids,
+                distributor_names = EXCLUDED.distributor_names
+            RETURNING order_id, order_date, status, distributor_ids
+        ), stale AS (
+            DELETE FROM Distributor_Orders d
+            USING upserted u
+            WHERE d.order_id = u.order_id AND NOT d.distributor_id = ANY(u.distributor_ids)
+        )
+        INSERT INTO Distributor_Orders (distributor_id, order_id, order_date, status)
+        SELECT unnest(distributor_ids), order_id, order_date, status FROM upserted
+        ON CONFLICT (distributor_id, order_id) DO UPDATE SET
+            order_date = EXCLUDED.order_date,
+            status = EXCLUDED.status
+    $$ LANGUAGE sql
+    """,
+    "SELECT refresh_order_summaries(ARRAY(SELECT order_id FROM Orders))",
+]
+
+# Payments are listed per shop owner and per distributor; Payment_History
+# holds one row per (party, payment) so both lists page off a single index.
+# refresh_order_summaries is redefined to keep it in step with the orders.
+PAYMENT_HISTORY = [
+    """
+    CREATE TABLE IF NOT EXISTS Payment_History (
+        user_id INT NOT NULL,
+        payment_id INT NOT NULL REFERENCES Payments(payment_id) ON DELETE CASCADE,
+        order_id INT NOT NULL,
+        payment_date TIMESTAMP,
+        status VARCHAR(50),
+        PRIMARY KEY (user_id, payment_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_payment_history_date
+    ON Payment_History (user_id, payment_date DESC, payment_id DESC)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_payment_history_order ON Payment_History (order_id)",
+    """
+    CREATE OR REPLACE FUNCTION refresh_order_summaries(ids INT[]) RETURNS void AS $$
+        WITH items AS (
+            SELECT oi.order_id,
+                   COUNT(*) AS item_count,
+                   COALESCE(ARRAY_AGG(DISTINCT v.distributor_id)
+                            FILTER (WHERE v.distributor_id IS NOT NULL), '{}') AS distributor_ids,
+                   STRING_AGG(DISTINCT d.name, ', ') AS distributor_names
+            FROM Order_Items oi
+            JOIN Product_Variants v ON v.variant_id = oi.variant_id
+            LEFT JOIN Users d ON d.user_id = v.distributor_id
+            WHERE oi.order_id = ANY(ids)
+            GROUP BY oi.order_id
+        ), pays AS (
+            SELECT order_id, MAX(amount) AS amount, MAX(status) AS payment_state
+            FROM Payments
+            WHERE order_id = ANY(ids)
+            GROUP BY order_id
+        ), upserted AS (
+            INSERT INTO Order_Summaries (order_id, user_id, shop_owner, order_date, status, payment_status,
+                                         total_amount, amount, payment_state, item_count,
+                                         distributor_ids, distributor_names)
+            SELECT o.order_id, o.user_id, u.name, o.order_date, o.status, o.payment_status,
+                   o.total_amount, pays.amount, pays.payment_state, COALESCE(items.item_count, 0),
+                   COALESCE(items.distributor_ids, '{}'), items.distributor_names
+            FROM Orders o
+            LEFT JOIN Users u ON u.user_id = o.user_id
+            LEFT JOIN items ON items.order_id = o.order_id
+            LEFT JOIN pays ON pays.order_id = o.order_id
+            WHERE o.order_id = ANY(ids)
+            ON CONFLICT (order_id) DO UPDATE SET
+                user_id = EXCLUDED.user_id,
+                shop_owner = EXCLUDED.shop_owner,
+                order_date = EXCLUDED.order_date,
+                status = EXCLUDED.status,
+                payment_status = EXCLUDED.payment_status,
+                total_amount = EXCLUDED.total_amount,
+                amount = EXCLUDED.amount,
+                payment_state = EXCLUDED.payment_state,
+                item_count = EXCLUDED.item_count,
+                distributor_ids = EXCLUDED.distributor_ids,
+                distributor_names = EXCLUDED.distributor_names
+            RETURNING order_id, order_date, status, distributor_ids
+        ), stale AS (
+            DELETE FROM Distributor_Orders d
+            USING upserted u
+            WHERE d.order_id = u.order_id AND NOT d.distributor_id = ANY(u.distributor_ids)
+        )
+        INSERT INTO Distributor_Orders (distributor_id, order_id, order_date, status)
+        SELECT unnest(distributor_ids), order_id, order_date, status FROM upserted
+        ON CONFLICT (distributor_id, order_id) DO UPDATE SET
+            order_date = EXCLUDED.order_date,
+            status = EXCLUDED.status;
+
+        DELETE FROM Payment_History WHERE order_id = ANY(ids);
+
+        INSERT INTO Payment_History (user_id, payment_id, order_id, payment_date, status)
+        SELECT DISTINCT party.user_id, p.payment_id, p.order_id, p.payment_date, p.status
+        FROM Payments p
+        JOIN Order_Summaries s ON s.order_id = p.order_id
+        CROSS JOIN LATERAL unnest(ARRAY[s.user_id] || s.distributor_ids) AS party(user_id)
+        WHERE p.order_id = ANY(ids) AND party.user_id IS NOT NULL;
+    $$ LANGUAGE sql
+    """,
+    "SELECT refresh_order_summaries(ARRAY(SELECT order_id FROM Orders))",
+]
+
+# Per-distributor sales by (day, variant) for /distributor/analytics. An
+# order counts while its status is in SALES_STATUSES, under the day it was
+# placed. Orders.sales_recorded says whether its lines are in the rollup.
+# record_order_sales(ids) adds or subtracts just the orders whose status
+# crossed that line, so the write endpoints keep the table current for the
+# cost of the orders they touched.
+SALES_STATUSES = "('Accepted', 'Shipped', 'Out for Delivery', 'Delivered')"
+
+RECORD_ORDER_SALES = f"""
+    CREATE OR REPLACE FUNCTION record_order_sales(ids INT[]) RETURNS void AS $$
+        WITH flipped AS (
+            UPDATE Orders o
+            SET sales_recorded = NOT o.sales_recorded
+            WHERE o.order_id = ANY(ids)
+              AND o.sales_recorded <> COALESCE(o.status IN {SALES_STATUSES}, FALSE)
+            RETURNING o.order_id, o.order_date::date AS day,
+                      CASE WHEN o.sales_recorded THEN 1 ELSE -1 END AS sign
+        )
+        INSERT INTO Distributor_Daily_Sales AS s (distributor_id, day, variant_id, revenue, units, order_lines)
+        SELECT v.distributor_id, f.day, oi.variant_id,
+               SUM(f.sign * COALESCE(oi.price, 0) * COALESCE(oi.quantity, 0)),
+               SUM(f.sign * COALESCE(oi.quantity, 0)),
+               SUM(f.sign)
+        FROM flipped f
+        JOIN Order_Items oi ON oi.order_id = f.order_id
+        JOIN Product_Variants v ON v.variant_id = oi.variant_id
+        WHERE v.distributor_id IS NOT NULL
+        GROUP BY v.distributor_id, f.day, oi.variant_id
+        -- key order, so concurrent updates can't deadlock on the upsert
+        ORDER BY 1, 2, 3
+        ON CONFLICT (distributor_id, day, variant_id) DO UPDATE SET
+            revenue = s.revenue + EXCLUDED.revenue,
+            units = s.units + EXCLUDED.units,
+            order_lines = s.order_lines + EXCLUDED.order_lines
+    $$ LANGUAGE sql
+"""
+
+DISTRIBUTOR_DAILY_SALES = [
+    """
+    ALTER TABLE Orders
+    ADD COLUMN IF NOT EXISTS sales_recorded BOOLEAN NOT NULL DEFAULT FALSE
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Distributor_Daily_Sales (
+        distributor_id INT NOT NULL,
+        day DATE NOT NULL,
+        variant_id INT NOT NULL,
+        revenue DECIMAL NOT NULL DEFAULT 0,
+        units BIGINT NOT NULL DEFAULT 0,
+        order_lines INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (distributor_id, day, variant_id)
+    )
+    """,
+    RECORD_ORDER_SALES,
+    f"SELECT record_order_sales(ARRAY(SELECT order_id FROM Orders WHERE status IN {SALES_STATUSES}))",
+]
+
+# Migration 6 left 'Out for Delivery' out, so orders dropped out of the
+# rollup while in transit: redefine the function and re-sync those orders.
+COUNT_OUT_FOR_DELIVERY = [
+    RECORD_ORDER_SALES,
+    f"""
+    SELECT record_order_sales(ARRAY(
+        SELECT order_id FROM Orders WHERE sales_recorded <> COALESCE(status IN {SALES_STATUSES}, FALSE)
+    ))
+    """,
+]
+
+
+def enable_trigram_search(cursor):
+    # pg_trgm adds typo tolerance, but not every Postgres offers it (or lets
+    # this role create it). Without it /catalog/search uses full-text prefix
+    # matching only; install it later and create the index by hand to upgrade:
+    #   CREATE EXTENSION pg_trgm;
+    #   CREATE INDEX idx_variants_search_trgm ON Product_Variants USING GIN (search_text gin_trgm_ops);
+    cursor.execute("SAVEPOINT trigram")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_variants_search_trgm
+        ON Product_Variants USING GIN (search_text gin_trgm_ops)
+        """)
+        cursor.execute("RELEASE SAVEPOINT trigram")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trigram")
+        print("⚠️ pg_trgm not available, catalog search falls back to full-text only:", str(e).splitlines()[0])
+
+
+# Catalog search: each variant's category, product, subproduct and brand
+# names in one lowercased search_text column, with a generated tsvector and
+# a GIN index for full-text matching. refresh_variant_search(ids) rebuilds
+# the text; the app calls it after inserting or editing variants.
+CATALOG_SEARCH = [
+    "ALTER TABLE Product_Variants ADD COLUMN IF NOT EXISTS search_text TEXT NOT NULL DEFAULT ''",
+    """
+    ALTER TABLE Product_Variants
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', search_text)) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_variants_search ON Product_Variants USING GIN (search_vector)",
+    """
+    CREATE OR REPLACE FUNCTION refresh_variant_search(ids INT[]) RETURNS void AS $$
+        UPDATE Product_Variants v
+        SET search_text = lower(concat_ws(' ', c.name, p.name, sp.name, v.brand))
+        FROM SubProducts sp
+        JOIN Products p ON p.product_id = sp.product_id
+        JOIN Categories c ON c.category_id = p.category_id
+        WHERE v.variant_id = ANY(ids)
+          AND sp.subproduct_id = v.subproduct_id
+          AND v.search_text IS DISTINCT FROM lower(concat_ws(' ', c.name, p.name, sp.name, v.brand))
+    $$ LANGUAGE sql
+    """,
+    "SELECT refresh_variant_search(ARRAY(SELECT variant_id FROM Product_Variants))",
+    enable_trigram_search,
+]
+
+# Responses to writes sent with an Idempotency-Key header (see idempotent in
+# app.py), one row per user, request path and key. status is NULL while the
+# first request is still running. Rows older than IDEMPOTENCY_TTL are
+# reused and deleted by `flask freshcart purge-idempotency-keys`.
+IDEMPOTENCY_KEYS = [
+    """
+    CREATE TABLE IF NOT EXISTS Idempotency_Keys (
+        user_id INT NOT NULL,
+        path TEXT NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        status SMALLINT,
+        body TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (user_id, path, idempotency_key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON Idempotency_Keys (created_at)",
+]
+
+# Migration 1 added stock_reserved as FALSE on every existing order, but the
+# code before it had already taken stock for accepted orders (and only for
+# those; Pending orders were reserved on acceptance). Mark them reserved so
+# their next status change doesn't take the stock a second time.
+BACKFILL_STOCK_RESERVED = [
+    """
+    UPDATE Orders SET stock_reserved = TRUE
+    WHERE status IN ('Accepted', 'Shipped', 'Out for Delivery', 'Delivered') AND NOT stock_reserved
+    """,
+]
+
+MIGRATIONS = [
+    (1, "baseline schema", BASELINE),
+    (2, "lookup indexes", LOOKUP_INDEXES),
+    (3, "unique product/subproduct names", UNIQUE_NAMES),
+    (4, "order summaries", ORDER_SUMMARIES),
+    (5, "payment history", PAYMENT_HISTORY),
+    (6, "distributor daily sales", DISTRIBUTOR_DAILY_SALES),
+    (7, "catalog search", CATALOG_SEARCH),
+    (8, "idempotency keys", IDEMPOTENCY_KEYS),
+    (9, "count out-for-delivery sales", COUNT_OUT_FOR_DELIVERY),
+    (10, "backfill stock reservations", BACKFILL_STOCK_RESERVED),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def migrate(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        conn.commit()
+
+        done = set(applied_versions(cursor))
+        applied = []
+        for version, name, steps in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"🔧 Applying migration {version}: {name}")
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                               (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+        return applied
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cursor.close()
+
+
+# ==============================
+# EXPLAIN-based index check
+# ==============================
+def _plan_indexes(plan):
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for child in plan.get("Plans", []):
+        yield from _plan_indexes(child)
+
+
+def check_indexes(conn, checks):
+    # checks: (label, sql, params, expected index names or tuples of them)
+    # Seq scans are disabled for the check only: on small or freshly seeded
+    # tables the planner prefers them anyway, and we want to know whether
+    # the index is usable, not whether it wins today.
+    cursor = conn.cursor()
+    results = []
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for label, sql, params, expected in checks:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+            used = sorted(set(_plan_indexes(plan)))
+            # an entry may be a tuple of indexes, any of which will do
+            missing = [" or ".join(names) for names in (e if isinstance(e, tuple) else (e,) for e in expected)
+                       if not set(names) & set(used)]
+            results.append({"query": label, "indexes": used, "missing": missing})
+    finally:
+        conn.rollback()
+        cursor.close()
+    return results
+
@@ -0,0 +1,215 @@
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+import psycopg2.extensions
+
+# ==============================
+# Synthetic data generator (flask freshcart seed)
+# ==============================
+# Fills every table with fake but consistent data:
+# - Variants belong to distributors with Zipf-skewed sizes: a few big
+#   distributors and a long tail of small ones.
+# - Order lines pick variants with Zipf-skewed popularity.
+# - Shops order at a milder skew.
+# - Rows are built in Python from one random.Random(seed) and bulk-loaded with
+#   COPY in chunks, so memory stays flat.
+# - Ids come from the tables' own sequences, so seeding can go into a
+#   database that already has data.
+# - On an empty database the same options produce the same rows.
+# - Variant search text, Order_Summaries, Payment_History and
+#   Distributor_Daily_Sales are filled through the same SQL functions the
+#   write endpoints use.
+SEED_DEFAULTS = {
+    "distributors": 200,
+    "shops": 2000,
+    "categories": 12,
+    "products": 600,
+    "variants": 10000,
+    "orders": 200000,
+    "max_lines": 5,
+    "days": 365,
+    "product_skew": 1.1,
+    "distributor_skew": 1.2,
+    "shop_skew": 0.8,
+}
+SEED_PASSWORD = "freshcart"
+COPY_CHUNK = 50000
+SUMMARY_CHUNK = 20000
+
+# (status, Orders.payment_status, Payments.status, weight): the states the
+# write endpoints leave orders in
+ORDER_MIX = [
+    ("Delivered", "Completed", "Completed", 55),
+    ("Delivered", "Unpaid", "Completed", 5),
+    ("Accepted", "Unpaid", "Pending", 12),
+    ("Shipped", "Unpaid", "Pending", 8),
+    ("Pending", "Unpaid", "Pending", 12),
+    ("Declined", "Unpaid", "Cancelled", 6),
+    ("Deleted", "Unpaid", "Pending", 2),
+]
+PAYMENT_METHODS = ["UPI", "Cash", "Card", "Bank transfer"]
+
+CATEGORY_NAMES = ["Vegetables", "Fruits", "Dairy", "Bakery", "Grains", "Pulses", "Spices", "Oils",
+                  "Beverages", "Snacks", "Household", "Personal care", "Frozen", "Meat", "Seafood"]
+PRODUCT_NAMES = ["Tomato", "Onion", "Potato", "Apple", "Banana", "Milk", "Curd", "Bread", "Rice",
+                 "Wheat flour", "Toor dal", "Turmeric", "Sunflower oil", "Tea", "Coffee", "Biscuits",
+                 "Detergent", "Soap", "Paneer", "Chicken", "Prawns", "Peas", "Mango", "Ghee"]
+VARIETY_NAMES = ["Regular", "Premium", "Organic", "Local", "Export grade", "Value pack"]
+UNITS = ["kg", "500 g", "250 g", "1 l", "500 ml", "pc", "dozen", "pack"]
+BRANDS = ["FreshFarm", "GreenLeaf", "DailyHarvest", "Annapurna", "Kisan", "Nature's Best",
+          "Village Fresh", "MetroMart", "HomeChoice", "PureGold"]
+STREETS = ["MG Road", "Station Road", "Market Street", "Temple Road", "Lake View", "Gandhi Nagar"]
+CITIES = ["Bengaluru", "Chennai", "Hyderabad", "Pune", "Mumbai", "Kochi"]
+
+
+def _zipf_cum_weights(n, skew):
+    # rank k gets weight 1/k^skew
+    return list(accumulate(1 / k ** skew for k in range(1, n + 1)))
+
+
+def _reserve_ids(cursor, table, column, count):
+    # nextval hands out unique ids even with concurrent inserts
+    cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                   (table, column, count))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _copy(cursor, table, columns, lines):
+    # lines are pre-formatted COPY text rows; sent COPY_CHUNK at a time
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    buffer, pending, total = io.StringIO(), 0, 0
+    for line in lines:
+        buffer.write(line)
+        pending += 1
+        if pending == COPY_CHUNK:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            total += pending
+            buffer, pending = io.StringIO(), 0
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        total += pending
+    return total
+
+
+def seed_database(conn, seed=42, until=None, log=print, **options):
+    opts = dict(SEED_DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+    rng = random.Random(seed)
+    until = until or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = {}
+    started = time.perf_counter()
+    # plain cursor: bulk statements would only flood the slow-query log
+    cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cursor.execute("SET LOCAL synchronous_commit = off")
+
+    def step(name, table, columns, lines):
+        t = time.perf_counter()
+        counts[name] = _copy(cursor, table, columns, lines)
+        log(f"   {name:<12} {counts[name]:>9} rows  {time.perf_counter() - t:6.1f}s")
+
+    # Users
+    distributor_ids = _reserve_ids(cursor, "users", "user_id", opts["distributors"])
+    shop_ids = _reserve_ids(cursor, "users", "user_id", opts["shops"])
+
+    def users():
+        for role, ids in (("distributor", distributor_ids), ("shop_owner", shop_ids)):
+            for user_id in ids:
+                label = "Distributor" if role == "distributor" else "Shop"
+                yield (f"{user_id}\t{label} {user_id}\t{role}.{user_id}@seed.freshcart.test\t{SEED_PASSWORD}"
+                       f"\t{role}\t9{rng.randrange(10 ** 9):09d}"
+                       f"\t{rng.randint(1, 999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}\n")
+    step("users", "Users", ("user_id", "name", "email", "password", "role", "contact_no", "address"), users())
+
+    # Categories -> Products -> SubProducts
+    category_ids = _reserve_ids(cursor, "categories", "category_id", opts["categories"])
+    step("categories", "Categories", ("category_id", "name"),
+         (f"{c}\t{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {c}\n" for i, c in enumerate(category_ids)))
+
+    product_ids = _reserve_ids(cursor, "products", "product_id", opts["products"])
+    step("products", "Products", ("product_id", "category_id", "name"),
+         (f"{p}\t{category_ids[i % len(category_ids)]}\t{PRODUCT_NAMES[i % len(PRODUCT_NAMES)]} {p}\n"
+          for i, p in enumerate(product_ids)))
+
+    subproducts = [(p, name) for p in product_ids for name in rng.sample(VARIETY_NAMES, rng.randint(1, 3))]
+    subproduct_ids = _reserve_ids(cursor, "subproducts", "subproduct_id", len(subproducts))
+    step("subproducts", "SubProducts", ("subproduct_id", "product_id", "name"),
+         (f"{s}\t{p}\t{name}\n" for s, (p, name) in zip(subproduct_ids, subproducts)))
+
+    # Variants: distributor sizes follow a Zipf curve over a shuffled order,
+    # so the big ones aren't simply the lowest ids
+    variant_ids = _reserve_ids(cursor, "product_variants", "variant_id", opts["variants"])
+    ranked = distributor_ids[:]
+    rng.shuffle(ranked)
+    owners = rng.choices(ranked, cum_weights=_zipf_cum_weights(len(ranked), opts["distributor_skew"]),
+                         k=len(variant_ids))
+    prices = [Decimal(rng.randint(500, 100000)) / 100 for _ in variant_ids]
+    step("variants", "Product_Variants",
+         ("variant_id", "subproduct_id", "distributor_id", "brand", "unit", "price", "stock"),
+         (f"{v}\t{rng.choice(subproduct_ids)}\t{d}\t{rng.choice(BRANDS)}\t{rng.choice(UNITS)}"
+          f"\t{price}\t{rng.randint(100, 100000)}\n"
+          for v, d, price in zip(variant_ids, owners, prices)))
+    cursor.execute("SELECT refresh_variant_search(%s::int[])", (variant_ids,))
+
+    # Orders, their lines and payments, one chunk of orders at a time
+    popular = list(range(len(variant_ids)))
+    rng.shuffle(popular)
+    variant_weights = _zipf_cum_weights(len(popular), opts["product_skew"])
+    shop_ranked = shop_ids[:]
+    rng.shuffle(shop_ranked)
+    shop_weights = _zipf_cum_weights(len(shop_ranked), opts["shop_skew"])
+    mix_weights = list(accumulate(weight for *_, weight in ORDER_MIX))
+    span = opts["days"] * 86400
+
+    order_ids = _reserve_ids(cursor, "orders", "order_id", opts["orders"])
+    counts.update(orders=0, order_items=0, payments=0)
+    t = time.perf_counter()
+    for start in range(0, len(order_ids), COPY_CHUNK):
+        chunk = order_ids[start:start + COPY_CHUNK]
+        shops = rng.choices(shop_ranked, cum_weights=shop_weights, k=len(chunk))
+        states = rng.choices(ORDER_MIX, cum_weights=mix_weights, k=len(chunk))
+        orders, items, payments = io.StringIO(), io.StringIO(), io.StringIO()
+        for order_id, shop, (status, payment_status, payment_state, _) in zip(chunk, shops, states):
+            placed = until - timedelta(seconds=rng.randrange(span))
+            total = Decimal(0)
+            for index in set(rng.choices(popular, cum_weights=variant_weights,
+                                         k=rng.randint(1, opts["max_lines"]))):
+                quantity = rng.randint(1, 10)
+                total += prices[index] * quantity
+                items.write(f"{order_id}\t{variant_ids[index]}\t{quantity}\t{prices[index]}\n")
+                counts["order_items"] += 1
+            orders.write(f"{order_id}\t{shop}\t{status}\t{payment_status}\t{placed}\t{total}"
+                         f"\t{'f' if status in ('Declined', 'Deleted') else 't'}\n")
+            method = rng.choice(PAYMENT_METHODS) if payment_state == "Completed" else "\\N"
+            payments.write(f"{order_id}\t{total}\t{payment_state}\t{method}\t{placed}\n")
+        for table, columns, buffer in (
+            ("Orders", ("order_id", "user_id", "status", "payment_status", "order_date", "total_amount",
+                        "stock_reserved"), orders),
+            ("Order_Items", ("order_id", "variant_id", "quantity", "price"), items),
+            ("Payments", ("order_id", "amount", "status", "payment_method", "payment_date"), payments),
+        ):
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+        counts["orders"] += len(chunk)
+        counts["payments"] += len(chunk)
+    log(f"   {'orders':<12} {counts['orders']:>9} rows, {counts['order_items']} items, "
+        f"{counts['payments']} payments  {time.perf_counter() - t:6.1f}s")
+
+    # Read models, then fresh planner stats for the new volumes
+    t = time.perf_counter()
+    for start in range(0, len(order_ids), SUMMARY_CHUNK):
+        chunk = order_ids[start:start + SUMMARY_CHUNK]
+        cursor.execute("SELECT refresh_order_summaries(%s::int[])", (chunk,))
+        cursor.execute("SELECT record_order_sales(%s::int[])", (chunk,))
+    log(f"   {'summaries':<12} {'':>9}       {time.perf_counter() - t:6.1f}s")
+    for table in ("Users", "Categories", "Products", "SubProducts", "Product_Variants", "Orders",
+                  "Order_Items", "Payments", "Order_Summaries", "Distributor_Orders", "Payment_History",
+                  "Distributor_Daily_Sales"):
+        cursor.execute(f"ANALYZE {table}")
+    conn.commit()
+    counts["seconds"] = round(time.perf_counter() - started, 1)
+    return counts
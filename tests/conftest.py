@@ -0,0 +1,104 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# auth.py reads these at import time
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("AUTH_ENFORCE", "1")
+# database-backed tests run only against a scratch database (they migrate it)
+if os.environ.get("TEST_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ==============================
+# Database-backed fixtures
+# ==============================
+@pytest.fixture(scope="session")
+def database():
+    if not os.environ.get("TEST_DATABASE_URL"):
+        pytest.skip("set TEST_DATABASE_URL to a scratch database")
+    from database import pooled_connection
+    from migrations import migrate
+    with pooled_connection() as conn:
+        migrate(conn)
+
+
+@pytest.fixture(scope="session")
+def api(database):
+    from app import create_app
+    return create_app().test_client()
+
+
+@pytest.fixture
+def sql(database):
+    # one committed statement on its own connection; returns the rows as dicts
+    from database import dict_rows, pooled_connection
+
+    def run(statement, params=()):
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(statement, params)
+            rows = dict_rows(cursor, cursor.fetchall()) if cursor.description else None
+            conn.commit()
+            return rows
+    return run
+
+
+@pytest.fixture
+def make_user(sql):
+    def make(role):
+        return sql("INSERT INTO Users (name, email, password, role) VALUES (%s, %s, 'pw', %s) RETURNING user_id",
+                   (f"{role} {uuid.uuid4().hex[:8]}", f"{uuid.uuid4()}@test", role))[0]["user_id"]
+    return make
+
+
+@pytest.fixture
+def make_variant(sql):
+    # a variant under its own category/product/subproduct, so names never clash
+    def make(distributor_id, stock, price=10):
+        name = uuid.uuid4().hex[:12]
+        return sql("""
+            WITH c AS (INSERT INTO Categories (name) VALUES (%(name)s) RETURNING category_id),
+            p AS (INSERT INTO Products (category_id, name) SELECT category_id, %(name)s FROM c RETURNING product_id),
+            s AS (INSERT INTO SubProducts (product_id, name) SELECT product_id, %(name)s FROM p RETURNING subproduct_id)
+            INSERT INTO Product_Variants (subproduct_id, distributor_id, brand, unit, price, stock)
+            SELECT subproduct_id, %(distributor_id)s, 'Test', 'kg', %(price)s, %(stock)s FROM s
+            RETURNING variant_id
+        """, {"name": name, "distributor_id": distributor_id, "price": price, "stock": stock})[0]["variant_id"]
+    return make
+
+
+@pytest.fixture
+def auth_headers():
+    from auth import issue_token
+    return lambda user_id, role: {"Authorization": f"Bearer {issue_token(user_id, role)}"}
+
+
+@pytest.fixture
+def shop(make_user, auth_headers):
+    user_id = make_user("shop_owner")
+    return user_id, auth_headers(user_id, "shop_owner")
+
+
+@pytest.fixture
+def distributor(make_user, auth_headers):
+    user_id = make_user("distributor")
+    return user_id, auth_headers(user_id, "distributor")
+
+
+@pytest.fixture
+def place_order(api):
+    def place(shop, cart):
+        user_id, headers = shop
+        return api.post("/place_order", json={"user_id": user_id, "cart": cart}, headers=headers)
+    return place
+
+
+@pytest.fixture
+def stock(sql):
+    return lambda variant_id: sql("SELECT stock FROM Product_Variants WHERE variant_id = %s",
+                                  (variant_id,))[0]["stock"]
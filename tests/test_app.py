@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+from flask import Flask
+
+from app import create_app, migrate_command
+from database import pooled_connection
+from migrations import MIGRATIONS, applied_versions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_workers_start_without_a_database():
+    # nothing listens on port 9: importing the app must not connect, and a
+    # route that needs the database gets the app's 500 instead of a crash
+    probe = ("import json, app; client = app.app.test_client(); "
+             "print(json.dumps([client.get('/').status_code, client.get('/debug/db').get_json()]))")
+    env = dict(os.environ, DATABASE_URL="postgresql://nobody@127.0.0.1:9/none", DATABASE_READ_URL="")
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=env, capture_output=True, text=True,
+                         check=True, timeout=60)
+    home, debug = json.loads(out.stdout.strip().splitlines()[-1])
+    assert home == 200
+    assert debug["error"] == "DB not connected on server"
+
+
+def test_create_app_builds_independent_apps():
+    first, second = create_app(), create_app()
+    assert isinstance(first, Flask) and first is not second
+    assert {"freshcart.home", "freshcart.place_order"} <= set(first.view_functions)
+    assert "freshcart" in first.cli.commands
+
+
+def test_migrate_command_records_every_version(database):
+    result = create_app().test_cli_runner().invoke(migrate_command)
+    assert result.exit_code == 0
+    assert "Schema is up to date" in result.output
+    with pooled_connection() as conn:
+        assert applied_versions(conn.cursor()) == [version for version, _, _ in MIGRATIONS]
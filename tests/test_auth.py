@@ -0,0 +1,173 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from flask import Flask, g, jsonify
+
+import auth
+from app import order_parties
+from auth import AuthError, authorize, check_party, issue_token, require_auth, role_key, verify_token
+
+
+def _b64(obj):
+    return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+
+
+def test_issue_and_verify_round_trip():
+    claims = verify_token(issue_token(7, "distributor"))
+    assert claims["id"] == 7
+    assert claims["role"] == "distributor"
+    assert claims["exp"] - claims["iat"] == auth.JWT_TTL
+
+
+def test_expired_token_is_rejected():
+    token = issue_token(7, "distributor", ttl=-1)
+    with pytest.raises(AuthError) as e:
+        verify_token(token)
+    assert (e.value.status, e.value.message) == (401, "Token expired")
+
+
+def test_expiry_is_checked_after_the_decode_cache(monkeypatch):
+    token = issue_token(7, "distributor", ttl=60)
+    verify_token(token)
+    later = time.time() + 120
+    monkeypatch.setattr(auth.time, "time", lambda: later)
+    with pytest.raises(AuthError):
+        verify_token(token)
+
+
+@pytest.mark.parametrize("token", [None, "", "garbage", "a.b", "a.b.c.d"])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(AuthError) as e:
+        verify_token(token)
+    assert e.value.status == 401
+
+
+def test_tampered_payload_is_rejected():
+    header, _, signature = issue_token(7, "shop_owner").split(".")
+    forged = _b64({"id": 1, "role": "distributor", "exp": int(time.time()) + 60})
+    with pytest.raises(AuthError):
+        verify_token(f"{header}.{forged}.{signature}")
+
+
+def test_tampered_signature_is_rejected():
+    token = issue_token(7, "shop_owner")
+    flipped = token[:-1] + ("A" if token[-1] != "A" else "B")
+    with pytest.raises(AuthError):
+        verify_token(flipped)
+
+
+def test_unsigned_alg_none_token_is_rejected():
+    token = f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64({'id': 1, 'role': 'distributor'})}."
+    with pytest.raises(AuthError):
+        verify_token(token)
+
+
+def test_token_signed_with_another_secret_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth, "JWT_SECRET", "someone-else")
+    token = issue_token(7, "distributor")
+    monkeypatch.undo()
+    with pytest.raises(AuthError):
+        verify_token(token)
+
+
+def test_non_integer_user_id_is_rejected():
+    header, _, _ = issue_token(7, "shop_owner").split(".")
+    payload = _b64({"id": "7", "role": "shop_owner"})
+    signing_input = f"{header}.{payload}".encode()
+    token = f"{header}.{payload}.{auth._sign(signing_input).decode()}"
+    with pytest.raises(AuthError):
+        verify_token(token)
+
+
+def test_authorize_reads_bearer_header_and_query_token():
+    token = issue_token(7, "shop_owner")
+    assert authorize(f"Bearer {token}")["id"] == 7
+    assert authorize(f"bearer {token}")["id"] == 7
+    assert authorize(None, token)["id"] == 7
+    # the header wins over ?token=
+    assert authorize(f"Bearer {token}", issue_token(8, "shop_owner"))["id"] == 7
+
+
+def test_authorize_checks_role_and_owner():
+    token = issue_token(7, "Shop Owner")
+    assert authorize(f"Bearer {token}", role="shopowner", owner_id=7)["id"] == 7
+    with pytest.raises(AuthError) as e:
+        authorize(f"Bearer {token}", role="distributor")
+    assert e.value.status == 403
+    with pytest.raises(AuthError) as e:
+        authorize(f"Bearer {token}", owner_id=8)
+    assert e.value.status == 403
+
+
+def test_role_key_normalises_spelling():
+    assert role_key("Shop Owner") == role_key("shop_owner") == role_key("shopowner") == "shopowner"
+    assert role_key(None) == ""
+
+
+def test_check_party():
+    check_party({"id": 3}, {1, 3})
+    check_party(None, {1})
+    with pytest.raises(AuthError) as e:
+        check_party({"id": 2}, {1, 3})
+    assert e.value.status == 403
+
+
+def test_order_parties():
+    rows = [{"order_id": 1, "user_id": 10, "distributor_ids": [20, 21]},
+            {"order_id": 2, "user_id": 11, "distributor_ids": []}]
+    assert order_parties(rows) == {1: {20, 21}, 2: set()}
+    assert order_parties(rows, shop_owner=True) == {1: {10, 20, 21}, 2: {11}}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/things/<int:user_id>")
+    @require_auth(role="distributor", owner="user_id")
+    def things(user_id):
+        return jsonify({"user": g.user["id"] if g.user else None})
+
+    return app.test_client()
+
+
+def test_require_auth(client):
+    assert client.get("/things/7").status_code == 401
+    own = {"Authorization": f"Bearer {issue_token(7, 'distributor')}"}
+    assert client.get("/things/7", headers=own).get_json() == {"user": 7}
+    assert client.get("/things/8", headers=own).status_code == 403
+    shop = {"Authorization": f"Bearer {issue_token(7, 'shop_owner')}"}
+    assert client.get("/things/7", headers=shop).status_code == 403
+
+
+def test_require_auth_only_logs_when_not_enforced(client, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_ENFORCE", False)
+    response = client.get("/things/7")
+    assert response.status_code == 200
+    assert response.get_json() == {"user": None}
+
+
+@pytest.mark.parametrize("enforce, starts", [("1", False), ("0", True)])
+def test_missing_secret_only_starts_when_not_enforced(enforce, starts):
+    env = {k: v for k, v in os.environ.items() if k != "JWT_SECRET"}
+    env["AUTH_ENFORCE"] = enforce
+    result = subprocess.run([sys.executable, "-c", "import auth"], cwd=os.path.dirname(auth.__file__), env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert (result.returncode == 0) is starts
+    if not starts:
+        assert "JWT_SECRET must be set" in result.stderr
+
+
+@pytest.mark.parametrize("distributor_id", ["seven", 7.5, True, [7]])
+def test_add_product_rejects_non_integer_distributor_ids(api, distributor, distributor_id):
+    response = api.post("/distributor/add_product", json={
+        "distributor_id": distributor_id, "product_name": "Apple", "subproduct_name": "Red", "brand": "B",
+        "unit": "kg", "price": 1, "stock": 1,
+    }, headers=distributor[1])
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "distributor_id must be an integer"}
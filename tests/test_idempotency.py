@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask, jsonify, request
+
+from app import IDEMPOTENCY_LOCK_SQL, idempotent
+from database import close_db, get_cursor, get_db, pooled_connection
+from migrations import migrate
+
+pytestmark = pytest.mark.skipif(not os.environ.get("TEST_DATABASE_URL"),
+                                reason="set TEST_DATABASE_URL to a scratch database")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    with pooled_connection() as conn:
+        migrate(conn)
+        conn.cursor().execute("CREATE TABLE IF NOT EXISTS test_idempotent_writes (note TEXT)")
+        conn.commit()
+
+
+def notes(note):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM test_idempotent_writes WHERE note = %s", (note,))
+        return cursor.fetchone()[0]
+
+
+@pytest.fixture
+def key():
+    key = f"test-{uuid.uuid4()}"
+    yield key
+    with pooled_connection() as conn:
+        conn.cursor().execute("DELETE FROM Idempotency_Keys WHERE idempotency_key = %s", (key,))
+        conn.commit()
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(calls):
+    app = Flask(__name__)
+    app.teardown_appcontext(close_db)
+
+    @app.route("/write", methods=["POST"])
+    @idempotent
+    def write():
+        body = request.get_json()
+        calls.append(body)
+        if body.get("note"):
+            get_cursor().execute("INSERT INTO test_idempotent_writes (note) VALUES (%s)", (body["note"],))
+            get_db().commit()
+            # what other connections see right after the handler's commit
+            body["visible"] = notes(body["note"])
+        if body.get("crash"):
+            raise RuntimeError("died after committing")
+        if body.get("fail"):
+            return jsonify({"error": "Server error"}), 500
+        return jsonify({"call": len(calls)}), 201
+
+    return app.test_client()
+
+
+def post(client, key, body):
+    return client.post("/write", json=body, headers={"Idempotency-Key": key})
+
+
+def test_retry_replays_the_first_response(client, calls, key):
+    first = post(client, key, {"n": 1})
+    retry = post(client, key, {"n": 1})
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json() == {"call": 1}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_same_key_with_another_body_is_422(client, calls, key):
+    post(client, key, {"n": 1})
+    assert post(client, key, {"n": 2}).status_code == 422
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def running(key):
+    # another request holding the key: its session lock and reservation
+    @contextmanager
+    def hold(body):
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(IDEMPOTENCY_LOCK_SQL, (json.dumps([0, "/write", key]),))
+            cursor.execute(
+                "INSERT INTO Idempotency_Keys (user_id, path, idempotency_key, request_hash) "
+                "VALUES (0, '/write', %s, %s)", (key, hashlib.sha256(body).hexdigest()))
+            conn.commit()
+            yield
+            cursor.execute("SELECT pg_advisory_unlock_all()")
+            conn.commit()
+    return hold
+
+
+def send(client, key, body):
+    return client.post("/write", data=body, content_type="application/json", headers={"Idempotency-Key": key})
+
+
+def test_request_still_running_is_409(client, calls, key, running):
+    body = json.dumps({"n": 1}).encode()
+    with running(body):
+        assert send(client, key, body).status_code == 409
+    assert calls == []
+
+
+def test_request_still_running_with_another_body_is_422(client, calls, key, running):
+    with running(json.dumps({"n": 1}).encode()):
+        assert send(client, key, json.dumps({"n": 2}).encode()).status_code == 422
+    assert calls == []
+
+
+def test_reservation_of_a_dead_request_is_taken_over(client, calls, key, running):
+    body = json.dumps({"n": 1}).encode()
+    with running(body):
+        pass
+    # the reservation is still there, but nobody holds its lock any more
+    assert send(client, key, body).get_json() == {"call": 1}
+    assert send(client, key, body).headers["Idempotent-Replayed"] == "true"
+
+
+def test_write_and_response_commit_together(client, calls, key):
+    note = f"note-{key}"
+    assert post(client, key, {"note": note}).status_code == 201
+    assert calls[0]["visible"] == 0
+    assert notes(note) == 1
+    assert post(client, key, {"note": note}).get_json() == {"call": 1}
+    assert notes(note) == 1
+
+
+def test_crash_after_the_handler_commit_writes_nothing(client, calls, key):
+    note = f"note-{key}"
+    assert post(client, key, {"note": note, "crash": True}).status_code == 500
+    assert notes(note) == 0
+    assert post(client, key, {"note": note, "fail": True}).status_code == 500
+    assert notes(note) == 0
+    # the key is free again, and the retry writes once
+    assert post(client, key, {"note": note}).status_code == 201
+    assert notes(note) == 1
+
+
+def test_server_errors_are_not_stored(client, calls, key):
+    assert post(client, key, {"fail": True}).status_code == 500
+    assert post(client, key, {"fail": True}).status_code == 500
+    assert len(calls) == 2
+
+
+def test_expired_key_runs_again(client, calls, key):
+    post(client, key, {"n": 1})
+    with pooled_connection() as conn:
+        conn.cursor().execute("UPDATE Idempotency_Keys SET created_at = now() - interval '30 days' "
+                              "WHERE idempotency_key = %s", (key,))
+        conn.commit()
+    assert post(client, key, {"n": 1}).get_json() == {"call": 2}
+
+
+def test_without_a_key_every_request_runs(client, calls):
+    client.post("/write", json={"n": 1})
+    client.post("/write", json={"n": 1})
+    assert len(calls) == 2
+
+
+def test_bad_keys_are_400(client, calls):
+    assert post(client, " ", {"n": 1}).status_code == 400
+    assert post(client, "k" * 256, {"n": 1}).status_code == 400
+    assert calls == []
@@ -0,0 +1,93 @@
+import json
+import uuid
+
+import pytest
+
+import app as freshcart
+
+CSV_HEADER = "category_name,product_name,subproduct_name,brand,unit,price,stock\n"
+
+
+@pytest.fixture
+def names():
+    # fresh category/product names per test, so rows never clash across runs
+    tag = uuid.uuid4().hex[:8]
+    return f"Cat {tag}", f"Product {tag}"
+
+
+def upload(api, distributor, body, content_type):
+    user_id, headers = distributor
+    return api.post(f"/distributor/import_products/{user_id}", data=body, content_type=content_type,
+                    headers=headers)
+
+
+def imported_variants(sql, distributor_id):
+    return sql("""
+        SELECT c.name AS category, p.name AS product, s.name AS subproduct, v.brand, v.unit, v.price, v.stock
+        FROM Product_Variants v
+        JOIN SubProducts s ON s.subproduct_id = v.subproduct_id
+        JOIN Products p ON p.product_id = s.product_id
+        JOIN Categories c ON c.category_id = p.category_id
+        WHERE v.distributor_id = %s
+        ORDER BY v.variant_id
+    """, (distributor_id,))
+
+
+def test_csv_import_shares_categories_and_products(api, sql, distributor, names):
+    category, product = names
+    body = CSV_HEADER + "".join(f"{category.lower()},{product},Sub {n},Brand,kg,{n}.50,{n * 10}\n" for n in (1, 2))
+    response = upload(api, distributor, body, "text/csv")
+    assert response.get_json() == {"message": "Imported 2 product(s)", "imported": 2, "failed": 0, "errors": []}
+
+    rows = imported_variants(sql, distributor[0])
+    # the category is matched case-insensitively and created capitalized
+    assert [(r["category"], r["product"], r["subproduct"], r["stock"]) for r in rows] == [
+        (category.lower().capitalize(), product, "Sub 1", 10),
+        (category.lower().capitalize(), product, "Sub 2", 20),
+    ]
+    assert sql("SELECT COUNT(*) AS n FROM Products WHERE name = %s", (product,))[0]["n"] == 1
+
+
+def test_bad_rows_are_reported_and_the_rest_imported(api, sql, distributor, names):
+    category, product = names
+    lines = [
+        {"category": category, "product_name": product, "subproduct_name": "Good", "brand": "B", "unit": "kg",
+         "price": "1", "stock": "5"},
+        {"category": category, "product_name": product, "subproduct_name": "No price", "brand": "B", "unit": "kg",
+         "price": "free", "stock": "5"},
+        {"category": category, "product_name": product, "subproduct_name": "Long unit", "brand": "B",
+         "unit": "k" * 21, "price": "1", "stock": "5"},
+        {"category": category, "product_name": product, "subproduct_name": "Too many", "brand": "B", "unit": "kg",
+         "price": "1", "stock": str(2 ** 31)},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n[1]\n"
+    response = upload(api, distributor, body, "application/x-ndjson").get_json()
+    assert (response["imported"], response["failed"]) == (1, 5)
+    assert [error["row"] for error in response["errors"]] == [2, 3, 4, 5, 6]
+    assert [r["subproduct"] for r in imported_variants(sql, distributor[0])] == ["Good"]
+
+
+def test_a_row_failing_in_postgres_only_drops_that_row(api, sql, distributor, names, monkeypatch):
+    category, product = names
+    # let an over-long subproduct name past the per-row checks
+    monkeypatch.delitem(freshcart.IMPORT_MAX_LENGTHS, "subproduct")
+    body = CSV_HEADER + (f"{category},{product},Fine,B,kg,1,1\n"
+                         f"{category},{product},{'x' * 101},B,kg,1,1\n"
+                         f"{category},{product},Also fine,B,kg,1,1\n")
+    response = upload(api, distributor, body, "text/csv").get_json()
+    assert (response["imported"], response["failed"]) == (2, 1)
+    assert response["errors"][0]["row"] == 2
+    assert [r["subproduct"] for r in imported_variants(sql, distributor[0])] == ["Fine", "Also fine"]
+
+
+def test_import_needs_a_distributor(api, make_user, auth_headers):
+    # a shop owner's id with a distributor token for it
+    shop_id = make_user("shop_owner")
+    response = upload(api, (shop_id, auth_headers(shop_id, "distributor")), CSV_HEADER, "text/csv")
+    assert response.status_code == 404
+
+
+def test_unknown_format_is_400(api, distributor):
+    user_id, headers = distributor
+    response = api.post(f"/distributor/import_products/{user_id}?format=xlsx", data="", headers=headers)
+    assert response.status_code == 400
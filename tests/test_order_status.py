@@ -0,0 +1,92 @@
+import pytest
+
+
+@pytest.fixture
+def orders(make_variant, place_order, shop, distributor):
+    # two orders on one variant: 3 + 2 out of 6 in stock
+    variant = make_variant(distributor[0], stock=6)
+    ids = [place_order(shop, [{"variant_id": variant, "quantity": n}]).get_json()["order_id"] for n in (3, 2)]
+    return variant, ids
+
+
+def bulk(api, headers, order_ids, status):
+    return api.put("/distributor/update_status", json={"order_ids": order_ids, "status": status}, headers=headers)
+
+
+def statuses(sql, order_ids):
+    rows = sql("SELECT order_id, status FROM Orders WHERE order_id = ANY(%s)", (order_ids,))
+    return {row["order_id"]: row["status"] for row in rows}
+
+
+def test_bulk_update_moves_every_order(api, sql, orders, distributor):
+    _, ids = orders
+    response = bulk(api, distributor[1], ids + [ids[0]], "Out for Delivery")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["updated"] == 2
+    assert body["results"] == [{"order_id": oid, "ok": True, "status": "Out for Delivery"} for oid in ids]
+    assert statuses(sql, ids) == dict.fromkeys(ids, "Out for Delivery")
+    # the distributor's list reads Distributor_Orders, which moved with them
+    listed = api.get(f"/distributor/orders/{distributor[0]}", headers=distributor[1]).get_json()
+    assert {row["order_id"]: row["status"] for row in listed} == dict.fromkeys(ids, "Out for Delivery")
+
+
+def test_other_distributors_and_unknown_orders_are_reported_per_row(api, sql, orders, make_user, auth_headers):
+    _, ids = orders
+    stranger = make_user("distributor")
+    missing = 2 ** 31 - 1
+    body = bulk(api, auth_headers(stranger, "distributor"), [ids[0], missing], "accepted").get_json()
+    assert body["updated"] == 0
+    assert body["results"] == [
+        {"order_id": ids[0], "ok": False, "error": "Not allowed for this user"},
+        {"order_id": missing, "ok": False, "error": "Order not found"},
+    ]
+    assert statuses(sql, ids) == dict.fromkeys(ids, "Pending")
+
+
+def test_declining_a_batch_releases_its_stock(api, orders, stock, distributor):
+    variant, ids = orders
+    assert bulk(api, distributor[1], ids, "declined").status_code == 200
+    assert stock(variant) == 6
+    assert bulk(api, distributor[1], ids, "accepted").status_code == 200
+    assert stock(variant) == 1
+
+
+def test_batch_that_cannot_take_its_stock_changes_nothing(api, sql, orders, place_order, stock, shop, distributor):
+    variant, ids = orders
+    bulk(api, distributor[1], ids, "declined")
+    place_order(shop, [{"variant_id": variant, "quantity": 4}])
+
+    response = bulk(api, distributor[1], ids, "accepted")
+    assert response.status_code == 409
+    assert response.get_json()["short_items"] == [{"variant_id": variant, "requested": 5, "available": 2}]
+    assert stock(variant) == 2
+    assert statuses(sql, ids) == dict.fromkeys(ids, "Declined")
+
+
+@pytest.mark.parametrize("body", [
+    {"order_ids": [1]},
+    {"order_ids": [1], "status": "lost"},
+    {"order_ids": [], "status": "accepted"},
+    {"order_ids": "1,2", "status": "accepted"},
+    {"order_ids": list(range(1, 502)), "status": "accepted"},
+    {"order_ids": [1.5], "status": "accepted"},
+    {"order_ids": [True], "status": "accepted"},
+    {"order_ids": ["seven"], "status": "accepted"},
+    {"order_ids": [None], "status": "accepted"},
+    {"order_ids": [[1]], "status": "accepted"},
+    {"order_ids": [2 ** 31], "status": "accepted"},
+])
+def test_bad_requests_are_400(api, distributor, body):
+    assert api.put("/distributor/update_status", json=body, headers=distributor[1]).status_code == 400
+
+
+def test_numeric_strings_and_whole_floats_are_accepted(api, orders, distributor):
+    _, ids = orders
+    body = bulk(api, distributor[1], [str(ids[0]), float(ids[1])], "accepted").get_json()
+    assert body["updated"] == 2
+
+
+def test_shop_owners_cannot_update_status(api, orders, shop):
+    _, ids = orders
+    assert bulk(api, shop[1], ids, "accepted").status_code == 403
@@ -0,0 +1,14 @@
+import pytest
+
+from app import _int_field
+
+
+@pytest.mark.parametrize("value, expected", [(5, 5), ("5", 5), (5.0, 5), (-3, -3)])
+def test_int_field_accepts(value, expected):
+    assert _int_field(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "five", 1.5, True, [1], {"a": 1}, 2 ** 31, "99999999999"])
+def test_int_field_rejects(value):
+    with pytest.raises(ValueError):
+        _int_field(value)
@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app as freshcart
+from app import decode_cursor, encode_cursor, history_page_query, page_limit
+
+
+def _token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def test_cursor_round_trip():
+    values = ["Fruits", "Apple", "Regular", "", 42]
+    token = encode_cursor(values)
+    assert "=" not in token
+    assert decode_cursor(token, (str, str, str, str, int)) == values
+
+
+@pytest.mark.parametrize("token", [
+    "not base64!",
+    _token("not a list"),
+    _token(["Fruits", "Apple", "Regular", "", 42, 1]),
+    _token(["Fruits", "Apple", "Regular", None, 42]),
+    _token(["Fruits", "Apple", "Regular", "", "42"]),
+    _token(["Fruits", "Apple", "Regular", "", True]),
+    _token([1, 2, 3, 4, 5]),
+])
+def test_bad_catalog_cursors_are_value_errors(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, (str, str, str, str, int))
+
+
+def test_history_cursor_becomes_keyset_params():
+    before = encode_cursor(["2026-03-01T10:00:00", 9])
+    sql, params, limit = history_page_query(freshcart.ORDERS_SQL, freshcart.ORDERS_PAGE_COLUMNS, (5,),
+                                            MultiDict({"before": before, "limit": "10"}))
+    assert params == [5, datetime(2026, 3, 1, 10), 9, 11]
+    assert limit == 10
+    assert "(order_date, order_id) < (%s, %s)" in sql
+
+
+@pytest.mark.parametrize("values", [["2026-03-01", "9"], ["yesterday", 9], [{"a": 1}, 9], [9, 9]])
+def test_bad_history_cursors_are_value_errors(values):
+    with pytest.raises(ValueError):
+        history_page_query(freshcart.ORDERS_SQL, freshcart.ORDERS_PAGE_COLUMNS, (5,),
+                           MultiDict({"before": _token(values)}))
+
+
+def test_status_filter_uses_stored_names():
+    sql, params, _ = history_page_query(freshcart.ORDERS_SQL, freshcart.ORDERS_PAGE_COLUMNS, (5,),
+                                        MultiDict({"status": "out for delivery,PENDING"}))
+    assert params[1] == ["Out for Delivery", "Pending"]
+
+
+def test_page_limit():
+    assert page_limit({}) == freshcart.DEFAULT_PAGE_SIZE
+    assert page_limit({"limit": "5"}) == 5
+    assert page_limit({"limit": "100000"}) == freshcart.MAX_PAGE_SIZE
+    for bad in ("0", "-1", "ten"):
+        with pytest.raises(ValueError):
+            page_limit({"limit": bad})
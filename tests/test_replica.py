@@ -0,0 +1,31 @@
+import pytest
+
+import app as freshcart
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(freshcart, "DATABASE_READ_URL", "postgresql://replica/freshcart")
+    app = freshcart.create_app()
+    app.add_url_rule("/write", "write", lambda: "ok", methods=["POST"])
+    return app.test_client()
+
+
+def wrote_cookie(response):
+    return next(h for h in response.headers.getlist("Set-Cookie") if h.startswith(f"{freshcart.WROTE_COOKIE}="))
+
+
+def test_write_cookie_is_cross_site_behind_the_tls_proxy(client):
+    cookie = wrote_cookie(client.post("/write", headers={"X-Forwarded-Proto": "https"}))
+    assert "Secure" in cookie
+    assert "SameSite=None" in cookie
+
+
+def test_write_cookie_over_plain_http_is_lax(client):
+    cookie = wrote_cookie(client.post("/write"))
+    assert "Secure" not in cookie
+    assert "SameSite=Lax" in cookie
+
+
+def test_failed_writes_set_no_cookie(client):
+    assert client.post("/nowhere").headers.getlist("Set-Cookie") == []
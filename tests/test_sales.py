@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+import pytest
+
+from migrations import SALES_STATUSES
+
+RECOMPUTED_SQL = f"""
+    SELECT oi.variant_id, SUM(oi.price * oi.quantity) AS revenue, SUM(oi.quantity) AS units,
+           COUNT(*) AS order_lines
+    FROM Orders o
+    JOIN Order_Items oi ON oi.order_id = o.order_id
+    JOIN Product_Variants v ON v.variant_id = oi.variant_id
+    WHERE v.distributor_id = %s AND o.status IN {SALES_STATUSES}
+    GROUP BY oi.variant_id
+    ORDER BY oi.variant_id
+"""
+
+ROLLUP_SQL = """
+    SELECT variant_id, SUM(revenue) AS revenue, SUM(units) AS units, SUM(order_lines) AS order_lines
+    FROM Distributor_Daily_Sales
+    WHERE distributor_id = %s
+    GROUP BY variant_id
+    HAVING SUM(order_lines) <> 0
+    ORDER BY variant_id
+"""
+
+
+@pytest.fixture
+def sales(api, make_variant, place_order, shop, distributor):
+    user_id, headers = distributor
+    apples, pears = make_variant(user_id, stock=100, price=2), make_variant(user_id, stock=100, price=5)
+    orders = [place_order(shop, cart).get_json()["order_id"] for cart in (
+        [{"variant_id": apples, "quantity": 3}, {"variant_id": pears, "quantity": 1}],
+        [{"variant_id": apples, "quantity": 2}],
+    )]
+
+    def move(order_id, status):
+        response = api.put(f"/distributor/update_status/{order_id}", json={"status": status}, headers=headers)
+        assert response.status_code == 200
+
+    def totals():
+        # (revenue, units, order lines); revenue comes back as a decimal string
+        body = api.get(f"/distributor/analytics/{user_id}", headers=headers).get_json()["totals"]
+        return Decimal(body["revenue"]), body["units"], body["order_lines"]
+
+    return orders, move, totals
+
+
+def test_only_accepted_orders_count(sales):
+    (first, second), move, totals = sales
+    assert totals() == (0, 0, 0)
+    move(first, "accepted")
+    assert totals() == (11, 4, 2)
+    move(second, "accepted")
+    assert totals() == (15, 6, 3)
+
+
+def test_moving_through_delivery_counts_once(sales):
+    (first, _), move, totals = sales
+    for status in ("accepted", "shipped", "out for delivery", "delivered"):
+        move(first, status)
+        assert totals() == (11, 4, 2)
+
+
+def test_declined_and_deleted_orders_drop_out(api, sales, distributor):
+    (first, second), move, totals = sales
+    move(first, "accepted")
+    move(second, "out for delivery")
+    move(first, "declined")
+    assert totals() == (4, 2, 1)
+    api.put(f"/distributor/delete_order/{second}", headers=distributor[1])
+    assert totals()[2] == 0
+    move(first, "accepted")
+    assert totals() == (11, 4, 2)
+
+
+def test_rollup_matches_a_recomputation(sql, sales, distributor):
+    (first, second), move, _ = sales
+    for order_id, status in ((first, "accepted"), (second, "shipped"), (first, "declined"),
+                             (second, "out for delivery"), (first, "pending"), (first, "delivered")):
+        move(order_id, status)
+    assert sql(ROLLUP_SQL, (distributor[0],)) == sql(RECOMPUTED_SQL, (distributor[0],))
+
+
+def test_top_products(api, sales, distributor):
+    (first, second), move, _ = sales
+    move(first, "accepted")
+    move(second, "accepted")
+    body = api.get(f"/distributor/analytics/{distributor[0]}?top=1&granularity=week",
+                   headers=distributor[1]).get_json()
+    assert [(Decimal(row["revenue"]), row["units"]) for row in body["top_products"]] == [(10, 5)]
+    assert len(body["series"]) == 1
+
+
+@pytest.mark.parametrize("query", ["from=yesterday", "from=2026-02-01&to=2026-01-01", "granularity=month",
+                                   "top=-1", "top=ten"])
+def test_bad_analytics_args_are_400(api, distributor, query):
+    response = api.get(f"/distributor/analytics/{distributor[0]}?{query}", headers=distributor[1])
+    assert response.status_code == 400
@@ -0,0 +1,87 @@
+from database import pooled_connection
+from migrations import migrate
+
+
+def test_placing_an_order_reserves_its_stock(sql, make_variant, place_order, stock, shop, distributor):
+    variant = make_variant(distributor[0], stock=10, price=2)
+    response = place_order(shop, [{"variant_id": variant, "quantity": 3}, {"variant_id": variant, "quantity": 1}])
+    assert response.status_code == 201
+    assert response.get_json()["items_total"] == 8
+    assert stock(variant) == 6
+    order_id = response.get_json()["order_id"]
+    assert sql("SELECT stock_reserved FROM Orders WHERE order_id = %s", (order_id,))[0]["stock_reserved"]
+
+
+def test_short_stock_is_409_and_takes_nothing(make_variant, place_order, stock, shop, distributor):
+    plenty, scarce = make_variant(distributor[0], stock=10), make_variant(distributor[0], stock=1)
+    response = place_order(shop, [{"variant_id": plenty, "quantity": 2}, {"variant_id": scarce, "quantity": 2}])
+    assert response.status_code == 409
+    assert response.get_json()["short_items"] == [{"variant_id": scarce, "requested": 2, "available": 1}]
+    assert (stock(plenty), stock(scarce)) == (10, 1)
+
+
+def test_unknown_variant_is_404(make_variant, place_order, stock, shop, distributor):
+    variant = make_variant(distributor[0], stock=10)
+    response = place_order(shop, [{"variant_id": variant}, {"variant_id": 2 ** 31 - 1}])
+    assert response.status_code == 404
+    assert response.get_json()["variant_ids"] == [2 ** 31 - 1]
+    assert stock(variant) == 10
+
+
+def test_delete_releases_and_restore_reserves(api, make_variant, place_order, stock, shop, distributor):
+    variant = make_variant(distributor[0], stock=5)
+    order_id = place_order(shop, [{"variant_id": variant, "quantity": 4}]).get_json()["order_id"]
+    headers = distributor[1]
+
+    assert api.put(f"/distributor/delete_order/{order_id}", headers=headers).status_code == 200
+    assert stock(variant) == 5
+    # deleting twice gives nothing back twice
+    api.put(f"/distributor/delete_order/{order_id}", headers=headers)
+    assert stock(variant) == 5
+
+    assert api.put(f"/distributor/restore_order/{order_id}", headers=headers).status_code == 200
+    assert stock(variant) == 1
+
+
+def test_restore_without_enough_stock_is_409(api, sql, make_variant, place_order, stock, shop, distributor):
+    variant = make_variant(distributor[0], stock=5)
+    order_id = place_order(shop, [{"variant_id": variant, "quantity": 4}]).get_json()["order_id"]
+    api.put(f"/distributor/delete_order/{order_id}", headers=distributor[1])
+    place_order(shop, [{"variant_id": variant, "quantity": 3}])
+
+    assert api.put(f"/distributor/restore_order/{order_id}", headers=distributor[1]).status_code == 409
+    assert stock(variant) == 2
+    assert sql("SELECT status FROM Orders WHERE order_id = %s", (order_id,))[0]["status"] == "Deleted"
+
+
+def test_orders_accepted_before_migration_keep_their_stock(api, sql, make_variant, stock, shop, distributor):
+    # what migration 1 leaves behind: stock already taken by the old accept
+    # path, but stock_reserved FALSE
+    variant = make_variant(distributor[0], stock=6)
+    order_id = sql("""
+        INSERT INTO Orders (user_id, status, payment_status, total_amount)
+        VALUES (%s, 'Accepted', 'Unpaid', 40) RETURNING order_id
+    """, (shop[0],))[0]["order_id"]
+    sql("INSERT INTO Order_Items (order_id, variant_id, quantity, price) VALUES (%s, %s, 4, 10)",
+        (order_id, variant))
+    sql("SELECT refresh_order_summaries(%s::int[])", ([order_id],))
+    sql("DELETE FROM schema_migrations WHERE version = 10")
+    with pooled_connection() as conn:
+        assert migrate(conn) == [10]
+
+    response = api.put(f"/distributor/update_status/{order_id}", json={"status": "shipped"},
+                       headers=distributor[1])
+    assert response.status_code == 200
+    assert stock(variant) == 6
+
+
+def test_retried_order_reserves_once(api, make_variant, stock, shop, distributor):
+    variant = make_variant(distributor[0], stock=5)
+    user_id, headers = shop
+    headers = dict(headers, **{"Idempotency-Key": f"order-{variant}"})
+    body = {"user_id": user_id, "cart": [{"variant_id": variant, "quantity": 2}]}
+    first = api.post("/place_order", json=body, headers=headers)
+    retry = api.post("/place_order", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json()["order_id"] == first.get_json()["order_id"]
+    assert stock(variant) == 3
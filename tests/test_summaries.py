@@ -0,0 +1,72 @@
+import pytest
+
+
+@pytest.fixture
+def order(sql, make_user, make_variant, place_order, shop, auth_headers):
+    # one order holding variants of two distributors
+    first, second = make_user("distributor"), make_user("distributor")
+    cart = [{"variant_id": make_variant(first, stock=5, price=3), "quantity": 2},
+            {"variant_id": make_variant(second, stock=5, price=4), "quantity": 1}]
+    order_id = place_order(shop, cart).get_json()["order_id"]
+    return order_id, [(user_id, auth_headers(user_id, "distributor")) for user_id in (first, second)]
+
+
+def summary(sql, order_id):
+    rows = sql("SELECT * FROM Order_Summaries WHERE order_id = %s", (order_id,))
+    return rows[0] if rows else None
+
+
+def listed_ids(api, path, headers):
+    return [row["order_id"] for row in api.get(path, headers=headers).get_json()]
+
+
+def test_placed_order_is_summarized_for_every_party(api, sql, order, shop):
+    order_id, distributors = order
+    row = summary(sql, order_id)
+    assert (row["user_id"], row["status"], row["item_count"], row["total_amount"]) == (shop[0], "Pending", 2, 10)
+    assert sorted(row["distributor_ids"]) == sorted(user_id for user_id, _ in distributors)
+
+    orders = api.get(f"/orders/{shop[0]}", headers=shop[1]).get_json()
+    assert [(o["order_id"], o["payment_state"]) for o in orders] == [(order_id, "Pending")]
+    for user_id, headers in distributors:
+        assert listed_ids(api, f"/distributor/orders/{user_id}", headers) == [order_id]
+        assert orders[0]["distributor_name"].count(",") == 1
+
+
+def test_writes_refresh_the_summaries(api, sql, order, shop):
+    order_id, ((user_id, headers), _) = order
+    api.put(f"/distributor/update_status/{order_id}", json={"status": "accepted"}, headers=headers)
+    payment_id = sql("SELECT payment_id FROM Payments WHERE order_id = %s", (order_id,))[0]["payment_id"]
+    api.put(f"/distributor/update_payment/{payment_id}", json={"status": "paid"}, headers=headers)
+
+    row = summary(sql, order_id)
+    assert (row["status"], row["payment_status"], row["payment_state"]) == ("Accepted", "Paid", "Paid")
+    assert sql("SELECT status FROM Distributor_Orders WHERE order_id = %s", (order_id,)) == [
+        {"status": "Accepted"}, {"status": "Accepted"}]
+    assert api.get(f"/payments/{shop[0]}", headers=shop[1]).get_json()[0]["order_status"] == "Accepted"
+
+
+def test_refresh_matches_a_rebuild(sql, order):
+    order_id, ((user_id, headers), _) = order
+    # a line moved off the first distributor: they lose the order
+    sql("DELETE FROM Order_Items WHERE order_id = %s AND variant_id IN "
+        "(SELECT variant_id FROM Product_Variants WHERE distributor_id = %s)", (order_id, user_id))
+    sql("SELECT refresh_order_summaries(%s::int[])", ([order_id],))
+    refreshed = summary(sql, order_id)
+    assert sql("SELECT COUNT(*) AS n FROM Distributor_Orders WHERE order_id = %s AND distributor_id = %s",
+               (order_id, user_id))[0]["n"] == 0
+
+    sql("DELETE FROM Distributor_Orders WHERE order_id = %s", (order_id,))
+    sql("DELETE FROM Order_Summaries WHERE order_id = %s", (order_id,))
+    sql("SELECT refresh_order_summaries(%s::int[])", ([order_id],))
+    assert summary(sql, order_id) == refreshed
+    assert refreshed["item_count"] == 1
+
+
+def test_deleted_orders_leave_the_active_list(api, order):
+    order_id, ((user_id, headers), _) = order
+    api.put(f"/distributor/delete_order/{order_id}", headers=headers)
+    deleted = api.get(f"/distributor/deleted_orders/{user_id}", headers=headers).get_json()
+    assert [row["order_id"] for row in deleted] == [order_id]
+    active = api.get(f"/distributor/orders/{user_id}?status=pending,accepted", headers=headers).get_json()
+    assert active["items"] == []